@@ -0,0 +1,86 @@
+"""
+Shared setup for the benchmark scripts
+Run them from the project root, e.g. python benchmarks/compression.py
+"""
+import os
+import random
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORDS = (
+    'review report budget meeting client design draft email call plan update '
+    'fix deploy test write read prepare send order book clean check team weekly '
+    'project notes invoice slides research feedback release backup schedule'
+).split()
+
+
+def setup_django():
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_management.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Throwaway migrated database, the same way the test runner makes one"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def fake_tasks(count, user, seed=1):
+    """Unsaved Task objects that look like real ones (no database needed)"""
+    from tasks.models import Task
+
+    rng = random.Random(seed)
+    now = datetime(2025, 8, 24, 13, 0, tzinfo=timezone.utc)
+    tasks = []
+    for i in range(count):
+        completed = rng.random() < 0.4
+        tasks.append(Task(
+            id=i + 1,
+            user=user,
+            title=f'{sentence(rng, 4)} {i}',
+            description=sentence(rng, rng.randint(0, 40)),
+            due_date=date(2025, 9, 1) + timedelta(days=rng.randint(0, 90)),
+            priority=rng.choice(['low', 'medium', 'high']),
+            status='completed' if completed else 'pending',
+            created_at=now - timedelta(hours=rng.randint(1, 2000)),
+            updated_at=now,
+            completed_at=now if completed else None,
+        ))
+        # as if prefetched - the tags field would query the database otherwise
+        tasks[-1]._prefetched_objects_cache = {'tags': []}
+    return tasks
+
+
+def fake_user():
+    from django.contrib.auth.models import User
+    return User(id=1, username='benchuser', email='bench@example.com',
+                first_name='Bench', last_name='User',
+                date_joined=datetime(2025, 1, 1, tzinfo=timezone.utc))
+
+
+def report(rows, headers):
+    """Print a plain text table"""
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    line = '  '.join(f'{{:>{width}}}' for width in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
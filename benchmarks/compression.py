@@ -0,0 +1,50 @@
+"""
+Bytes on the wire and CPU cost of compressing task list pages
+    python benchmarks/compression.py
+"""
+import time
+
+from common import fake_tasks, fake_user, report, setup_django
+
+setup_django()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from tasks import middleware  # noqa: E402
+from tasks.serializers import TaskSerializer  # noqa: E402
+
+PAGE_SIZES = [20, 100, 1000]
+REPEAT = 50
+
+
+def page_body(size):
+    tasks = fake_tasks(size, fake_user())
+    data = {'count': size, 'next': None, 'previous': None,
+            'results': TaskSerializer(tasks, many=True).data}
+    return JSONRenderer().render(data)
+
+
+def cpu_per_call(func, body):
+    started = time.process_time()
+    for _ in range(REPEAT):
+        func(body)
+    return (time.process_time() - started) / REPEAT * 1000
+
+
+def main():
+    encodings = ['gzip'] + (['br'] if middleware.brotli is not None else [])
+    rows = []
+    for size in PAGE_SIZES:
+        body = page_body(size)
+        for encoding in encodings:
+            compressed = middleware.compress_body(encoding, body)
+            ms = cpu_per_call(lambda data: middleware.compress_body(encoding, data), body)
+            rows.append([size, encoding, len(body), len(compressed),
+                         f'{len(compressed) / len(body):.1%}', f'{ms:.3f}'])
+    report(rows, ['tasks/page', 'encoding', 'raw bytes', 'wire bytes', 'ratio', 'cpu ms/page'])
+    if middleware.brotli is None:
+        print('(brotli not installed - only gzip measured)')
+
+
+if __name__ == '__main__':
+    main()
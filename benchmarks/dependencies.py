@@ -0,0 +1,144 @@
+"""
+How the dependency graph holds up with many edges
+
+Builds a throwaway database with --tasks tasks in projects of
+--project-size, joined by --edges random "blocked by" edges (always on an
+older task of the same project, so there are no loops). Then times the
+loop check for new edges against loading the whole graph, adding an edge
+(check + relevel), the ready=true filter and a sort_by=topological page.
+
+    python benchmarks/dependencies.py --tasks 20000 --edges 30000
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import date
+
+from common import fake_user, report, sentence, setup_django, test_database
+
+
+def build(tasks, edges, project_size, seed=1):
+    """
+    Tasks in projects of project_size, each blocked by a few earlier tasks
+    of its own project - like real "do this first" chains
+    """
+    from tasks.models import Task, TaskDependency
+
+    rng = random.Random(seed)
+    user = fake_user()
+    user.save()
+    Task.objects.bulk_create(
+        [Task(user=user, title=f'{sentence(rng, 3)} {i}', due_date=date(2025, 9, 1),
+              status='completed' if rng.random() < 0.3 else 'pending') for i in range(tasks)],
+        batch_size=5000,
+    )
+    ids = list(Task.objects.order_by('id').values_list('id', flat=True))
+    pairs = set()
+    while len(pairs) < edges:
+        later = rng.randrange(len(ids))
+        first = later - later % project_size
+        if later == first:
+            continue
+        pairs.add((ids[later], ids[rng.randrange(max(first, later - 10), later)]))
+    TaskDependency.objects.bulk_create(
+        [TaskDependency(user=user, task_id=task_id, depends_on_id=depends_on_id) for task_id, depends_on_id in pairs],
+        batch_size=5000,
+    )
+    # bulk inserts skip add_dependency, work the levels out in one pass (ids are in order)
+    level = defaultdict(int)
+    for task_id, depends_on_id in sorted(pairs):
+        level[task_id] = max(level[task_id], level[depends_on_id] + 1)
+    Task.objects.bulk_update(
+        [Task(id=task_id, dependency_level=value) for task_id, value in level.items()],
+        ['dependency_level'], batch_size=5000,
+    )
+    return user, ids
+
+
+def whole_graph_check(user, task_id, depends_on_id):
+    """The loop check done the obvious way - load every edge, then search"""
+    from tasks.models import TaskDependency
+
+    blockers = defaultdict(list)
+    for edge_task, edge_blocker in TaskDependency.objects.filter(user=user).values_list('task_id', 'depends_on_id'):
+        blockers[edge_task].append(edge_blocker)
+    stack, seen = [depends_on_id], {depends_on_id}
+    while stack:
+        current = stack.pop()
+        if current == task_id:
+            return True
+        for blocker in blockers[current]:
+            if blocker not in seen:
+                seen.add(blocker)
+                stack.append(blocker)
+    return False
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=30000)
+    parser.add_argument('--project-size', type=int, default=50)
+    parser.add_argument('--checks', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from tasks import dependencies
+    from tasks.models import Task
+
+    with test_database():
+        start = time.perf_counter()
+        user, ids = build(args.tasks, args.edges, args.project_size)
+        print(f'built {args.tasks} tasks, {args.edges} edges in {time.perf_counter() - start:.1f}s\n')
+
+        rng = random.Random(2)
+        tasks = Task.objects.filter(user=user)
+        rows = []
+        # edges inside one project: newer -> older never loops, older -> newer may
+        for label, forward in (('newer on older', True), ('older on newer', False)):
+            fast_total = slow_total = add_total = loops = 0
+            for _ in range(args.checks):
+                first = rng.randrange(0, len(ids) - args.project_size, args.project_size)
+                a, b = sorted(rng.sample(range(first, first + args.project_size), 2))
+                task_id, depends_on_id = (ids[b], ids[a]) if forward else (ids[a], ids[b])
+                found, fast = timed(lambda: dependencies.creates_cycle(connection.alias, task_id, depends_on_id), 1)
+                expected, slow = timed(lambda: whole_graph_check(user, task_id, depends_on_id), 1)
+                assert found == expected, (task_id, depends_on_id)
+                fast_total += fast
+                slow_total += slow
+                loops += found
+                if not found:
+                    task, depends_on = tasks.get(id=task_id), tasks.get(id=depends_on_id)
+                    _, add = timed(lambda: dependencies.add_dependency(task, depends_on), 1)
+                    add_total += add
+                    dependencies.remove_dependency(user, task_id, depends_on_id)
+            added = args.checks - loops
+            rows.append((label, f'{loops}/{args.checks}', f'{fast_total / args.checks:.2f}',
+                         f'{slow_total / args.checks:.1f}', f'{add_total / added:.2f}' if added else '-'))
+        report(rows, ['edge', 'loops', 'reachable walk ms', 'whole graph ms', 'add + relevel ms'])
+        print()
+
+        count, ready_ms = timed(lambda: dependencies.ready(tasks).count(), args.repeat)
+        _, page_ms = timed(lambda: list(tasks.order_by('dependency_level', 'due_date')[:20]), args.repeat)
+        deepest = tasks.order_by('-dependency_level').values_list('dependency_level', flat=True).first()
+        report([
+            ('ready=true count', f'{ready_ms:.1f}', f'{count} ready'),
+            ('topological page', f'{page_ms:.1f}', f'first 20 of {deepest + 1} levels'),
+        ], ['query', 'ms', 'notes'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Micro-benchmarks for the CPU-bound pieces, compared against stored baselines
+
+    python benchmarks/micro.py                  # compare with baselines.json
+    python benchmarks/micro.py --save           # record new baselines
+    python benchmarks/micro.py --only serialize --tolerance 0.1
+
+Every case is timed a few times and the best run counts (CPU time, no
+garbage collection). Timings are
+scaled by a fixed pure-Python workload measured next to them (and stored
+with the baselines), so a faster or slower machine doesn't show up as a
+change. Exits with status 1 when a case got slower than the tolerance.
+Re-save the baselines in the same commit as an intended slowdown.
+"""
+import argparse
+import gc
+import itertools
+import json
+import platform
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from common import fake_tasks, fake_user, report, setup_django, test_database
+
+BASELINES = Path(__file__).resolve().parent / 'baselines.json'
+
+
+def best_time(function, repeat):
+    """
+    Best of `repeat` runs after an untimed warm-up run, in milliseconds
+    CPU time of this process with the garbage collector off (like timeit),
+    so other load on the machine and collection pauses don't add noise
+    """
+    function()
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.process_time()
+            function()
+            elapsed = time.process_time() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def calibration():
+    """A fixed mix of dict, string and arithmetic work"""
+    total = 0
+    for i in range(200000):
+        row = {'id': i, 'title': f'task {i}'}
+        total += len(row['title']) + i % 7
+    return total
+
+
+# --- cases - each returns a function doing one timed run -------------------
+
+def task_serializer(user):
+    from django.test import override_settings
+    from tasks.serializers import TaskSerializer
+
+    tasks = fake_tasks(10000, user)
+
+    def run():
+        with override_settings(TASK_REPRESENTATION_CACHE_SIZE=0):
+            return TaskSerializer(tasks, many=True).data
+    return run
+
+
+def task_serializer_cached(user):
+    """Every task already in the representation cache (the untimed first run fills it)"""
+    from tasks.serializers import TaskSerializer
+
+    tasks = fake_tasks(10000, user)
+    return lambda: TaskSerializer(tasks, many=True).data
+
+
+def task_serializer_cold_cache(user):
+    """Nothing cached yet - the cost of filling the cache on top of serializing"""
+    from tasks.representations import cache
+    from tasks.serializers import TaskSerializer
+
+    tasks = fake_tasks(10000, user)
+
+    def run():
+        cache.clear()
+        return TaskSerializer(tasks, many=True).data
+    return run
+
+
+def task_serializer_sparse(user):
+    from tasks.serializers import TaskSerializer
+
+    tasks = fake_tasks(10000, user)
+    fields = ['id', 'title', 'status', 'due_date']
+    return lambda: TaskSerializer(tasks, many=True, fields=fields).data
+
+
+def category_serializer(user):
+    from tasks.models import Category
+    from tasks.serializers import CategorySerializer
+
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    categories = [Category(id=i + 1, user=user, name=f'Category {i}', created_at=created) for i in range(10000)]
+    return lambda: CategorySerializer(categories, many=True).data
+
+
+def task_create_validation(user):
+    from tasks.serializers import TaskCreateSerializer
+
+    due = str(date.today() + timedelta(days=7))
+    rows = [
+        {'title': f'Write report {i}', 'description': 'Quarterly numbers', 'due_date': due,
+         'priority': ['low', 'medium', 'high'][i % 3], 'tags': ['work', 'urgent']}
+        for i in range(1000)
+    ]
+
+    def run():
+        for row in rows:
+            serializer = TaskCreateSerializer(data=row)
+            serializer.is_valid(raise_exception=True)
+    return run
+
+
+# query string options for the task list, every combination of up to
+# LIST_COMBINED of them is built (all 2 ** 11 would take a minute a run)
+LIST_FILTERS = {
+    'status': 'pending',
+    'priority': 'high',
+    'search': 'report',
+    'due_date': str(date(2025, 9, 1)),
+    'overdue': 'true',
+    'tags': 'work,urgent',
+    'ready': 'true',
+    'project': '1',
+    'category': '1',
+    'archived': 'true',
+    'fields': 'id,title,status',
+}
+LIST_SORTS = [None, 'due_date', 'priority', 'topological', 'manual']
+LIST_COMBINED = 3
+
+
+def filter_combinations():
+    for count in range(LIST_COMBINED + 1):
+        for names in itertools.combinations(LIST_FILTERS, count):
+            yield {name: LIST_FILTERS[name] for name in names}
+
+
+def list_query_building(user):
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from tasks.api_views import TaskListCreateView
+
+    factory = APIRequestFactory()
+    views = []
+    for params in filter_combinations():
+        for sort_by in LIST_SORTS:
+            query = dict(params, sort_by=sort_by) if sort_by else params
+            django_request = factory.get('/api/tasks/', query)
+            force_authenticate(django_request, user=user)
+            view = TaskListCreateView()
+            view.setup(django_request)
+            view.request = Request(django_request)
+            view.request.user = user
+            view.format_kwarg = None
+            views.append(view)
+
+    def run():
+        for view in views:
+            # build and compile the SQL, without running it - archived=true lists are a UNION
+            queryset = view.archive_union() if view.include_archived() else view.get_queryset()
+            str(queryset.query)
+    return run
+
+
+def is_overdue(user):
+    tasks = fake_tasks(10000, user)
+    return lambda: [task.is_overdue() for task in tasks]
+
+
+CASES = {
+    'serialize_tasks_10k': (task_serializer, 'TaskSerializer, 10k tasks, representation cache off'),
+    'serialize_tasks_10k_cached': (task_serializer_cached, 'TaskSerializer, 10k tasks, all cached'),
+    'serialize_tasks_10k_cold_cache': (task_serializer_cold_cache, 'TaskSerializer, 10k tasks, none cached yet'),
+    'serialize_tasks_10k_sparse': (task_serializer_sparse, 'TaskSerializer fields=4, 10k tasks'),
+    'serialize_categories_10k': (category_serializer, 'CategorySerializer, 10k categories'),
+    'validate_task_create_1k': (task_create_validation, 'TaskCreateSerializer.is_valid, 1k rows'),
+    'build_list_queries': (
+        list_query_building,
+        f'get_queryset + SQL, {len(list(filter_combinations())) * len(LIST_SORTS)} filter/sort combinations'
+    ),
+    'is_overdue_10k': (is_overdue, 'Task.is_overdue(), 10k tasks'),
+}
+
+
+def run_cases(names, repeat):
+    from tasks.models import Tag
+
+    user = fake_user()
+    user.save()
+    # the tag filters look these up
+    for name in ('work', 'urgent'):
+        Tag.objects.create(user=user, name=name, task_count=10)
+
+    calibration_ms = best_time(calibration, repeat)
+    results = {}
+    for name in names:
+        build, _ = CASES[name]
+        results[name] = best_time(build(user), repeat)
+    # the machine may have sped up or slowed down while the cases ran
+    calibration_ms = min(calibration_ms, best_time(calibration, repeat))
+    return calibration_ms, results
+
+
+def compare(baselines, calibration_ms, results, tolerance):
+    scale = baselines['calibration_ms'] / calibration_ms
+    rows, slower = [], []
+    for name, ms in results.items():
+        baseline = baselines['cases'].get(name)
+        scaled = ms * scale
+        if baseline is None:
+            rows.append((name, '-', f'{scaled:.2f}', '-', 'new'))
+            continue
+        change = scaled / baseline - 1
+        verdict = 'SLOWER' if change > tolerance else ('faster' if change < -tolerance else 'ok')
+        if verdict == 'SLOWER':
+            slower.append(name)
+        rows.append((name, f'{baseline:.2f}', f'{scaled:.2f}', f'{change:+.1%}', verdict))
+    report(rows, ['case', 'baseline ms', 'now ms', 'change', ''])
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--save', action='store_true', help=f'Write the results to {BASELINES.name}')
+    parser.add_argument('--only', help='Only cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown before a case is flagged (default 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    names = [name for name in CASES if not args.only or args.only in name]
+    setup_django()
+    with test_database():
+        calibration_ms, results = run_cases(names, args.repeat)
+
+    if args.save:
+        baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() and args.only else {'cases': {}}
+        if args.only:
+            # keep the other cases comparable - scale them to this run's machine speed
+            scale = calibration_ms / baselines['calibration_ms']
+            baselines['cases'] = {name: ms * scale for name, ms in baselines['cases'].items()}
+        baselines['calibration_ms'] = calibration_ms
+        baselines['python'] = platform.python_version()
+        baselines['cases'].update(results)
+        baselines['descriptions'] = {name: CASES[name][1] for name in baselines['cases'] if name in CASES}
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        report([(name, f'{ms:.2f}', CASES[name][1]) for name, ms in results.items()], ['case', 'ms', 'what'])
+        print(f'\nsaved to {BASELINES}')
+        return
+
+    if not BASELINES.exists():
+        sys.exit(f'No {BASELINES.name} yet - run with --save first')
+    slower = compare(json.loads(BASELINES.read_text()), calibration_ms, results, args.tolerance)
+    if slower:
+        print(f'\n{len(slower)} case(s) slower than {args.tolerance:.0%}: {", ".join(slower)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
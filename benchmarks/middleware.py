@@ -0,0 +1,128 @@
+"""
+What the API saves by skipping the browser middleware (tasks.middleware.BrowserMiddleware)
+
+Times token-authenticated GET /api/profile/ through the whole Django stack
+with the old flat MIDDLEWARE (sessions, CSRF, auth, messages and
+clickjacking for every request) and with the current one, plus the
+middleware alone around a view that does nothing.
+
+    python benchmarks/middleware.py --requests 2000
+"""
+import argparse
+import time
+
+from common import report, setup_django, test_database
+
+# MIDDLEWARE before BrowserMiddleware
+FLAT_MIDDLEWARE = [
+    'tasks.middleware.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'tasks.middleware.ApiCompressionMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tasks.middleware.ProfilingMiddleware',
+]
+
+
+def per_request_us(function, requests, repeat=3):
+    """Best of `repeat` rounds, CPU microseconds per request"""
+    function()
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(requests):
+            function()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / requests * 1e6
+
+
+def full_request(middleware, token, cookie):
+    """One GET /api/profile/ through the test client with this MIDDLEWARE"""
+    from django.test import Client, override_settings
+
+    with override_settings(MIDDLEWARE=middleware):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        if cookie:
+            # browsers send the site's cookies to the API too
+            client.cookies['sessionid'] = 'x' * 32
+            client.cookies['csrftoken'] = 'x' * 32
+
+        def run():
+            response = client.get('/api/profile/')
+            assert response.status_code == 200, response.status_code
+        run()  # loads the middleware
+    return run
+
+
+def chain_only(paths, path):
+    """Just the middleware in `paths`, chained like Django does, around an empty view"""
+    from django.core.handlers.exception import convert_exception_to_response
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.utils.module_loading import import_string
+    from django.views.decorators.csrf import csrf_exempt
+
+    view = csrf_exempt(lambda request: HttpResponse('{}'))
+    hooks = []
+
+    def call_view(request):
+        for hook in hooks:
+            response = hook(request, view, (), {})
+            if response is not None:
+                return response
+        return view(request)
+
+    handler = call_view
+    for middleware_path in reversed(paths):
+        middleware = import_string(middleware_path)(handler)
+        if hasattr(middleware, 'process_view'):
+            hooks.insert(0, middleware.process_view)
+        handler = convert_exception_to_response(middleware)
+
+    factory = RequestFactory()
+    return lambda: handler(factory.get(path, HTTP_AUTHORIZATION='Token x'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    with test_database():
+        user = User.objects.create_user(username='benchuser', password='benchpass123')
+        token = Token.objects.create(user=user).key
+
+        rows = []
+        for label, cookie in (('token only', False), ('token + site cookies', True)):
+            before = per_request_us(full_request(FLAT_MIDDLEWARE, token, cookie), args.requests)
+            after = per_request_us(full_request(settings.MIDDLEWARE, token, cookie), args.requests)
+            rows.append((f'GET /api/profile/, {label}', f'{before:.0f}', f'{after:.0f}',
+                         f'{before - after:.0f}', f'{1 - after / before:.1%}'))
+
+        browser = settings.BROWSER_MIDDLEWARE
+        before = per_request_us(chain_only(browser, '/api/tasks/'), args.requests * 5)
+        after = per_request_us(chain_only(['tasks.middleware.BrowserMiddleware'], '/api/tasks/'), args.requests * 5)
+        rows.append(('browser middleware alone, /api/', f'{before:.0f}', f'{after:.0f}',
+                     f'{before - after:.0f}', f'{1 - after / before:.1%}'))
+        # pages pay for one more function call, not much else
+        before = per_request_us(chain_only(browser, '/tasks/'), args.requests * 5)
+        after = per_request_us(chain_only(['tasks.middleware.BrowserMiddleware'], '/tasks/'), args.requests * 5)
+        rows.append(('browser middleware alone, pages', f'{before:.0f}', f'{after:.0f}',
+                     f'{before - after:.0f}', f'{1 - after / before:.1%}'))
+
+    report(rows, ['request', 'flat us', 'lean us', 'saved us', 'saved'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Listing shared project tasks with large teams
+
+Builds a throwaway database with one big team project (--tasks tasks,
+--members members), --other-teams more projects of the same size team so
+the membership table is large, and a user with --tasks tasks of their own.
+Then times a first page + count of the task list for that user and for a
+team member (access as a join in the query), with a cold and a warm
+membership cache, against loading every candidate row and checking it in
+Python like a per-object permission would.
+
+    python benchmarks/projects.py --tasks 20000 --members 2000 --other-teams 20
+"""
+import argparse
+import time
+from datetime import date
+
+from common import report, sentence, setup_django, test_database
+
+
+def build(tasks, members, other_teams):
+    import random
+
+    from django.contrib.auth.models import User
+    from tasks.models import Project, ProjectMembership, Task
+
+    rng = random.Random(1)
+    User.objects.bulk_create([User(username=f'member{i}') for i in range(members)], batch_size=5000)
+    member_ids = list(User.objects.filter(username__startswith='member').values_list('id', flat=True))
+    solo = User.objects.create(username='solo')
+    owners = [User.objects.create(username=f'owner{i}') for i in range(other_teams + 1)]
+
+    project_ids = []
+    for owner in owners:
+        project = Project.objects.create(user=owner, name='Team project')
+        project_ids.append(project.id)
+        # everyone is in the big project, the other teams are random halves
+        team = member_ids if owner is owners[0] else rng.sample(member_ids, len(member_ids) // 2)
+        ProjectMembership.objects.bulk_create(
+            [ProjectMembership(user=owner, project=project, member_id=member_id,
+                               role='edit' if i % 4 == 0 else 'read') for i, member_id in enumerate(team)],
+            batch_size=5000,
+        )
+
+    due = date(2025, 9, 1)
+    for user, project_id in ((owners[0], project_ids[0]), (solo, None)):
+        Task.objects.bulk_create(
+            [Task(user=user, title=f'{sentence(rng, 3)} {i}', due_date=due, project_id=project_id)
+             for i in range(tasks)],
+            batch_size=5000,
+        )
+    return solo, User.objects.get(id=member_ids[len(member_ids) // 2])
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def first_page(queryset):
+    return queryset.count(), list(queryset.order_by('-created_at').values('id', 'title')[:20])
+
+
+def per_object_page(user):
+    """Load every task the user might see, keep those a permission check allows"""
+    from tasks.models import ProjectMembership, Task
+
+    visible = []
+    member_of = set(ProjectMembership.objects.filter(member=user).values_list('project_id', flat=True))
+    for task in Task.objects.order_by('-created_at'):
+        if task.user_id == user.id or task.project_id in member_of:
+            visible.append(task)
+    return len(visible), [{'id': task.id, 'title': task.title} for task in visible[:20]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--other-teams', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from tasks import projects
+    from tasks.models import ProjectMembership, Task
+
+    with test_database():
+        start = time.perf_counter()
+        solo, member = build(args.tasks, args.members, args.other_teams)
+        memberships = ProjectMembership.objects.count()
+        print(f'built {Task.objects.count()} tasks, {memberships} memberships '
+              f'in {time.perf_counter() - start:.1f}s\n')
+
+        def cold():
+            projects.clear_membership_cache()
+            return first_page(projects.visible_tasks(member))
+
+        (own_count, _), own_ms = timed(lambda: first_page(projects.visible_tasks(solo)), args.repeat)
+        (cold_count, _), cold_ms = timed(cold, args.repeat)
+        (shared_count, shared), warm_ms = timed(lambda: first_page(projects.visible_tasks(member)), args.repeat)
+        (checked_count, checked), python_ms = timed(lambda: per_object_page(member), max(1, args.repeat // 2))
+        assert (shared_count, shared) == (checked_count, checked)
+
+        report([
+            ('own tasks, no memberships', own_count, f'{own_ms:.1f}'),
+            ('team member, cold cache', cold_count, f'{cold_ms:.1f}'),
+            ('team member, warm cache', shared_count, f'{warm_ms:.1f}'),
+            ('per-object check in Python', checked_count, f'{python_ms:.1f}'),
+        ], ['first page + count', 'visible', 'ms'])
+
+        query = projects.visible_tasks(member).order_by('-created_at').values('id', 'title')[:20].query
+        sql, params = query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            print('\nquery plan for the member page:')
+            for row in cursor.fetchall():
+                print('  ' + row[-1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+How the tag filters hold up on large tag sets
+
+Builds a throwaway database with --tasks tasks carrying tags of very
+different sizes, then times the tags=a,b filters (tag_mode=all and any)
+against the obvious JOIN + DISTINCT query they replace.
+
+    python benchmarks/tags.py --tasks 200000
+"""
+import argparse
+import random
+import time
+from datetime import date
+
+from common import fake_user, report, sentence, setup_django, test_database
+
+# tag name -> share of tasks carrying it
+TAG_SIZES = {'common': 0.5, 'half': 0.5, 'tenth': 0.1, 'rare': 0.01}
+
+CASES = [
+    ('all', ['common', 'half']),
+    ('all', ['common', 'rare']),
+    ('all', ['common', 'half', 'tenth']),
+    ('any', ['tenth', 'rare']),
+    ('any', ['common', 'half']),
+]
+
+
+def build(count, seed=1):
+    from tasks.models import Task, Tag, TaskTag
+
+    rng = random.Random(seed)
+    user = fake_user()
+    user.save()
+    Task.objects.bulk_create(
+        [Task(user=user, title=f'{sentence(rng, 3)} {i}', due_date=date(2025, 9, 1)) for i in range(count)],
+        batch_size=5000,
+    )
+    ids = list(Task.objects.values_list('id', flat=True))
+    for name, share in TAG_SIZES.items():
+        tagged = rng.sample(ids, int(len(ids) * share))
+        tag = Tag.objects.create(user=user, name=name, task_count=len(tagged))
+        TaskTag.objects.bulk_create(
+            [TaskTag(user=user, task_id=task_id, tag=tag) for task_id in tagged], batch_size=5000
+        )
+    return user
+
+
+def naive(user, names, mode):
+    """What the filter would be with plain ORM joins"""
+    from tasks.models import Task
+
+    queryset = Task.objects.filter(user=user)
+    if mode == 'any':
+        return queryset.filter(tags__name__in=names).distinct()
+    for name in names:
+        queryset = queryset.filter(tags__name=name)
+    return queryset.distinct()
+
+
+def timed(queryset, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = queryset.count()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from tasks.models import Task
+    from tasks.tags import filter_by_tags
+
+    with test_database():
+        start = time.perf_counter()
+        user = build(args.tasks)
+        print(f'built {args.tasks} tasks in {time.perf_counter() - start:.1f}s\n')
+
+        rows = []
+        for mode, names in CASES:
+            count, fast = timed(filter_by_tags(Task.objects.filter(user=user), user, names, mode), args.repeat)
+            naive_count, slow = timed(naive(user, names, mode), args.repeat)
+            assert count == naive_count, (names, mode, count, naive_count)
+            rows.append((mode, ','.join(names), count, f'{fast:.1f}', f'{slow:.1f}', f'{slow / fast:.1f}x'))
+        report(rows, ['mode', 'tags', 'matches', 'semi-join ms', 'join+distinct ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
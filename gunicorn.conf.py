@@ -0,0 +1,63 @@
+# Gunicorn configuration for the Task Management API
+# gunicorn picks this file up automatically when started from the project root,
+# the Procfile also passes it explicitly so it works from anywhere
+
+import multiprocessing
+import os
+
+
+def available_cores():
+    """Cores this process may actually run on (respects container cpu sets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is linux only
+        return multiprocessing.cpu_count()
+
+
+cores = available_cores()
+
+# Load the Django app once in the master - workers share the memory copy-on-write
+preload_app = True
+
+# Threads help with requests that wait on the database,
+# processes are what actually use the cores
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', cores * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if cores <= 2 else 2))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow memory growth can't pile up
+max_requests = 1000
+max_requests_jitter = 100
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # metrics files from the last run would be added to this run's numbers
+    from tasks import metrics
+    metrics.clear()
+
+
+def child_exit(server, worker):
+    # keep a finished worker's counts in the totals (tasks/metrics.py)
+    from tasks import metrics
+    metrics.merge_dead_process(worker.pid)
+
+
+def when_ready(server):
+    # App is already loaded (preload_app), warm it before any worker is forked
+    from task_management import warmup
+    warmup.warm_app()
+    server.log.info('App warmed: %d workers x %d threads', workers, threads)
+
+
+def post_worker_init(worker):
+    # Each worker opens its own DB connection before accepting traffic
+    from task_management import warmup
+    warmup.warm_db_connections()
@@ -1,5 +1,6 @@
 # Basic Django settings 
 import os
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,16 +34,31 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first - times everything below it
+    'tasks.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'tasks.middleware.ApiCompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # runs BROWSER_MIDDLEWARE, except for /api/
+    'tasks.middleware.BrowserMiddleware',
+    # last - it runs the view itself when a request is profiled
+    'tasks.middleware.ProfilingMiddleware',
+]
+
+# Only the HTML pages and the admin need these, the API uses tokens
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# the admin looks for the session/auth/messages middleware in MIDDLEWARE,
+# they're in BROWSER_MIDDLEWARE instead
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'task_management.urls'
 
 TEMPLATES = [
@@ -68,9 +84,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections open between requests so the ones gunicorn
+        # warms up at worker start actually get reused
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional user sharding - each user's tasks and categories live on one shard
+# TASK_SHARDS lists the aliases in use, e.g. TASK_SHARDS=default,shard_1,shard_2
+# New shards need `python manage.py migrate --database shard_N` first
+TASK_SHARDS = os.environ.get('TASK_SHARDS', 'default').split(',')
+# Only the shard_N databases TASK_SHARDS uses are defined - workers open and
+# watch every database there is. The tests always get two (ShardingTest
+# turns sharding on itself).
+TESTING = sys.argv[1:2] == ['test']
+TASK_SHARD_DATABASES = int(os.environ.get('TASK_SHARD_DATABASES', 2 if TESTING else len(TASK_SHARDS) - 1))
+for shard_number in range(1, TASK_SHARD_DATABASES + 1):
+    DATABASES[f'shard_{shard_number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard_number}.sqlite3',
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        # ids on this shard start at SHARD_NUMBER * 10**12 (tasks/sharding.py)
+        'SHARD_NUMBER': shard_number,
+        'TEST': {'NAME': BASE_DIR / f'test_db_shard_{shard_number}.sqlite3'},
+    }
+
+DATABASE_ROUTERS = ['tasks.routers.ShardRouter']
+
 # Password validation (keeping it simple)
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -88,6 +130,70 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Static files (admin css/js) - served by WhiteNoise
+STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# API response compression (tasks.middleware.ApiCompressionMiddleware)
+# bodies smaller than this aren't worth the CPU
+API_COMPRESSION_MIN_SIZE = 1024
+API_COMPRESSION_GZIP_LEVEL = 6
+# 4-5 is the sweet spot for responses compressed on the fly
+API_COMPRESSION_BROTLI_QUALITY = 5
+
+# Login page for the server-rendered task views
+LOGIN_URL = '/accounts/login/'
+
+# How many tasks the HTML task list shows per page
+TASKS_PER_PAGE = 25
+
+# missed occurrences of recurring tasks older than this stop showing as overdue
+RECURRENCE_OVERDUE_DAYS = 30
+
+# Autocomplete keeps prefix indexes for this many users per worker, and
+# rebuilds one after this many seconds to pick up other workers' changes
+AUTOCOMPLETE_MAX_USERS = 500
+AUTOCOMPLETE_MAX_AGE = 60
+
+# archive_tasks moves tasks completed longer ago than this to the archive table
+TASK_ARCHIVE_AFTER_DAYS = 90
+
+# Metrics for /metrics - every process writes its numbers to METRICS_DIR
+# at most every METRICS_FLUSH_SECONDS, the endpoint adds them up.
+# With METRICS_TOKEN set, scrapers must send "Authorization: Bearer <token>"
+METRICS_DIR = os.environ.get('METRICS_DIR', BASE_DIR / 'metrics')
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Staff can profile single requests (X-Profile header or ?_profile=1),
+# only the newest PROFILE_MAX_FILES profiles are kept
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_MAX_FILES = 50
+
+# Due date reminders (python manage.py run_reminders)
+# sent this many hours before the due date starts
+TASK_REMINDER_LEAD_HOURS = 24
+# the scheduler keeps this many days of upcoming reminders in memory
+TASK_REMINDER_HORIZON_DAYS = 7
+# where reminders go - any class with a deliver(reminder) method
+TASK_REMINDER_SINK = os.environ.get('TASK_REMINDER_SINK', 'tasks.reminders.FileSink')
+TASK_REMINDER_FILE = BASE_DIR / 'reminders.log'
+
+# Serialized tasks cached per process (tasks/representations.py), 0 = off
+TASK_REPRESENTATION_CACHE_SIZE = int(os.environ.get('TASK_REPRESENTATION_CACHE_SIZE', 20000))
+
+# rebalance_ranks respaces board columns with manual order ranks longer than this
+TASK_RANK_REBALANCE_LENGTH = 12
+
+# Queue uploaded imports for the run_imports worker so the upload request
+# returns right away (off = import inside the request, which tests use)
+TASK_IMPORT_ASYNC = os.environ.get('TASK_IMPORT_ASYNC', 'true').lower() == 'true'
+# queued uploads wait here - web and worker need to see the same directory
+TASK_IMPORT_DIR = os.environ.get('TASK_IMPORT_DIR', BASE_DIR / 'imports')
+# an import still pending/running after this long is reported as failed
+# (the worker isn't running or died on it)
+TASK_IMPORT_TIMEOUT_MINUTES = 30
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -110,3 +216,6 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
 }
+
+# Max seconds a fresh gunicorn worker may take to load and warm up (checked by tests)
+WORKER_BOOT_BUDGET = float(os.environ.get('WORKER_BOOT_BUDGET', 5.0))
@@ -0,0 +1,62 @@
+"""Warm-up helpers for gunicorn workers.
+
+gunicorn.conf.py preloads the app in the master process, so everything done
+here before the fork is shared copy-on-write by all workers. Database
+connections can't be shared across a fork, so those are opened per worker.
+"""
+import time
+
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+
+
+def warm_url_patterns(resolver=None):
+    """Compile every URL regex so the first request doesn't have to"""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex  # compiled lazily on first access
+        if isinstance(pattern, URLResolver):
+            warm_url_patterns(pattern)
+    # builds the reverse() lookup tables too
+    resolver.reverse_dict
+    return resolver
+
+
+def warm_serializers():
+    """Import the API modules and build the serializer field maps once"""
+    from tasks import api_views  # noqa: F401 - importing is most of the work
+    from tasks import serializers
+
+    warmed = []
+    for serializer_class in (
+        serializers.UserSerializer,
+        serializers.CategorySerializer,
+        serializers.TaskSerializer,
+        serializers.TaskCreateSerializer,
+    ):
+        serializer_class().fields
+        warmed.append(serializer_class.__name__)
+    return warmed
+
+
+def warm_app():
+    """Everything we can do in the master before forking workers"""
+    warm_url_patterns()
+    warm_serializers()
+    # never hand an open connection over a fork
+    connections.close_all()
+
+
+def warm_db_connections():
+    """Open the database connections for this worker"""
+    for conn in connections.all():
+        conn.ensure_connection()
+
+
+def boot_worker():
+    """Run the full warm-up the way a fresh worker would, returns seconds taken"""
+    started = time.perf_counter()
+    from task_management.wsgi import application  # noqa: F401
+    warm_app()
+    warm_db_connections()
+    return time.perf_counter() - started
@@ -1,20 +1,143 @@
 from django.contrib import admin
-from .models import Task
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import hierarchy, ranking
+from .models import Task, Category
+
+# Admin setup - built so the changelist still opens with millions of tasks
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Row count from the database statistics instead of COUNT(*)
+    Returns None when the database has no estimate for the table
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+        'mysql': (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s'
+        ),
+        # sqlite only has this after ANALYZE, first number is the row count
+        'sqlite': 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(queries[connection.vendor], [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    # postgres says -1 for tables that were never analyzed
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts the table estimate for unfiltered lists
+    Filtered lists still get an exact count since the WHERE keeps them small
+    """
+    # below this an exact COUNT(*) is cheap anyway
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+def set_priority_action(priority):
+    """Build a bulk action that reprioritizes with one UPDATE"""
+    def action(modeladmin, request, queryset):
+        updated = queryset.update(priority=priority, updated_at=timezone.now())
+        modeladmin.message_user(request, f'{updated} tasks set to {priority} priority.')
+    action.__name__ = f'set_priority_{priority}'
+    action.short_description = f'Set priority to {priority}'
+    return action
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'color', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['name']
+    raw_id_fields = ['user']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ['title', 'user', 'status', 'priority', 'due_date', 'created_at']
     list_filter = ['status', 'priority', 'due_date', 'created_at']
-    search_fields = ['title', 'description', 'user__username']
+    # '=' makes the username lookup exact so it can use the index
+    search_fields = ['title', '=user__username']
     list_editable = ['status', 'priority']
-    date_hierarchy = 'due_date'
+    list_select_related = ['user']
+    autocomplete_fields = ['user', 'category']
     ordering = ['-created_at']
-    
+    # no date_hierarchy - it aggregates dates over the whole table on every load
+
+    # don't COUNT(*) the whole table for the "x total" link
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    actions = [
+        'mark_completed',
+        'mark_pending',
+        set_priority_action('high'),
+        set_priority_action('medium'),
+        set_priority_action('low'),
+    ]
+
     fieldsets = (
         ('Basic Info', {
             'fields': ('title', 'description', 'user')
         }),
         ('Task Details', {
-            'fields': ('due_date', 'priority', 'status')
+            'fields': ('due_date', 'priority', 'status', 'category')
         }),
-    )
\ No newline at end of file
+    )
+
+    @admin.action(description='Mark selected tasks as completed')
+    def mark_completed(self, request, queryset):
+        # only touch pending ones so existing completion times are kept
+        now = timezone.now()
+        changed = queryset.filter(status='pending').update_and_fetch(
+            status='completed', completed_at=now, updated_at=now
+        )
+        hierarchy.status_changed(queryset.db, [task.id for task in changed if task.parent_id], True)
+        ranking.column_changed(queryset.db, changed)
+        self.message_user(request, f'{len(changed)} tasks marked as completed.')
+
+    @admin.action(description='Mark selected tasks as pending')
+    def mark_pending(self, request, queryset):
+        changed = queryset.filter(status='completed').update_and_fetch(
+            status='pending', completed_at=None, updated_at=timezone.now()
+        )
+        hierarchy.status_changed(queryset.db, [task.id for task in changed if task.parent_id], False)
+        ranking.column_changed(queryset.db, changed)
+        self.message_user(request, f'{len(changed)} tasks marked as pending.')
+
+    def save_model(self, request, obj, form, change):
+        # list_editable and the change form can flip status too
+        if 'status' in form.changed_data:
+            obj.completed_at = timezone.now() if obj.status == 'completed' else None
+        super().save_model(request, obj, form, change)
+        if change and 'status' in form.changed_data and obj.parent_id:
+            # keep the parents' subtask progress right
+            hierarchy.status_changed(obj._state.db, [obj.id], obj.status == 'completed')
+        if change and {'status', 'category'}.intersection(form.changed_data):
+            ranking.column_changed(obj._state.db, [obj])
@@ -16,12 +16,42 @@ urlpatterns = [
     # Task CRUD endpoints
     path('tasks/', api_views.TaskListCreateView.as_view(), name='api_task_list'),
     path('tasks/<int:pk>/', api_views.TaskDetailView.as_view(), name='api_task_detail'),
+    path('tasks/<int:task_id>/restore/', api_views.restore_archived_task, name='api_task_restore'),
+    path('tasks/<int:task_id>/subtree/', api_views.task_subtree, name='api_task_subtree'),
+    path('tasks/<int:task_id>/dependencies/', api_views.task_dependencies, name='api_task_dependencies'),
+    path('tasks/<int:task_id>/dependencies/<int:depends_on_id>/', api_views.remove_task_dependency,
+         name='api_task_dependency_remove'),
     path('tasks/<int:task_id>/toggle/', api_views.toggle_task_status, name='api_task_toggle'),
+    path('tasks/<int:task_id>/move/', api_views.move_task, name='api_task_move'),
+    path('tasks/<int:task_id>/occurrences/<str:day>/', api_views.update_occurrence, name='api_task_occurrence'),
     path('tasks/stats/', api_views.task_statistics, name='api_task_stats'),
+    path('tasks/analytics/', api_views.task_analytics, name='api_task_analytics'),
+    path('tasks/agenda/', api_views.task_agenda, name='api_task_agenda'),
+    path('tasks/import/', api_views.task_imports, name='api_task_imports'),
+    path('tasks/import/<int:import_id>/', api_views.task_import_detail, name='api_task_import_detail'),
     path('tasks/bulk/update/', api_views.bulk_update_tasks, name='api_bulk_update'),
     path('tasks/bulk/delete/', api_views.bulk_delete_tasks, name='api_bulk_delete'),
     
+    # Quick-add suggestions
+    path('autocomplete/', api_views.autocomplete_titles, name='api_autocomplete'),
+    
+    # Several calls in one round trip
+    path('batch/', api_views.batch_requests, name='api_batch'),
+    
     # Category endpoints
     path('categories/', api_views.CategoryListCreateView.as_view(), name='api_category_list'),
     path('categories/<int:pk>/', api_views.CategoryDetailView.as_view(), name='api_category_detail'),
+    
+    # Tags
+    path('tags/', api_views.TagListView.as_view(), name='api_tag_list'),
+    
+    # Team projects
+    path('projects/', api_views.project_list, name='api_project_list'),
+    path('projects/<int:project_id>/members/', api_views.project_members, name='api_project_members'),
+    path('projects/<int:project_id>/members/<int:member_id>/', api_views.remove_project_member,
+         name='api_project_member_remove'),
+    
+    # Request profiles (staff only)
+    path('profiles/', api_views.profile_list, name='api_profile_list'),
+    path('profiles/<str:name>/', api_views.profile_download, name='api_profile_download'),
 ]
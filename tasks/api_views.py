@@ -1,25 +1,55 @@
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, RowNumber
+from django.http import FileResponse, HttpResponse
 from django.utils import timezone
-from .models import Task, Category
-from .permissions import IsTaskOwner
+from django.urls import Resolver404, resolve
+from django.utils.dateparse import parse_date
+from contextlib import ExitStack
+from datetime import timedelta
+from urllib.parse import urlsplit
+import io
+import json
+from . import archive, autocomplete, dependencies, hierarchy, imports, profiling, projects, ranking, recurrence, rollups
+from . import tags as task_tags
+from .models import (
+    Task, Category, TaskDailyRollup, CompletionTimeRollup, TaskImport, ArchivedTask, Tag, TaskDependency,
+    Project, ProjectMembership
+)
+from .sharding import shard_for_user
 from .serializers import (
     UserRegistrationSerializer, 
     UserSerializer, 
     UserUpdateSerializer,
     TaskSerializer, 
     TaskCreateSerializer,
-    CategorySerializer
+    TaskImportSerializer,
+    CategorySerializer,
+    TagSerializer,
+    ProjectSerializer,
+    ProjectMemberSerializer
 )
 
 # Django REST Framework API views
 # Handle HTTP requests and return JSON responses
 
+def priority_order():
+    """Sort key for priorities: high -> medium -> low"""
+    return models.Case(
+        models.When(priority='high', then=models.Value(1)),
+        models.When(priority='medium', then=models.Value(2)),
+        models.When(priority='low', then=models.Value(3)),
+        output_field=models.IntegerField()
+    )
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])  # so that annyone can register
 def register_user(request):
@@ -169,7 +199,7 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.for_user(self.request.user)
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -184,7 +214,18 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.for_user(self.request.user)
+
+class TagListView(generics.ListAPIView):
+    """
+    GET /api/tags/ - List user tags with their task counts (most used first)
+    Tags are created by giving them to a task
+    """
+    serializer_class = TagSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return Tag.objects.for_user(self.request.user).order_by('-task_count', 'name')
 
 @api_view(['POST'])
 def change_password(request):
@@ -229,9 +270,48 @@ def change_password(request):
 # Task CRUD API Views
 # Complete REST API for task management
 
-class TaskListCreateView(generics.ListCreateAPIView):
+class SparseFieldsMixin:
+    """
+    ?fields=id,title,status on task reads
+    Only those fields are serialized and only their columns are read
+    """
+    
+    def requested_fields(self):
+        raw = self.request.query_params.get('fields') if self.request.method == 'GET' else None
+        if not raw:
+            return None
+        fields = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in TaskSerializer.FIELD_COLUMNS]
+        if unknown:
+            raise ValidationError({
+                'fields': f"Unknown fields: {', '.join(unknown)}. "
+                          f"Choose from: {', '.join(TaskSerializer.FIELD_COLUMNS)}"
+            })
+        return fields
+    
+    def sparse_queryset(self, queryset, allow_values=True):
+        fields = self.requested_fields()
+        if not fields:
+            # the nested user comes from the join, also while the representation cache is cold
+            return queryset.select_related('user')
+        columns = TaskSerializer.columns_for(fields)
+        if allow_values and not TaskSerializer.NEEDS_INSTANCE.intersection(fields):
+            # plain columns only - skip building Task objects altogether
+            return queryset.values(*columns)
+        queryset = queryset.only(*columns)
+        if 'user' in fields:
+            queryset = queryset.select_related('user')
+        return queryset
+    
+    def get_serializer(self, *args, **kwargs):
+        fields = self.requested_fields()
+        if fields:
+            kwargs['fields'] = fields
+        return super().get_serializer(*args, **kwargs)
+
+class TaskListCreateView(SparseFieldsMixin, generics.ListCreateAPIView):
     """
-    GET /api/tasks/ - List all tasks for the current user
+    GET /api/tasks/ - List your tasks and the ones shared with you through projects
     POST /api/tasks/ - Create a new task
     
     Query parameters:
@@ -241,14 +321,20 @@ class TaskListCreateView(generics.ListCreateAPIView):
     - due_date: filter by specific date (YYYY-MM-DD)
     - overdue: show overdue tasks (true/false)
     - due_today: show tasks due today (true/false)
+      (the three date filters also list upcoming occurrences of recurring tasks)
+    - archived: include archived tasks too (true/false)
+    - tags: comma separated tag names, tag_mode: all (default) or any
+    - project: only the tasks of this project
+    - category: only the tasks of this category ('none' for the ones without)
+    - sort_by: created_at (default), due_date, priority, topological, or manual
+      (the board order set with /api/tasks/{id}/move/, by status and category)
+    - fields: comma separated fields to return, e.g. id,title,status,due_date
     """
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_queryset(self):
-        # Only show tasks belonging to the current user
-        queryset = Task.objects.filter(user=self.request.user)
-        
+    def filter_tasks(self, queryset):
+        """status/priority/search filters - the recurring series go through these too"""
         # Filter by status
         status = self.request.query_params.get('status')
         if status:
@@ -267,6 +353,67 @@ class TaskListCreateView(generics.ListCreateAPIView):
                 models.Q(description__icontains=search)
             )
         
+        # Tags: tags=home,urgent&tag_mode=all|any (all by default)
+        tag_names = self.request.query_params.get('tags')
+        if tag_names:
+            if queryset.model is ArchivedTask:
+                return queryset.none()  # archived tasks don't keep their tags
+            mode = 'any' if self.request.query_params.get('tag_mode') == 'any' else 'all'
+            queryset = task_tags.filter_by_tags(queryset, self.request.user, tag_names.split(','), mode)
+        
+        # One team project
+        project = self.request.query_params.get('project')
+        if project:
+            if queryset.model is ArchivedTask:
+                return queryset.none()  # archived tasks don't keep their project
+            if not project.isdigit():
+                raise ValidationError({'project': 'Must be a project id'})
+            queryset = queryset.filter(project_id=int(project))
+        
+        # One board column is status + category
+        category = self.request.query_params.get('category')
+        if category == 'none':
+            queryset = queryset.filter(category__isnull=True)
+        elif category:
+            if not category.isdigit():
+                raise ValidationError({'category': "Must be a category id or 'none'"})
+            queryset = queryset.filter(category_id=int(category))
+        
+        # What can be worked on now: pending and not blocked by a pending task
+        if self.request.query_params.get('ready') == 'true':
+            if queryset.model is ArchivedTask:
+                return queryset.none()  # archived tasks are all completed
+            queryset = dependencies.ready(queryset)
+        return queryset
+    
+    def wants_tags(self):
+        fields = self.requested_fields()
+        return fields is None or 'tags' in fields
+    
+    def occurrence_window(self):
+        """
+        (start, end) of the due dates asked for, where recurring tasks get
+        their occurrences expanded - None for lists that aren't date filtered
+        """
+        from datetime import date
+        params = self.request.query_params
+        if params.get('status') == 'completed':
+            return None  # unsaved occurrences are always pending
+        
+        windows = []
+        due_date = parse_date(params.get('due_date') or '') if params.get('due_date') else None
+        if due_date:
+            windows.append((due_date, due_date))
+        if params.get('due_today') == 'true':
+            windows.append((date.today(), date.today()))
+        if params.get('overdue') == 'true':
+            windows.append(recurrence.overdue_window())
+        if not windows:
+            return None
+        # several date filters narrow each other down
+        return max(w[0] for w in windows), min(w[1] for w in windows)
+    
+    def filter_dates(self, queryset):
         # Due date filtering
         due_date = self.request.query_params.get('due_date')
         if due_date:
@@ -286,27 +433,129 @@ class TaskListCreateView(generics.ListCreateAPIView):
         if due_today == 'true':
             from datetime import date
             queryset = queryset.filter(due_date=date.today())
-        
+        return queryset
+    
+    def ordering(self):
         # Sorting functionality
         sort_by = self.request.query_params.get('sort_by')
         if sort_by == 'due_date':
-            queryset = queryset.order_by('due_date')
+            return ['due_date']
         elif sort_by == 'priority':
-            # Custom ordering: high -> medium -> low
-            priority_order = models.Case(
-                models.When(priority='high', then=models.Value(1)),
-                models.When(priority='medium', then=models.Value(2)),
-                models.When(priority='low', then=models.Value(3)),
-                output_field=models.IntegerField()
+            # Custom ordering: high -> medium -> low (annotated as priority_order)
+            return ['priority_order']
+        elif sort_by == 'topological':
+            # blockers before the tasks they block (annotated as topological_level)
+            return ['topological_level', 'due_date']
+        elif sort_by == 'manual':
+            # board columns in their dragged order (annotated as manual_rank)
+            return ['status', 'category_id', 'manual_rank', 'id']
+        # Default sorting by creation date (newest first), same for sort_by=created_at
+        return ['-created_at']
+    
+    def annotate_order(self, queryset, ordering):
+        if 'priority_order' in ordering:
+            queryset = queryset.annotate(priority_order=priority_order())
+        if 'topological_level' in ordering:
+            # archived tasks are never in the dependency graph
+            level = models.Value(0) if queryset.model is ArchivedTask else models.F('dependency_level')
+            queryset = queryset.annotate(topological_level=level)
+        if 'manual_rank' in ordering:
+            # archived tasks aren't on the board any more
+            rank = models.Value('') if queryset.model is ArchivedTask else models.F('rank')
+            queryset = queryset.annotate(manual_rank=rank)
+        return queryset
+    
+    def include_archived(self):
+        return self.request.query_params.get('archived') == 'true'
+    
+    def get_queryset(self):
+        # The user's tasks and shared project tasks (archived ones live in their own table)
+        queryset = self.filter_dates(self.filter_tasks(projects.visible_tasks(self.request.user)))
+        ordering = self.ordering()
+        queryset = self.annotate_order(queryset, ordering).order_by(*ordering)
+        if self.wants_tags():
+            queryset = queryset.prefetch_related('tags')
+        
+        # occurrences/archived rows get merged in as Task objects, so rows must be Task objects too
+        plain_list = self.occurrence_window() is None and not self.include_archived()
+        return self.sparse_queryset(queryset, allow_values=plain_list)
+    
+    def archive_union(self):
+        """The user's hot and archived tasks as one sorted UNION query of plain rows"""
+        ordering = self.ordering()
+        parts = []
+        for model, archived in ((Task, False), (ArchivedTask, True)):
+            queryset = self.filter_dates(self.filter_tasks(model.objects.for_user(self.request.user)))
+            queryset = queryset.order_by().values(*ArchivedTask.COLUMNS).annotate(
+                archived=models.Value(archived, output_field=models.BooleanField())
             )
-            queryset = queryset.annotate(priority_order=priority_order).order_by('priority_order')
-        elif sort_by == 'created_at':
-            queryset = queryset.order_by('-created_at')
+            parts.append(self.annotate_order(queryset, ordering))
+        return parts[0].union(parts[1], all=True).order_by(*ordering)
+    
+    def row_task(self, row):
+        """Task object for an archive_union() row"""
+        archived = row.pop('archived')
+        row.pop('priority_order', None)
+        row.pop('topological_level', None)
+        row.pop('manual_rank', None)
+        task = Task(**row)
+        task.user = self.request.user
+        task.archived = archived
+        return task
+    
+    def serialize(self, tasks):
+        if self.wants_tags():
+            # one query for the tags of every stored task on the page
+            stored = [task for task in tasks if task.pk and not getattr(task, 'archived', False)]
+            models.prefetch_related_objects(stored, 'tags')
+        data = self.get_serializer(tasks, many=True).data
+        if self.include_archived():
+            for task, item in zip(tasks, data):
+                item['archived'] = getattr(task, 'archived', False)
+        return data
+    
+    def list(self, request, *args, **kwargs):
+        window = self.occurrence_window()
+        occurrences = []
+        if window:
+            series = self.filter_tasks(recurrence.series_for_user(request.user))
+            occurrences = recurrence.virtual_occurrences(series.select_related('user'), *window)
+        archived = self.include_archived()
+        if not occurrences and not archived:
+            return super().list(request, *args, **kwargs)
+        
+        if archived and not occurrences:
+            # sorted and paginated by the database
+            rows = self.archive_union()
+            page = self.paginate_queryset(rows)
+            tasks = [self.row_task(row) for row in (rows if page is None else page)]
+            if page is not None:
+                return self.get_paginated_response(self.serialize(tasks))
+            return Response(self.serialize(tasks))
+        
+        # date filtered lists are short - merge and sort them in Python
+        if archived:
+            tasks = [self.row_task(row) for row in self.archive_union()]
+        else:
+            tasks = list(self.get_queryset())
+        tasks += occurrences
+        sort_by = request.query_params.get('sort_by')
+        if sort_by == 'due_date':
+            tasks.sort(key=lambda task: task.due_date)
+        elif sort_by == 'priority':
+            ranks = {'high': 1, 'medium': 2, 'low': 3}
+            tasks.sort(key=lambda task: ranks[task.priority])
+        elif sort_by == 'topological':
+            tasks.sort(key=lambda task: (task.dependency_level, task.due_date))
+        elif sort_by == 'manual':
+            tasks.sort(key=lambda task: (task.status, task.category_id or 0, task.rank, task.id or 0))
         else:
-            # Default sorting by creation date (newest first)
-            queryset = queryset.order_by('-created_at')
+            tasks.sort(key=lambda task: (task.created_at, task.due_date), reverse=True)
         
-        return queryset
+        page = self.paginate_queryset(tasks)
+        if page is not None:
+            return self.get_paginated_response(self.serialize(page))
+        return Response(self.serialize(tasks))
     
     def get_serializer_class(self):
         # Use different serializer for creation
@@ -316,41 +565,118 @@ class TaskListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         # Automatically assign the task to the current user
-        serializer.save(user=self.request.user)
+        task = serializer.save(user=self.request.user)
+        rollups.record_created(task.user_id, task.created_at)
 
-class TaskDetailView(generics.RetrieveUpdateDestroyAPIView):
+class TaskDetailView(SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
     """
-    GET /api/tasks/{id}/ - Get specific task
+    GET /api/tasks/{id}/ - Get specific task (?fields= like the list)
     PUT /api/tasks/{id}/ - Update specific task (but not if completed)
+    PATCH /api/tasks/{id}/ - Update only the given fields (parent moves the subtree)
     DELETE /api/tasks/{id}/ - Delete specific task
+    Project members can read shared tasks, with the edit role also change
+    MEMBER_FIELDS of them. Everything else is for the owner only.
     """
     serializer_class = TaskSerializer
-    permission_classes = [permissions.IsAuthenticated, IsTaskOwner]
+    permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        # Users can only access their own tasks
-        return Task.objects.filter(user=self.request.user)
+        # Access is in the WHERE clause: your tasks, plus the shared ones you may read/edit
+        # (get_object needs an object, so no values() rows here)
+        if self.request.method in permissions.SAFE_METHODS:
+            tasks = projects.visible_tasks(self.request.user)
+        elif self.request.method == 'DELETE':
+            tasks = Task.objects.for_user(self.request.user)
+        else:
+            tasks = projects.visible_tasks(self.request.user, edit=True)
+        return self.sparse_queryset(tasks, allow_values=False)
     
     def update(self, request, *args, **kwargs):
-        # Prevent editing completed tasks unless reverting status
-        task = self.get_object()
-        new_status = request.data.get('status')
+        # Validate first, then write with one conditional UPDATE - the WHERE
+        # clause does the ownership check and the "no editing completed tasks"
+        # rule, so nothing has to be loaded beforehand
+        partial = kwargs.pop('partial', False)
+        instance = None
+        if RECURRENCE_FIELDS.intersection(request.data):
+            # recurrence rules are checked against the stored fields
+            instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
         
-        # If task is completed and we're not changing status to pending, block the edit
-        if task.status == 'completed' and new_status != 'pending':
-            return Response({
-                'error': 'Cannot edit completed tasks. Mark as pending first.'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        changes = dict(serializer.validated_data)
+        if set(changes) <= MEMBER_FIELDS:
+            editable = projects.visible_tasks(request.user, edit=True)
+        else:
+            editable = Task.objects.for_user(request.user)
+        tag_names = changes.pop('tags', None)
+        moving = 'parent' in changes
+        new_parent = changes.pop('parent', None)
+        new_status = changes.get('status')
+        if new_status == 'completed':
+            changes['completed_at'] = timezone.now()
+        elif new_status == 'pending':
+            changes['completed_at'] = None
         
-        # Handle completion timestamp when status changes
-        if new_status == 'completed' and task.status != 'completed':
-            # Task is being marked as completed
-            request.data['completed_at'] = timezone.now().isoformat()
-        elif new_status == 'pending' and task.status == 'completed':
-            # Task is being reverted to pending
-            request.data['completed_at'] = None
+        try:
+            with transaction.atomic(using=shard_for_user(request.user.id)):
+                previous_category = None
+                if 'category' in changes:
+                    previous_category = editable.filter(id=kwargs['pk']).values_list('category_id', flat=True).first()
+                task, previous_status = update_task_fields(editable, kwargs['pk'], changes)
+                if task is not None:
+                    if task.parent_id and task.status != previous_status:
+                        hierarchy.status_changed(task._state.db, [task.id], task.status == 'completed')
+                    # another board column - to the top of it
+                    moved_category = 'category' in changes and task.category_id != previous_category
+                    if task.status != previous_status or moved_category:
+                        ranking.column_changed(task._state.db, [task])
+                    if moving:
+                        hierarchy.move(task, new_parent.id if new_parent else None)
+        except hierarchy.HierarchyError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if task is None:
+            if editable.filter(id=kwargs['pk']).exists():
+                return Response({
+                    'error': 'Cannot edit completed tasks. Mark as pending first.'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if projects.visible_tasks(request.user, edit=True).filter(id=kwargs['pk']).exists():
+                return Response({
+                    'error': f"Project members can only change {', '.join(sorted(MEMBER_FIELDS))}"
+                }, status=status.HTTP_403_FORBIDDEN)
+            return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        return super().update(request, *args, **kwargs)
+        if task.user_id == request.user.id:
+            task.user = request.user
+        rollups.record_status_change(task, previous_status)
+        if tag_names is not None:
+            task_tags.set_task_tags(task, tag_names)
+        if 'title' in changes:
+            autocomplete.item_saved('task', task.id, task.user_id, task.title)
+        return Response(TaskSerializer(task, context=self.get_serializer_context()).data)
+
+RECURRENCE_FIELDS = {'recurrence', 'recurrence_interval', 'recurrence_weekdays', 'recurrence_end'}
+
+# what project members with the edit role may change on the owner's tasks
+MEMBER_FIELDS = {'title', 'description', 'due_date', 'priority', 'status'}
+
+def update_task_fields(tasks, task_id, changes):
+    """
+    Write only the given columns of one of `tasks`
+    Returns (task, previous status) or (None, None) if the task isn't in
+    `tasks` or is completed and isn't being set back to pending
+    """
+    changes['updated_at'] = timezone.now()
+    owned = tasks.filter(id=task_id)
+    # the status in the WHERE clause tells us which transition happened
+    if changes.get('status') == 'pending':
+        attempts = ['pending', 'completed']  # plain edit first, it's the usual case
+    else:
+        attempts = ['pending']  # completed tasks can only be reopened
+    for previous_status in attempts:
+        tasks = owned.filter(status=previous_status).update_and_fetch(**changes)
+        if tasks:
+            return tasks[0], previous_status
+    return None, None
 
 @api_view(['PATCH'])
 def toggle_task_status(request, task_id):
@@ -358,23 +684,39 @@ def toggle_task_status(request, task_id):
     Toggle task between pending and completed
     PATCH /api/tasks/{id}/toggle/
     """
-    try:
-        task = Task.objects.get(id=task_id, user=request.user)
-    except Task.DoesNotExist:
+    # One conditional UPDATE flips the status in the database, so two
+    # clients toggling at once can't both read 'pending' and both complete it
+    now = timezone.now()
+    was_pending = models.Q(status='pending')
+    tasks = projects.visible_tasks(request.user, edit=True).filter(id=task_id).update_and_fetch(
+        status=models.Case(
+            models.When(was_pending, then=models.Value('completed')),
+            default=models.Value('pending'),
+        ),
+        completed_at=models.Case(
+            models.When(was_pending, then=models.Value(now)),
+            default=None,
+            output_field=models.DateTimeField(),
+        ),
+        updated_at=now,
+    )
+    if not tasks:
         return Response({'error': 'Task not found'}, 
                        status=status.HTTP_404_NOT_FOUND)
     
-    # Toggle status with completion timestamp
-    if task.status == 'pending':
-        task.status = 'completed'
-        task.completed_at = timezone.now()  # add completion timestamp
+    task = tasks[0]
+    if task.user_id == request.user.id:
+        task.user = request.user  # saves loading it again for the serializer
+    if task.status == 'completed':
         message = 'Task marked as completed!'
+        previous_status = 'pending'
     else:
-        task.status = 'pending'
-        task.completed_at = None  # clear completion timestamp
         message = 'Task marked as pending!'
-    
-    task.save()
+        previous_status = 'completed'
+    rollups.record_status_change(task, previous_status)
+    if task.parent_id:
+        hierarchy.status_changed(task._state.db, [task.id], task.status == 'completed')
+    ranking.column_changed(task._state.db, [task])
     
     return Response({
         'success': True,
@@ -384,6 +726,204 @@ def toggle_task_status(request, task_id):
         }
     })
 
+@api_view(['PATCH'])
+def move_task(request, task_id):
+    """
+    Drag a task to another place in its board column (same status and category)
+    PATCH /api/tasks/{id}/move/
+    Body: {"after": 12} - right below task 12, {"before": 12} - right above it,
+    {} - to the top. The order shows up with sort_by=manual.
+    Only the moved task's row is written.
+    """
+    tasks = Task.objects.for_user(request.user).only('id', 'user_id', 'status', 'category_id', 'rank')
+    try:
+        task = tasks.get(id=task_id)
+    except Task.DoesNotExist:
+        return Response({'error': 'Task not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    neighbours = {}
+    for name in ('after', 'before'):
+        value = request.data.get(name)
+        try:
+            neighbours[name] = None if value is None else int(value)
+        except (TypeError, ValueError):
+            return Response({'error': f'{name} must be a task id'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+    try:
+        rank = ranking.move(task, after_id=neighbours['after'], before_id=neighbours['before'])
+    except ranking.RankError as e:
+        return Response({'error': str(e)}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    return Response({'id': task.id, 'status': task.status, 'category': task.category_id, 'rank': rank})
+
+@api_view(['POST'])
+def restore_archived_task(request, task_id):
+    """
+    Move an archived task back to the normal task list
+    POST /api/tasks/{id}/restore/
+    """
+    try:
+        task = archive.restore_task(request.user, task_id)
+    except IntegrityError:
+        return Response({
+            'error': 'You already have a task with this title - rename it first'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if task is None:
+        return Response({'error': 'Archived task not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    task.user = request.user
+    return Response({
+        'success': True,
+        'message': 'Task restored!',
+        'data': {
+            'task': TaskSerializer(task).data
+        }
+    })
+
+# columns the subtree endpoint returns for every task in the tree
+SUBTREE_FIELDS = [
+    'id', 'title', 'status', 'priority', 'due_date', 'parent',
+    'subtask_count', 'subtask_completed_count', 'progress'
+]
+
+@api_view(['GET'])
+def task_subtree(request, task_id):
+    """
+    A task with all its subtasks nested under it, and their progress
+    GET /api/tasks/{id}/subtree/
+    The whole tree is one query through the closure table
+    """
+    queryset = Task.objects.for_user(request.user).only(*TaskSerializer.columns_for(SUBTREE_FIELDS))
+    tree = hierarchy.subtree(task_id, queryset)
+    if tree is None:
+        return Response({'error': 'Task not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    def node(branch):
+        task, children = branch
+        data = TaskSerializer(task, fields=SUBTREE_FIELDS).data
+        data['subtasks'] = [node(child) for child in children]
+        return data
+    
+    return Response(node(tree))
+
+# columns returned for the tasks a task is blocked by
+DEPENDENCY_FIELDS = ['id', 'title', 'status', 'priority', 'due_date']
+
+@api_view(['GET', 'POST'])
+def task_dependencies(request, task_id):
+    """
+    The tasks a task is blocked by
+    GET /api/tasks/{id}/dependencies/
+    POST /api/tasks/{id}/dependencies/ - Body: {"depends_on": 5}
+    """
+    tasks = Task.objects.for_user(request.user)
+    try:
+        task = tasks.get(id=task_id)
+    except Task.DoesNotExist:
+        return Response({'error': 'Task not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'POST':
+        try:
+            depends_on = tasks.get(id=int(request.data.get('depends_on')))
+        except (TypeError, ValueError, Task.DoesNotExist):
+            return Response({'error': 'depends_on must be the id of one of your tasks'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        try:
+            dependencies.add_dependency(task, depends_on)
+        except dependencies.DependencyError as e:
+            return Response({'error': str(e)}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+    
+    blockers = tasks.filter(
+        id__in=TaskDependency.objects.for_user(request.user).filter(task_id=task.id).values('depends_on_id')
+    ).only(*TaskSerializer.columns_for(DEPENDENCY_FIELDS)).order_by('due_date')
+    data = TaskSerializer(blockers, many=True, fields=DEPENDENCY_FIELDS).data
+    code = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+    return Response({'task': task.id, 'blocked_by': data}, status=code)
+
+@api_view(['DELETE'])
+def remove_task_dependency(request, task_id, depends_on_id):
+    """
+    Stop a task being blocked by another one
+    DELETE /api/tasks/{id}/dependencies/{depends_on_id}/
+    """
+    if not dependencies.remove_dependency(request.user, task_id, depends_on_id):
+        return Response({'error': 'Dependency not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Dependency removed'})
+
+@api_view(['PATCH'])
+def update_occurrence(request, task_id, day):
+    """
+    Edit or complete one occurrence of a recurring task
+    PATCH /api/tasks/{id}/occurrences/{YYYY-MM-DD}/
+    The occurrence gets its own row the first time it's changed
+    """
+    try:
+        series = recurrence.series_for_user(request.user).get(id=task_id)
+    except Task.DoesNotExist:
+        return Response({'error': 'Recurring task not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        occurrence_date = parse_date(day)
+    except ValueError:
+        occurrence_date = None
+    if not occurrence_date or not recurrence.occurrence_dates(series, occurrence_date, occurrence_date):
+        return Response({'error': 'Not an occurrence of this task'}, 
+                       status=status.HTTP_400_BAD_REQUEST)
+    
+    occurrence, created = Task.objects.get_or_create(
+        user=request.user,
+        recurrence_parent=series,
+        occurrence_date=occurrence_date,
+        defaults={
+            'title': series.title,
+            'description': series.description,
+            'due_date': occurrence_date,
+            'priority': series.priority,
+            'category_id': series.category_id,
+        }
+    )
+    
+    # same rule as editing a normal task
+    if occurrence.status == 'completed' and request.data.get('status') != 'pending':
+        return Response({
+            'error': 'Cannot edit completed tasks. Mark as pending first.'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = TaskSerializer(occurrence, data=request.data, partial=True, context={'request': request})
+    if not serializer.is_valid():
+        return Response({
+            'error': 'Update failed',
+            'details': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # an occurrence can't start a series of its own
+    for name in RECURRENCE_FIELDS:
+        serializer.validated_data.pop(name, None)
+    
+    previous_status = occurrence.status
+    previous_category = occurrence.category_id
+    new_status = serializer.validated_data.get('status', previous_status)
+    extra = {}
+    if new_status == 'completed' and previous_status != 'completed':
+        extra['completed_at'] = timezone.now()
+    elif new_status == 'pending' and previous_status == 'completed':
+        extra['completed_at'] = None
+    task = serializer.save(**extra)
+    if not created and (task.status, task.category_id) != (previous_status, previous_category):
+        ranking.column_changed(task._state.db, [task])
+    
+    if created:
+        rollups.record_created(task.user_id, task.created_at)
+    rollups.record_status_change(task, previous_status)
+    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
 @api_view(['GET'])
 def task_statistics(request):
     """
@@ -391,7 +931,7 @@ def task_statistics(request):
     GET /api/tasks/stats/
     """
     from datetime import date
-    user_tasks = Task.objects.filter(user=request.user)
+    user_tasks = Task.objects.for_user(request.user)
     
     # Basic counts
     total_tasks = user_tasks.count()
@@ -414,6 +954,12 @@ def task_statistics(request):
         due_date=date.today()
     ).count()
     
+    # recurring tasks also count their occurrences that have no row yet
+    series = list(recurrence.series_for_user(request.user))
+    if series:
+        overdue_tasks += len(recurrence.virtual_occurrences(series, *recurrence.overdue_window()))
+        due_today += len(recurrence.virtual_occurrences(series, date.today(), date.today()))
+    
     return Response({
         'total_tasks': total_tasks,
         'pending_tasks': pending_tasks,
@@ -428,6 +974,141 @@ def task_statistics(request):
         'completion_rate': round((completed_tasks / total_tasks * 100), 2) if total_tasks > 0 else 0
     })
 
+# longest range the agenda will aggregate in one go
+AGENDA_MAX_DAYS = 366
+AGENDA_MAX_TASKS_PER_DAY = 20
+
+@api_view(['GET'])
+def task_agenda(request):
+    """
+    Per-day task counts for drawing a calendar
+    GET /api/tasks/agenda/?start=2025-09-01&end=2025-09-30&per_day=3
+    per_day is optional - include the first N tasks of each day
+    """
+    try:
+        start = parse_date(request.query_params.get('start', ''))
+        end = parse_date(request.query_params.get('end', ''))
+        per_day = int(request.query_params.get('per_day', 0))
+    except ValueError:
+        start = end = per_day = None
+    
+    if not start or not end or per_day is None:
+        return Response({
+            'error': 'start and end dates (YYYY-MM-DD) required, per_day must be a number'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if end < start or (end - start).days >= AGENDA_MAX_DAYS:
+        return Response({
+            'error': f'end must be after start and at most {AGENDA_MAX_DAYS} days later'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    per_day = max(0, min(per_day, AGENDA_MAX_TASKS_PER_DAY))
+    # (user, due_date) index covers this range scan
+    in_range = Task.objects.for_user(request.user).filter(due_date__range=(start, end))
+    
+    # One grouped query for every count on the calendar
+    # order_by() drops the default ordering so it doesn't end up in the GROUP BY
+    rows = (
+        in_range.order_by()
+        .values('due_date', 'status', 'priority')
+        .annotate(count=models.Count('id'))
+    )
+    
+    days = {}
+    for row in rows:
+        day = days.setdefault(row['due_date'].isoformat(), {
+            'total': 0,
+            'status': {'pending': 0, 'completed': 0},
+            'priority': {'high': 0, 'medium': 0, 'low': 0},
+        })
+        day['total'] += row['count']
+        day['status'][row['status']] += row['count']
+        day['priority'][row['priority']] += row['count']
+    
+    if per_day:
+        # first N tasks of each day, numbered per day by the database
+        first_tasks = (
+            in_range.select_related('user', 'category')
+            .prefetch_related('tags')
+            .annotate(day_position=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('due_date')],
+                order_by=[priority_order().asc(), models.F('created_at').asc()],
+            ))
+            .filter(day_position__lte=per_day)
+            .order_by('due_date', 'day_position')
+        )
+        for day in days.values():
+            day['tasks'] = []
+        for task in first_tasks:
+            days[task.due_date.isoformat()]['tasks'].append(TaskSerializer(task).data)
+    
+    return Response({
+        'start': start,
+        'end': end,
+        'days': days,
+    })
+
+# longest history the analytics endpoint returns
+ANALYTICS_MAX_DAYS = 730
+
+@api_view(['GET'])
+def task_analytics(request):
+    """
+    Completion trends from the daily rollups (never scans the task table)
+    GET /api/tasks/analytics/?period=day|week&days=90
+    """
+    period = request.query_params.get('period', 'day')
+    try:
+        days = int(request.query_params.get('days', 90))
+    except ValueError:
+        days = 0
+    
+    if period not in ('day', 'week') or not 0 < days <= ANALYTICS_MAX_DAYS:
+        return Response({
+            'error': f'period must be day or week, days between 1 and {ANALYTICS_MAX_DAYS}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    since = timezone.localdate() - timedelta(days=days - 1)
+    
+    series = {}
+    for rollup in TaskDailyRollup.objects.for_user(request.user).filter(day__gte=since):
+        start = rollups.period_start(rollup.day, period)
+        point = series.setdefault(start, {'created': 0, 'completed': 0, 'reopened': 0})
+        point['created'] += rollup.created_count
+        point['completed'] += rollup.completed_count
+        point['reopened'] += rollup.reopened_count
+    
+    # merge the completion time histograms of the whole window
+    buckets = (
+        CompletionTimeRollup.objects.for_user(request.user).filter(day__gte=since)
+        .order_by()
+        .values('bucket')
+        .annotate(total=models.Sum('count'))
+    )
+    bucket_counts = {row['bucket']: row['total'] for row in buckets}
+    
+    trend = []
+    for start in sorted(series):
+        point = series[start]
+        point['period_start'] = start
+        point['completion_rate'] = (
+            round(point['completed'] / point['created'] * 100, 2) if point['created'] else None
+        )
+        trend.append(point)
+    
+    return Response({
+        'period': period,
+        'since': since,
+        'trend': trend,
+        'totals': {
+            'created': sum(point['created'] for point in trend),
+            'completed': sum(point['completed'] for point in trend),
+            'reopened': sum(point['reopened'] for point in trend),
+        },
+        'median_completion_hours': rollups.median_hours(bucket_counts),
+    })
+
 @api_view(['PATCH'])
 def bulk_update_tasks(request):
     """
@@ -456,10 +1137,34 @@ def bulk_update_tasks(request):
         update_data['completed_at'] = None
     
     # Update tasks belonging to current user
-    updated_count = Task.objects.filter(
-        id__in=task_ids,
-        user=request.user
-    ).update(**update_data)
+    user_tasks = Task.objects.for_user(request.user).filter(id__in=task_ids)
+    
+    # update() skips auto_now, so bump updated_at by hand
+    now = timezone.now()
+    if 'status' not in update_data:
+        updated_count = user_tasks.update(updated_at=now, **update_data)
+    else:
+        # Tasks whose status actually flips come back from the UPDATE itself,
+        # for the analytics rollups and their parents' subtask counters
+        new_status = update_data['status']
+        # the ones already there only get the other fields (and keep their
+        # completion time) - first, so the flipped rows don't match this again
+        unchanged = {key: value for key, value in update_data.items() if key != 'completed_at'}
+        updated_count = user_tasks.filter(status=new_status).update(updated_at=now, **unchanged)
+        changed = user_tasks.exclude(status=new_status).update_and_fetch(updated_at=now, **update_data)
+        updated_count += len(changed)
+        
+        if changed and new_status == 'completed':
+            rollups.record_completions(
+                request.user.id,
+                [(task.created_at, task.completed_at) for task in changed]
+            )
+        elif changed:
+            rollups.record_reopened(request.user.id, now, count=len(changed))
+        hierarchy.status_changed(
+            user_tasks.db, [task.id for task in changed if task.parent_id], new_status == 'completed'
+        )
+        ranking.column_changed(user_tasks.db, changed)
     
     return Response({
         'message': f'{updated_count} tasks updated successfully',
@@ -481,12 +1186,300 @@ def bulk_delete_tasks(request):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     # Delete tasks belonging to current user
-    deleted_count, _ = Task.objects.filter(
-        id__in=task_ids,
-        user=request.user
+    deleted_count, _ = Task.objects.for_user(request.user).filter(
+        id__in=task_ids
     ).delete()
     
     return Response({
         'message': f'{deleted_count} tasks deleted successfully',
         'deleted_count': deleted_count
     })
+
+@api_view(['GET', 'POST'])
+def project_list(request):
+    """
+    Team projects you own or are a member of
+    GET /api/projects/
+    POST /api/projects/ - Body: {"name": "Website"}
+    """
+    if request.method == 'POST':
+        serializer = ProjectSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic(using=shard_for_user(request.user.id)):
+                project = serializer.save(user=request.user)
+        except IntegrityError:
+            return Response({'error': 'You already have a project with this name'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        return Response(ProjectSerializer(project).data, status=status.HTTP_201_CREATED)
+    
+    my_role = ProjectMembership.objects.filter(
+        project=models.OuterRef('pk'), member_id=request.user.id
+    ).values('role')[:1]
+    visible = projects.visible_projects(request.user).select_related('user').annotate(
+        role=Coalesce(models.Subquery(my_role), models.Value('owner'))
+    )
+    return Response(ProjectSerializer(visible, many=True).data)
+
+@api_view(['GET', 'POST'])
+def project_members(request, project_id):
+    """
+    Who a project is shared with
+    GET /api/projects/{id}/members/
+    POST /api/projects/{id}/members/ - owner only, Body: {"username": "sam", "role": "edit"}
+    role is read (default) or edit, adding someone again changes their role
+    """
+    try:
+        project = projects.visible_projects(request.user).get(id=project_id)
+    except Project.DoesNotExist:
+        return Response({'error': 'Project not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    
+    code = status.HTTP_200_OK
+    if request.method == 'POST':
+        if project.user_id != request.user.id:
+            return Response({'error': 'Only the project owner can add members'}, 
+                           status=status.HTTP_403_FORBIDDEN)
+        role = request.data.get('role', 'read')
+        if role not in dict(ProjectMembership.ROLE_CHOICES):
+            return Response({'error': 'role must be read or edit'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        try:
+            member = User.objects.get(username=request.data.get('username'))
+        except User.DoesNotExist:
+            return Response({'error': 'No user with this username'}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        try:
+            _, created = projects.add_member(project, member, role)
+        except projects.ProjectError as e:
+            return Response({'error': str(e)}, 
+                           status=status.HTTP_400_BAD_REQUEST)
+        if created:
+            code = status.HTTP_201_CREATED
+    
+    members = project.memberships.select_related('member').order_by('member__username')
+    return Response({
+        'project': project.id,
+        'members': ProjectMemberSerializer(members, many=True).data
+    }, status=code)
+
+@api_view(['DELETE'])
+def remove_project_member(request, project_id, member_id):
+    """
+    Take someone out of a project, members can remove themselves
+    DELETE /api/projects/{id}/members/{user_id}/
+    """
+    try:
+        project = projects.visible_projects(request.user).get(id=project_id)
+    except Project.DoesNotExist:
+        return Response({'error': 'Project not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    if project.user_id != request.user.id and member_id != request.user.id:
+        return Response({'error': 'Only the project owner can remove other members'}, 
+                       status=status.HTTP_403_FORBIDDEN)
+    if not projects.remove_member(project, member_id):
+        return Response({'error': 'Not a member of this project'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Member removed'})
+
+# most suggestions the autocomplete endpoint returns
+AUTOCOMPLETE_MAX_RESULTS = 20
+
+@api_view(['GET'])
+def autocomplete_titles(request):
+    """
+    Task and category titles starting with what the user typed so far
+    GET /api/autocomplete/?q=buy&limit=10
+    Matches the start of the title or of any word in it
+    """
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        limit = 0
+    if not query or not 0 < limit <= AUTOCOMPLETE_MAX_RESULTS:
+        return Response({
+            'error': f'q required, limit between 1 and {AUTOCOMPLETE_MAX_RESULTS}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'query': query,
+        'results': autocomplete.suggest(request.user.id, query, limit)
+    })
+
+# Task imports
+@api_view(['GET', 'POST'])
+@parser_classes([MultiPartParser])
+def task_imports(request):
+    """
+    GET /api/tasks/import/ - My recent imports
+    POST /api/tasks/import/ - Upload a CSV or NDJSON file of tasks (form field "file")
+    Optional "format" field (csv/ndjson), otherwise taken from the file extension
+    """
+    if request.method == 'GET':
+        imports.expire_stale(TaskImport.objects.for_user(request.user))
+        recent = TaskImport.objects.for_user(request.user)[:20]
+        return Response(TaskImportSerializer(recent, many=True).data)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'file required'}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = imports.detect_format(upload.name, request.data.get('format'))
+    if file_format is None:
+        return Response({
+            'error': 'Use a .csv, .ndjson or .jsonl file, or pass format=csv|ndjson'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    task_import = imports.start_import(request.user, upload, file_format)
+    # 202 while it's still running in the background
+    code = status.HTTP_201_CREATED if task_import.finished_at else status.HTTP_202_ACCEPTED
+    return Response(TaskImportSerializer(task_import).data, status=code)
+
+@api_view(['GET'])
+def task_import_detail(request, import_id):
+    """
+    Progress and row errors of one import - poll this while it runs
+    GET /api/tasks/import/{id}/
+    """
+    imports.expire_stale(TaskImport.objects.for_user(request.user).filter(id=import_id))
+    try:
+        task_import = TaskImport.objects.for_user(request.user).get(id=import_id)
+    except TaskImport.DoesNotExist:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(TaskImportSerializer(task_import).data)
+
+# Batch endpoint - several API calls in one round trip
+BATCH_MAX_REQUESTS = 20
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+def _sub_request(request, method, path, body):
+    """A WSGIRequest for one sub-request, logged in as the batch caller"""
+    url = urlsplit(path)
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = request.META.copy()
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+    })
+    sub_request = WSGIRequest(environ)
+    # DRF picks these up instead of authenticating the token again
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+def _run_sub_request(request, item):
+    """Run one {"method", "path", "body"} item, returns (status, body)"""
+    if not isinstance(item, dict):
+        return 400, {'error': 'Each request needs a method and a path'}
+    method = str(item.get('method', 'GET')).upper()
+    path = item.get('path') or ''
+    if method not in BATCH_METHODS or not path.startswith('/api/'):
+        return 400, {'error': f"method must be one of {', '.join(BATCH_METHODS)} and path start with /api/"}
+    
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        return 404, {'error': 'Not found'}
+    if match.func is batch_requests:
+        return 400, {'error': 'Batches cannot be nested'}
+    
+    try:
+        response = match.func(_sub_request(request, method, path, item.get('body')), *match.args, **match.kwargs)
+    except Exception as e:
+        return 500, {'error': 'Request failed due to server error', 'message': str(e)}
+    
+    # DRF responses still have their data - no need to render and parse it again
+    if hasattr(response, 'data'):
+        return response.status_code, response.data
+    if response.streaming:
+        # downloads don't fit in a JSON body, and may be large
+        response.close()
+        return 400, {'error': 'Downloads cannot be batched, request them on their own'}
+    return response.status_code, response.content.decode(response.charset or 'utf-8')
+
+@api_view(['POST'])
+def batch_requests(request):
+    """
+    Run several API calls in one request
+    POST /api/batch/
+    Body: {"requests": [{"method": "GET", "path": "/api/tasks/stats/"}, ...], "atomic": false}
+    With atomic=true everything is rolled back if any request fails
+    """
+    items = request.data.get('requests')
+    atomic = request.data.get('atomic', False)
+    
+    if not isinstance(items, list) or not items:
+        return Response({
+            'error': 'requests must be a list of {method, path, body}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    # a JSON boolean - "false" or 0 must not quietly turn atomic on or off
+    if not isinstance(atomic, bool):
+        return Response({
+            'error': 'atomic must be true or false'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > BATCH_MAX_REQUESTS:
+        return Response({
+            'error': f'At most {BATCH_MAX_REQUESTS} requests per batch'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = []
+    with ExitStack() as stack:
+        if atomic:
+            # the user's tasks live on their shard, users/tokens on default
+            for alias in {'default', shard_for_user(request.user.id)}:
+                stack.enter_context(transaction.atomic(using=alias))
+        
+        failed = False
+        for item in items:
+            if failed:
+                results.append({'status': 424, 'body': {'error': 'Skipped, an earlier request failed'}})
+                continue
+            code, body = _run_sub_request(request, item)
+            results.append({'status': code, 'body': body})
+            if atomic and code >= 400:
+                failed = True
+        
+        if failed:
+            for alias in {'default', shard_for_user(request.user.id)}:
+                transaction.set_rollback(True, using=alias)
+    
+    # echo back ids so clients can match responses up
+    for item, result in zip(items, results):
+        if isinstance(item, dict) and 'id' in item:
+            result['id'] = item['id']
+    
+    return Response({
+        'atomic': atomic,
+        'rolled_back': atomic and failed,
+        'responses': results
+    })
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def profile_list(request):
+    """
+    Stored request profiles, newest first (staff only)
+    GET /api/profiles/
+    Send any request with an X-Profile header (or ?_profile=1) to add one
+    """
+    return Response({'profiles': profiling.list_profiles()})
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def profile_download(request, name):
+    """
+    Download one profile (staff only)
+    GET /api/profiles/{name}/ - the cProfile dump, for pstats or snakeviz
+    GET /api/profiles/{name}/?as=text - slowest calls as plain text
+    """
+    path = profiling.profile_path(name)
+    if path is None:
+        return Response({'error': 'Profile not found'}, 
+                       status=status.HTTP_404_NOT_FOUND)
+    if request.query_params.get('as') == 'text':
+        return HttpResponse(profiling.as_text(path), content_type='text/plain; charset=utf-8')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
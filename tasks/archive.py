@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import ranking
+from .models import Task, ArchivedTask, TaskDependency, TaskTag
+from .sharding import shard_for_user
+
+# Hot/cold split for tasks - old completed tasks move to ArchivedTask so
+# everyday lists, searches and stats only touch the (much smaller) task table
+
+
+def archivable(alias, days):
+    """Completed one-off tasks on this database finished more than `days` ago"""
+    cutoff = timezone.now() - timedelta(days=days)
+    return (
+        Task.objects.using(alias)
+        .filter(status='completed', completed_at__lt=cutoff)
+        # recurring series and their stored occurrences stay hot - without
+        # their rows the occurrences would show up again as pending
+        .filter(recurrence='', recurrence_parent__isnull=True)
+        # same for subtask trees, they'd lose their parent or children
+        .filter(parent__isnull=True, subtask_count=0)
+        # and tasks in the dependency graph, restoring them wouldn't bring the edges back
+        .exclude(Exists(TaskDependency.objects.filter(task_id=OuterRef('id'))))
+        .exclude(Exists(TaskDependency.objects.filter(depends_on_id=OuterRef('id'))))
+        # the archive row has no tags or project either, they'd be lost on the way
+        .filter(project__isnull=True)
+        .exclude(Exists(TaskTag.objects.filter(task_id=OuterRef('id'))))
+    )
+
+
+def archive_batch(alias, days, batch_size):
+    """Move up to batch_size tasks to the archive, returns how many moved"""
+    with transaction.atomic(using=alias):
+        rows = list(
+            archivable(alias, days).order_by('id')
+            .select_for_update(skip_locked=True)
+            .values(*ArchivedTask.COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        archived_at = timezone.now()
+        ArchivedTask.objects.using(alias).bulk_create(
+            [ArchivedTask(archived_at=archived_at, **row) for row in rows]
+        )
+        Task.objects.using(alias).filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def restore_task(user, task_id):
+    """
+    Move an archived task back to the task table with its old id
+    Returns the Task, None if there's no such archived task
+    Raises IntegrityError if the user has a task with that title again
+    """
+    shard = shard_for_user(user.pk)
+    with transaction.atomic(using=shard):
+        try:
+            archived = ArchivedTask.objects.for_user(user).select_for_update().get(id=task_id)
+        except ArchivedTask.DoesNotExist:
+            return None
+        task = Task(**{column: getattr(archived, column) for column in ArchivedTask.COLUMNS})
+        # a new version, so no cached representation of the old row is served
+        task.updated_at = timezone.now()
+        task.rank = ranking.rank_for_new(shard, task)
+        # raw save like loaddata, keeps created_at as it was
+        task.save_base(raw=True, force_insert=True, using=shard)
+        archived.delete()
+    return task
@@ -0,0 +1,144 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+from .models import Task, Category
+
+# Title autocomplete - each worker keeps a small prefix index per active user
+# Built on a user's first lookup, kept current by the save/delete hooks
+# below and dropped least-recently-used first when too many users are loaded.
+# Changes made by other processes show up once an index is rebuilt
+# (after AUTOCOMPLETE_MAX_AGE seconds).
+
+
+def _keys(title):
+    """Lowercased title from the start of every word - 'Buy milk' -> 'buy milk', 'milk'"""
+    text = ' '.join(title.lower().split())
+    keys = [text]
+    for position, char in enumerate(text):
+        if char == ' ':
+            keys.append(text[position + 1:])
+    return keys
+
+
+class PrefixIndex:
+    """Sorted (key, kind, id) entries of one user's task and category titles"""
+
+    def __init__(self):
+        self.entries = []
+        self.titles = {}
+        self.built_at = time.monotonic()
+
+    def load(self, items):
+        """Add (kind, id, title) items not in the index yet - one sort instead of an insort per key"""
+        for kind, item_id, title in items:
+            self.titles[kind, item_id] = title
+            self.entries.extend((key, kind, item_id) for key in _keys(title))
+        self.entries.sort()
+
+    def add(self, kind, item_id, title):
+        self.remove(kind, item_id)
+        self.titles[kind, item_id] = title
+        for key in _keys(title):
+            bisect.insort(self.entries, (key, kind, item_id))
+
+    def remove(self, kind, item_id):
+        title = self.titles.pop((kind, item_id), None)
+        if title is None:
+            return
+        for key in _keys(title):
+            position = bisect.bisect_left(self.entries, (key, kind, item_id))
+            if position < len(self.entries) and self.entries[position] == (key, kind, item_id):
+                del self.entries[position]
+
+    def search(self, prefix, limit):
+        """Titles starting with the prefix first, then ones with a word starting with it"""
+        prefix = ' '.join(prefix.lower().split())
+        start = bisect.bisect_left(self.entries, (prefix,))
+        leading, inner, seen = [], [], set()
+        for key, kind, item_id in self.entries[start:]:
+            if not key.startswith(prefix):
+                break
+            if (kind, item_id) in seen:
+                continue
+            seen.add((kind, item_id))
+            title = self.titles[kind, item_id]
+            match = {'type': kind, 'id': item_id, 'title': title}
+            (leading if ' '.join(title.lower().split()) == key else inner).append(match)
+            if len(leading) >= limit:
+                break
+        return (leading + inner)[:limit]
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def build_index(user_id):
+    index = PrefixIndex()
+    # stored occurrences repeat their series' title, only the series is listed
+    tasks = Task.objects.for_user(user_id).filter(recurrence_parent__isnull=True)
+    index.load(('task', task_id, title) for task_id, title in tasks.values_list('id', 'title').iterator())
+    index.load(('category', category_id, name)
+               for category_id, name in Category.objects.for_user(user_id).values_list('id', 'name'))
+    return index
+
+
+def index_for_user(user_id):
+    """The user's index, built (and the oldest others evicted) if needed"""
+    with _lock:
+        index = _indexes.get(user_id)
+        if index is not None and time.monotonic() - index.built_at < settings.AUTOCOMPLETE_MAX_AGE:
+            _indexes.move_to_end(user_id)
+            metrics.record_cache('autocomplete', True)
+            return index
+    metrics.record_cache('autocomplete', False)
+
+    # build outside the lock, other users' lookups don't have to wait
+    index = build_index(user_id)
+    with _lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.AUTOCOMPLETE_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def suggest(user_id, prefix, limit):
+    index = index_for_user(user_id)
+    with _lock:
+        return index.search(prefix, limit)
+
+
+def _loaded(user_id):
+    return _indexes.get(user_id)
+
+
+def item_saved(kind, item_id, user_id, title):
+    """Keep a loaded index current after a task/category was created or renamed"""
+    with _lock:
+        index = _loaded(user_id)
+        if index is not None:
+            index.add(kind, item_id, title)
+
+
+def item_deleted(kind, item_id, user_id):
+    with _lock:
+        index = _loaded(user_id)
+        if index is not None:
+            index.remove(kind, item_id)
+
+
+def forget_user(user_id):
+    """Drop a user's index after changes that skip the hooks (bulk inserts)"""
+    with _lock:
+        _indexes.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _indexes.clear()
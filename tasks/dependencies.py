@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import Task, TaskDependency
+
+# Task dependencies - "blocked by" edges between one user's tasks
+#
+# New edges are checked for loops with one recursive query that only walks
+# what the new blocker can reach, never the whole graph.
+# Task.dependency_level keeps every task above all of its blockers, so
+# sort_by=topological is a plain indexed ORDER BY. Adding an edge only
+# re-levels the tasks below it. Removing one through remove_dependency
+# lowers them again. Edges deleted along with a task leave the levels
+# as they were, which is still a valid order.
+
+
+class DependencyError(Exception):
+    pass
+
+
+def creates_cycle(db, task_id, depends_on_id):
+    """
+    Would "task_id is blocked by depends_on_id" close a loop?
+    Only if task_id can already be reached from depends_on_id along
+    "blocked by" edges
+    """
+    if task_id == depends_on_id:
+        return True
+    connection = connections[db]
+    table = connection.ops.quote_name(TaskDependency._meta.db_table)
+    # UNION (not UNION ALL) drops tasks already reached, so shared blockers are walked once
+    sql = f"""
+        WITH RECURSIVE reachable(id) AS (
+            SELECT depends_on_id FROM {table} WHERE task_id = %s
+            UNION
+            SELECT edge.depends_on_id FROM {table} edge JOIN reachable ON edge.task_id = reachable.id
+        )
+        SELECT 1 FROM reachable WHERE id = %s LIMIT 1
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [depends_on_id, task_id])
+        return cursor.fetchone() is not None
+
+
+def relevel(db, task_ids):
+    """
+    Recompute dependency_level for these tasks from their blockers, then for
+    the tasks below any level that changed. Only the affected part of the
+    graph is read, one round of queries per step down
+    """
+    edges = TaskDependency.objects.using(db)
+    tasks = Task.objects.using(db)
+    frontier = set(task_ids)
+    while frontier:
+        wanted = dict.fromkeys(frontier, 0)
+        wanted.update(
+            (task_id, top + 1) for task_id, top in
+            edges.filter(task_id__in=frontier).values('task_id')
+            .annotate(top=Max('depends_on__dependency_level')).values_list('task_id', 'top')
+        )
+        changed = defaultdict(list)
+        for task_id, level in tasks.filter(id__in=frontier).values_list('id', 'dependency_level'):
+            if wanted[task_id] != level:
+                changed[wanted[task_id]].append(task_id)
+        for level, ids in changed.items():
+            # a new updated_at too, the level is part of the task's representation
+            tasks.filter(id__in=ids).update(dependency_level=level, updated_at=timezone.now())
+        moved = [task_id for ids in changed.values() for task_id in ids]
+        frontier = set(edges.filter(depends_on_id__in=moved).values_list('task_id', flat=True)) if moved else set()
+
+
+def add_dependency(task, depends_on):
+    """Make task blocked by depends_on (both the same user's), returns the edge"""
+    db = task._state.db
+    # one dependency change per user at a time - two concurrent edges
+    # could otherwise each pass the check and close a loop together
+    with transaction.atomic(using='default'), transaction.atomic(using=db):
+        User.objects.select_for_update().filter(id=task.user_id).first()
+        existing = TaskDependency.objects.using(db).filter(task_id=task.id, depends_on_id=depends_on.id).first()
+        if existing is not None:
+            return existing
+        if creates_cycle(db, task.id, depends_on.id):
+            raise DependencyError('This would make the tasks block each other')
+        edge = TaskDependency.objects.using(db).create(
+            user_id=task.user_id, task_id=task.id, depends_on_id=depends_on.id
+        )
+        relevel(db, [task.id])
+    return edge
+
+
+def remove_dependency(user, task_id, depends_on_id):
+    """Delete one edge, returns False if there was none"""
+    edges = TaskDependency.objects.for_user(user)
+    with transaction.atomic(using=edges.db):
+        deleted, _ = edges.filter(task_id=task_id, depends_on_id=depends_on_id).delete()
+        if deleted:
+            relevel(edges.db, [task_id])
+    return bool(deleted)
+
+
+def ready(queryset):
+    """Pending tasks none of whose blockers are still pending"""
+    blocked = TaskDependency.objects.using(queryset.db).filter(
+        task_id=OuterRef('id'), depends_on__status='pending'
+    )
+    return queryset.filter(status='pending').filter(~Exists(blocked))
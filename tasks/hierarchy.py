@@ -0,0 +1,145 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Task, TaskClosure
+
+# Subtask trees - TaskClosure holds every (ancestor, descendant) pair, and
+# each task stores how many of its descendants exist / are completed.
+# Both are updated here so reads never walk the tree level by level.
+# Changed counters or parents bump updated_at, the task looks different
+# (tasks.representations caches tasks by it).
+
+
+class HierarchyError(Exception):
+    pass
+
+
+def _bump_counts(db, changes):
+    """
+    Add to the subtask counters of some tasks
+    changes: {task id: (count delta, completed delta)} - one UPDATE per distinct delta
+    """
+    by_delta = defaultdict(list)
+    for task_id, delta in changes.items():
+        if delta != (0, 0):
+            by_delta[delta].append(task_id)
+    for (count, completed), task_ids in by_delta.items():
+        Task.objects.using(db).filter(id__in=task_ids).update(
+            subtask_count=F('subtask_count') + count,
+            subtask_completed_count=F('subtask_completed_count') + completed,
+            updated_at=timezone.now(),
+        )
+
+
+def ancestor_ids(db, task_id):
+    """{ancestor id: depth} of a task, its parent is at depth 1"""
+    rows = TaskClosure.objects.using(db).filter(descendant_id=task_id).values_list('ancestor_id', 'depth')
+    return dict(rows)
+
+
+def _link(db, user_id, members, parent_id, size, completed):
+    """Hang members ({task id: depth below the moved task}) under parent_id"""
+    ancestors = {parent_id: 0}
+    ancestors.update(ancestor_ids(db, parent_id))
+    TaskClosure.objects.using(db).bulk_create([
+        TaskClosure(user_id=user_id, ancestor_id=ancestor, descendant_id=member, depth=up + 1 + down)
+        for ancestor, up in ancestors.items()
+        for member, down in members.items()
+    ])
+    _bump_counts(db, {ancestor: (size, completed) for ancestor in ancestors})
+
+
+def attach(task):
+    """Closure rows and ancestor counters for a newly created subtask"""
+    if task.parent_id is None:
+        return
+    db = task._state.db
+    with transaction.atomic(using=db):
+        _link(db, task.user_id, {task.id: 0}, task.parent_id, 1, int(task.status == 'completed'))
+
+
+def move(task, parent_id):
+    """
+    Move a task and its whole subtree under another parent (None = top level)
+    Only the links between the subtree and its old/new ancestors change
+    """
+    db = task._state.db
+    with transaction.atomic(using=db):
+        current = (
+            Task.objects.using(db).select_for_update()
+            .values('parent_id', 'status', 'subtask_count', 'subtask_completed_count')
+            .get(id=task.id)
+        )
+        if current['parent_id'] == parent_id:
+            return
+        members = {task.id: 0}
+        members.update(
+            TaskClosure.objects.using(db).filter(ancestor_id=task.id).values_list('descendant_id', 'depth')
+        )
+        if parent_id in members:
+            raise HierarchyError("A task can't be moved under itself or one of its subtasks")
+
+        size = 1 + current['subtask_count']
+        completed = current['subtask_completed_count'] + int(current['status'] == 'completed')
+
+        old_ancestors = ancestor_ids(db, task.id)
+        if old_ancestors:
+            TaskClosure.objects.using(db).filter(
+                descendant_id__in=members, ancestor_id__in=old_ancestors
+            ).delete()
+            _bump_counts(db, {ancestor: (-size, -completed) for ancestor in old_ancestors})
+        if parent_id is not None:
+            _link(db, task.user_id, members, parent_id, size, completed)
+        Task.objects.using(db).filter(id=task.id).update(parent_id=parent_id, updated_at=timezone.now())
+    task.parent_id = parent_id
+
+
+def detach_deleted(task):
+    """Take a task that's being deleted off its ancestors' counters"""
+    if task.parent_id is None:
+        return
+    db = task._state.db
+    # its own subtasks are deleted with it and take themselves off the same way
+    _bump_counts(db, {
+        ancestor: (-1, -int(task.status == 'completed')) for ancestor in ancestor_ids(db, task.id)
+    })
+
+
+def status_changed(db, task_ids, completed):
+    """
+    Some subtasks were completed (completed=True) or reopened
+    One grouped query for the ancestors, then an UPDATE per distinct delta
+    """
+    if not task_ids:
+        return
+    sign = 1 if completed else -1
+    per_ancestor = (
+        TaskClosure.objects.using(db).filter(descendant_id__in=task_ids)
+        .order_by().values('ancestor_id').annotate(changed=Count('id'))
+    )
+    _bump_counts(db, {row['ancestor_id']: (0, sign * row['changed']) for row in per_ancestor})
+
+
+def subtree(task_id, queryset):
+    """
+    The task and all its subtasks in one query, nested as
+    (task, [(subtask, [...]), ...]) - the queryset decides columns and owner
+    """
+    below = TaskClosure.objects.using(queryset.db).filter(ancestor_id=task_id).values('descendant_id')
+    tasks = list(queryset.filter(Q(id=task_id) | Q(id__in=below)).order_by('created_at'))
+    children = defaultdict(list)
+    root = None
+    for task in tasks:
+        if task.id == task_id:
+            root = task
+        else:
+            children[task.parent_id].append(task)
+
+    def nest(task):
+        return task, [nest(child) for child in children[task.id]]
+
+    return nest(root) if root is not None else None
+
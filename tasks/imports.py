@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import autocomplete, rollups
+from .models import Task, Category, Project, TaskImport
+from .serializers import TaskCreateSerializer
+from .sharding import shard_for_user
+
+# Bulk task imports from CSV or NDJSON files
+# Rows are read one at a time and written in chunks, so a 50k row file
+# never has to fit in memory and progress can be polled while it runs
+#
+# Uploads are queued in TASK_IMPORT_DIR and run by the run_imports worker,
+# not the web worker that got them (gunicorn recycles those). An import
+# only moves forward while it is 'running' - once expire_stale() has
+# marked it failed, later writes of a slow run are dropped.
+
+IMPORT_CHUNK_SIZE = 500
+# only this many bad rows are kept with their errors (all are counted)
+MAX_STORED_ERRORS = 200
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def detect_format(file_name, requested=None):
+    """'csv' / 'ndjson' from an explicit format or the file extension, or None"""
+    if requested:
+        return requested if requested in ('csv', 'ndjson') else None
+    return FORMATS.get(os.path.splitext(file_name or '')[1].lower())
+
+
+def iter_rows(binary_file, file_format):
+    """
+    Yield (row number, dict or None, error) for each record of the file
+    CSV needs a header line, NDJSON is one JSON object per line
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for number, row in enumerate(reader, 1):
+            # extra cells end up under None, empty cells mean "not given"
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+        return
+
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, {'non_field_errors': ['Not valid JSON']}
+            continue
+        if not isinstance(row, dict):
+            yield number, None, {'non_field_errors': ['Each line must be a JSON object']}
+            continue
+        yield number, row, None
+
+
+class RowValidator:
+    """
+    TaskCreateSerializer rules for plain row dicts
+    One serializer is reused for every row, categories are looked up by
+    name in memory (and created the first time a new name shows up)
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.serializer = TaskCreateSerializer()
+        # category is mapped by name below, not by id, tags and subtasks aren't imported
+        for name in ('category', 'tags', 'parent'):
+            self.serializer.fields.pop(name)
+        # there's no request in the context, limit projects to the importer's own by hand
+        self.serializer.fields['project'].queryset = Project.objects.for_user(user)
+        tasks = Task.objects.for_user(user)
+        self.titles = set(tasks.filter(recurrence_parent__isnull=True).values_list('title', flat=True))
+        self.categories = dict(Category.objects.for_user(user).values_list('name', 'id'))
+
+    def category_id(self, name):
+        name = str(name).strip()
+        if name not in self.categories:
+            category, _ = Category.objects.get_or_create(user=self.user, name=name)
+            self.categories[name] = category.id
+        return self.categories[name]
+
+    def validate(self, row):
+        """Returns (Task, None) or (None, errors)"""
+        category = row.pop('category', None)
+        try:
+            data = self.serializer.run_validation(row)
+        except serializers.ValidationError as e:
+            return None, e.detail
+        if data['title'] in self.titles:
+            return None, {'title': ['You already have a task with this title']}
+        self.titles.add(data['title'])
+        if category not in (None, ''):
+            data['category_id'] = self.category_id(category)
+        return Task(user_id=self.user.id, **data), None
+
+
+class ImportStopped(Exception):
+    """The import was marked failed (expire_stale) while it ran"""
+
+
+def _running(task_import):
+    return TaskImport.objects.using(task_import._state.db).filter(id=task_import.id, status='running')
+
+
+def _flush(task_import, shard, tasks, new_errors):
+    """Insert one chunk and record the progress in the same transaction"""
+    with transaction.atomic(using=shard):
+        if tasks:
+            Task.objects.using(shard).bulk_create(tasks)
+        task_import.imported_count += len(tasks)
+        task_import.errors = (task_import.errors + new_errors)[:MAX_STORED_ERRORS]
+        updated = _running(task_import).update(
+            processed_rows=task_import.processed_rows, imported_count=task_import.imported_count,
+            error_count=task_import.error_count, errors=task_import.errors,
+        )
+        if not updated:
+            raise ImportStopped  # rolls this chunk back too
+    if tasks:
+        rollups.record_created(task_import.user_id, timezone.now(), count=len(tasks))
+        # bulk_create skips the save hooks, rebuild on the next lookup
+        autocomplete.forget_user(task_import.user_id)
+
+
+def run_import(task_import, binary_file):
+    """
+    Read the whole file into the user's tasks, updating task_import as it goes
+    The import must be 'running' already (created so, or claimed by the worker)
+    """
+    shard = shard_for_user(task_import.user_id)
+    try:
+        validator = RowValidator(task_import.user)
+        tasks, new_errors = [], []
+        for number, row, errors in iter_rows(binary_file, task_import.format):
+            task = None
+            if row is not None:
+                task, errors = validator.validate(row)
+            task_import.processed_rows += 1
+            if task is not None:
+                tasks.append(task)
+            else:
+                task_import.error_count += 1
+                new_errors.append({'row': number, 'errors': errors})
+            if task_import.processed_rows % IMPORT_CHUNK_SIZE == 0:
+                _flush(task_import, shard, tasks, new_errors)
+                tasks, new_errors = [], []
+        _flush(task_import, shard, tasks, new_errors)
+        task_import.status = 'done'
+    except ImportStopped:
+        pass
+    except Exception as e:
+        # rows from finished chunks stay imported
+        task_import.status = 'failed'
+        task_import.message = str(e)
+    task_import.finished_at = timezone.now()
+    _running(task_import).update(
+        status=task_import.status, message=task_import.message, finished_at=task_import.finished_at
+    )
+    # whatever got recorded - failed stays failed
+    task_import.refresh_from_db()
+    return task_import
+
+
+def expire_stale(task_imports):
+    """
+    Mark imports that are still pending/running after TASK_IMPORT_TIMEOUT_MINUTES
+    as failed - the run_imports worker isn't running or died on them. That
+    is final, a run that is still going stops at its next chunk. Returns how many.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(minutes=settings.TASK_IMPORT_TIMEOUT_MINUTES)
+    return task_imports.filter(status__in=['pending', 'running'], created_at__lt=cutoff).update(
+        status='failed', finished_at=now,
+        message='Stopped before it finished - rows imported so far were kept, upload the rest again',
+    )
+
+
+def queued_path(task_import):
+    """Where an uploaded file waits for the run_imports worker"""
+    return Path(settings.TASK_IMPORT_DIR) / f'{task_import.id}.{task_import.format}'
+
+
+def run_queued(task_import):
+    """
+    Run a pending upload from TASK_IMPORT_DIR (run_imports worker)
+    Returns False when it isn't there yet or another worker took it
+    """
+    path = queued_path(task_import)
+    if not path.exists():
+        return False  # still being written
+    claimed = TaskImport.objects.using(task_import._state.db).filter(
+        id=task_import.id, status='pending'
+    ).update(status='running')
+    if not claimed:
+        return False
+    task_import.status = 'running'
+    try:
+        with open(path, 'rb') as binary_file:
+            run_import(task_import, binary_file)
+    finally:
+        os.remove(path)
+    return True
+
+
+def start_import(user, upload, file_format):
+    """
+    Create the TaskImport for an uploaded file and run it
+    With TASK_IMPORT_ASYNC the upload is queued for the run_imports
+    worker, otherwise it runs right here
+    """
+    if not settings.TASK_IMPORT_ASYNC:
+        task_import = TaskImport.objects.create(
+            user=user, file_name=upload.name or '', format=file_format, status='running'
+        )
+        return run_import(task_import, upload.file)
+
+    task_import = TaskImport.objects.create(user=user, file_name=upload.name or '', format=file_format)
+    os.makedirs(settings.TASK_IMPORT_DIR, exist_ok=True)
+    # the upload itself is cleaned up when the request ends - copy it, then
+    # rename so the worker never sees half a file
+    with tempfile.NamedTemporaryFile(dir=settings.TASK_IMPORT_DIR, suffix='.part', delete=False) as copy:
+        shutil.copyfileobj(upload.file, copy)
+    os.replace(copy.name, queued_path(task_import))
+    return task_import
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.archive import archivable, archive_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Move tasks completed more than --days ago to the archive table, '
+        'in batches so the task table is never locked for long. '
+        'Archived tasks show up with ?archived=true and can be restored by id.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TASK_ARCHIVE_AFTER_DAYS,
+                            help=f'Default {settings.TASK_ARCHIVE_AFTER_DAYS} (TASK_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would move')
+
+    def handle(self, *args, **options):
+        total = 0
+        for alias in settings.TASK_SHARDS:
+            if options['dry_run']:
+                count = archivable(alias, options['days']).count()
+                self.stdout.write(f'{alias}: {count} tasks would be archived')
+                total += count
+                continue
+            moved = 0
+            while True:
+                batch = archive_batch(alias, options['days'], options['batch_size'])
+                if not batch:
+                    break
+                moved += batch
+                self.stdout.write(f'{alias}: {moved} archived so far')
+            total += moved
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} tasks'))
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from tasks.models import Task, TaskDailyRollup, CompletionTimeRollup
+from tasks.rollups import duration_bucket, rollup_day
+from tasks.sharding import shard_for_user
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the analytics rollups from the task table. '
+        'Reopen history is not stored on tasks, so only current completions can be rebuilt.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild this user id')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        total = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            total += self.backfill_user(user_id, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} rollup rows'))
+
+    def backfill_user(self, user_id, batch_size):
+        shard = shard_for_user(user_id)
+        tasks = Task.objects.for_user(user_id).order_by()
+
+        days = {}
+        created = (
+            tasks.annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(count=Count('id'))
+        )
+        for row in created:
+            days[row['day']] = TaskDailyRollup(user_id=user_id, day=row['day'], created_count=row['count'])
+
+        # completion times need both timestamps of every row, stream them
+        buckets = Counter()
+        completed = tasks.filter(status='completed', completed_at__isnull=False)
+        for created_at, completed_at in completed.values_list('created_at', 'completed_at').iterator(batch_size):
+            day = rollup_day(completed_at)
+            days.setdefault(day, TaskDailyRollup(user_id=user_id, day=day)).completed_count += 1
+            buckets[day, duration_bucket(created_at, completed_at)] += 1
+
+        with transaction.atomic(using=shard):
+            TaskDailyRollup.objects.for_user(user_id).delete()
+            CompletionTimeRollup.objects.for_user(user_id).delete()
+            TaskDailyRollup.objects.using(shard).bulk_create(days.values(), batch_size=batch_size)
+            CompletionTimeRollup.objects.using(shard).bulk_create([
+                CompletionTimeRollup(user_id=user_id, day=day, bucket=bucket, count=count)
+                for (day, bucket), count in buckets.items()
+            ], batch_size=batch_size)
+        return len(days) + len(buckets)
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.imports import detect_format, run_import
+from tasks.models import TaskImport
+
+
+class Command(BaseCommand):
+    help = (
+        'Import tasks for a user from a CSV (with a header line) or NDJSON file. '
+        'Rows are validated like the create API and written in chunks, '
+        'progress shows up under /api/tasks/import/ like uploaded imports.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file')
+        parser.add_argument('--user', required=True, help='Username or id of the owner')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension')
+
+    def handle(self, *args, **options):
+        lookup = {'id': options['user']} if options['user'].isdigit() else {'username': options['user']}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        file_format = detect_format(options['path'], options['format'])
+        if file_format is None:
+            raise CommandError('Unknown file type - pass --format csv or --format ndjson')
+
+        try:
+            binary_file = open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        with binary_file:
+            task_import = TaskImport.objects.create(
+                user=user, file_name=options['path'], format=file_format, status='running'
+            )
+            run_import(task_import, binary_file)
+
+        for error in task_import.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        summary = (
+            f'{task_import.imported_count} tasks imported, {task_import.error_count} rows skipped '
+            f'(import {task_import.id})'
+        )
+        if task_import.status == 'failed':
+            raise CommandError(f'{summary} - failed: {task_import.message}')
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.ranking import long_columns, rebalance_column
+
+
+class Command(BaseCommand):
+    help = (
+        'Give board columns whose manual order ranks got long (or that have '
+        'unranked tasks from imports) evenly spaced short ranks again, keeping '
+        'their order. Meant for cron - moves only ever write one row, this '
+        'is where the ranks get tidied up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length', type=int, default=settings.TASK_RANK_REBALANCE_LENGTH,
+                            help=f'Default {settings.TASK_RANK_REBALANCE_LENGTH} (TASK_RANK_REBALANCE_LENGTH)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the columns')
+
+    def handle(self, *args, **options):
+        columns = tasks = 0
+        for alias in settings.TASK_SHARDS:
+            found = list(long_columns(alias, options['length']))
+            if options['dry_run']:
+                self.stdout.write(f'{alias}: {len(found)} columns would be rebalanced')
+                columns += len(found)
+                continue
+            for user_id, status, category_id in found:
+                tasks += rebalance_column(alias, user_id, status, category_id)
+            columns += len(found)
+            self.stdout.write(f'{alias}: {len(found)} columns rebalanced')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Rebalanced {columns} columns ({tasks} tasks)'))
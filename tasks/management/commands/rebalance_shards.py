@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from tasks.models import Task
+from tasks.sharding import SHARD_CACHE_SECONDS, move_user, project_group, project_groups, shard_for_user
+
+
+class Command(BaseCommand):
+    help = (
+        'Move users between the TASK_SHARDS databases. Either one user (--user/--to) '
+        'or, by default, the biggest users off the fullest shards until task counts even out. '
+        'Users sharing team projects always move together. '
+        f'Web workers follow a move within {SHARD_CACHE_SECONDS}s, so run it when traffic is low.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of a single user to move')
+        parser.add_argument('--to', help='Target shard alias for --user')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed spread between shards as a fraction of the average (default 0.1)')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the planned moves')
+
+    def handle(self, *args, **options):
+        shards = settings.TASK_SHARDS
+        if len(shards) < 2:
+            raise CommandError('Sharding is off - set TASK_SHARDS to two or more database aliases')
+
+        if options['user'] or options['to']:
+            if not (options['user'] and options['to']):
+                raise CommandError('--user and --to go together')
+            if options['to'] not in shards:
+                raise CommandError(f"{options['to']} is not one of TASK_SHARDS: {', '.join(shards)}")
+            moves = [(options['user'], options['to'])]
+        else:
+            moves = self.plan_moves(shards, options['tolerance'])
+
+        if not moves:
+            self.stdout.write('Shards are already balanced')
+            return
+
+        for user_id, target in moves:
+            try:
+                user = User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                raise CommandError(f'User {user_id} does not exist')
+            source = shard_for_user(user_id)
+            others = len(project_group(user_id)) - 1
+            who = f'user {user_id}' + (f' and {others} users sharing projects with them' if others else '')
+            if options['dry_run']:
+                self.stdout.write(f'Would move {who}: {source} -> {target}')
+                continue
+            moved = move_user(user, target)
+            self.stdout.write(self.style.SUCCESS(f'Moved {who}: {source} -> {target} ({moved} rows)'))
+
+    def plan_moves(self, shards, tolerance):
+        """
+        Greedy plan: repeatedly move the user that best evens the fullest and emptiest shard
+        Users sharing projects count as one, move_user takes the whole group along
+        """
+        users = {}
+        for alias in shards:
+            sizes = Task.objects.using(alias).order_by().values('user_id').annotate(count=Count('id'))
+            groups = project_groups(alias)
+            users[alias] = {}
+            for row in sizes:
+                group = groups.get(row['user_id'], frozenset([row['user_id']]))
+                users[alias][group] = users[alias].get(group, 0) + row['count']
+        loads = {alias: sum(users[alias].values()) for alias in shards}
+        average = sum(loads.values()) / len(shards)
+
+        moves = []
+        while True:
+            fullest = max(shards, key=loads.get)
+            emptiest = min(shards, key=loads.get)
+            gap = loads[fullest] - loads[emptiest]
+            if gap <= max(tolerance * average, 1):
+                break
+            # a user smaller than the gap makes both shards closer to even
+            candidates = [(count, group) for group, count in users[fullest].items() if count < gap]
+            if not candidates:
+                break
+            count, group = min(candidates, key=lambda c: (abs(gap / 2 - c[0]), min(c[1])))
+            moves.append((min(group), emptiest))
+            del users[fullest][group]
+            users[emptiest][group] = count
+            loads[fullest] -= count
+            loads[emptiest] += count
+        return moves
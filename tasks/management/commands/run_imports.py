@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks.imports import run_queued
+from tasks.models import TaskImport
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the task imports uploaded to /api/tasks/import/ (queued in TASK_IMPORT_DIR), '
+        'oldest first. Runs until stopped, looking for new uploads every --interval seconds. '
+        'Keep one running next to the web workers - more are fine, each import is '
+        'claimed by one of them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Sleep between looks for new uploads (default 2s)')
+        parser.add_argument('--once', action='store_true', help='Run what is queued now and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            ran = 0
+            for alias in settings.TASK_SHARDS:
+                pending = TaskImport.objects.using(alias).filter(status='pending').order_by('created_at')
+                for task_import in pending:
+                    if run_queued(task_import):
+                        ran += 1
+                        self.stdout.write(
+                            f'Import {task_import.id}: {task_import.status}, '
+                            f'{task_import.imported_count} tasks imported'
+                        )
+            self.remove_leftovers()
+            if options['once']:
+                break
+            if not ran:
+                # long sleeps shouldn't hold database connections open
+                connections.close_all()
+                time.sleep(options['interval'])
+
+    def remove_leftovers(self):
+        """Files of uploads that expired before a worker got to them (failed long since)"""
+        if not os.path.isdir(settings.TASK_IMPORT_DIR):
+            return
+        cutoff = time.time() - settings.TASK_IMPORT_TIMEOUT_MINUTES * 60 * 2
+        for entry in os.scandir(settings.TASK_IMPORT_DIR):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
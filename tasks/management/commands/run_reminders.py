@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks.reminders import ReminderScheduler, get_sink
+
+
+class Command(BaseCommand):
+    help = (
+        'Send due date reminders (TASK_REMINDER_LEAD_HOURS before the due date) '
+        'through TASK_REMINDER_SINK. Runs until stopped, sleeping until the next '
+        'reminder or --interval seconds, whichever comes first. Safe to restart - '
+        'sent reminders are recorded on the tasks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=30,
+                            help='Longest sleep between looks for changed tasks (default 30s)')
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit')
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(get_sink())
+        while True:
+            sent = scheduler.run_once()
+            if sent:
+                self.stdout.write(f'Sent {sent} reminders')
+            if options['once']:
+                break
+            wait = scheduler.seconds_until_next()
+            # long sleeps shouldn't hold database connections open
+            connections.close_all()
+            time.sleep(options['interval'] if wait is None else min(wait, options['interval']))
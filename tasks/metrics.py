@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # not on Windows - only gunicorn runs several processes anyway
+    fcntl = None
+
+# Prometheus metrics added up across all gunicorn workers
+#
+# Every process counts in memory (a dict update under a lock) and writes
+# its totals to METRICS_DIR/<pid>.json at most every METRICS_FLUSH_SECONDS.
+# /metrics adds up all the files. When gunicorn reaps a worker,
+# merge_dead_process() folds its file into dead.json so the totals never
+# go backwards and the directory doesn't fill up with recycled workers.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by URL name, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'db_queries_total': ('counter', 'Database queries run by requests, by URL name'),
+    'cache_requests_total': ('counter', 'In-process cache lookups by cache and hit/miss'),
+    'cache_evictions_total': ('counter', 'Entries dropped from full in-process caches'),
+    'auth_tokens_active': ('gauge', 'API tokens that currently exist'),
+}
+
+DEAD_FILE = 'dead.json'
+
+
+class Registry:
+    """This process's counters and histograms, keyed by (name, sorted labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        # bucket counts (last one is +Inf), then sum
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+
+    def _check_fork(self):
+        # workers forked from a preloaded master start with its numbers
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            position = len(LATENCY_BUCKETS)
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    position = index
+                    break
+            histogram[position] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def flush(self):
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(directory / f'{os.getpid()}.json', self.snapshot())
+        self.flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+
+registry = Registry()
+
+
+def _write(path, data):
+    # write then rename, readers never see half a file
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+@contextmanager
+def _locked(exclusive):
+    """Readers share the lock, merging a dead worker's file takes it alone"""
+    if fcntl is None:
+        yield
+        return
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def record_request(view, method, status_code, seconds, queries):
+    registry.inc('http_requests_total', view=view, method=method, status=str(status_code))
+    registry.observe('http_request_duration_seconds', seconds, view=view)
+    if queries:
+        registry.inc('db_queries_total', queries, view=view)
+    registry.maybe_flush()
+
+
+def record_cache(cache, hit):
+    registry.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def record_eviction(cache, count=1):
+    registry.inc('cache_evictions_total', count, cache=cache)
+
+
+def _merge(total, data):
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(sorted(labels.items())))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for name, labels, values in data.get('histograms', []):
+        key = (name, tuple(sorted(labels.items())))
+        current = total['histograms'].get(key)
+        total['histograms'][key] = values if current is None else [a + b for a, b in zip(current, values)]
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}  # gone (merged) or unreadable since the listing
+
+
+def collect():
+    """Totals over every process (this one's latest numbers included)"""
+    registry.flush()
+    total = {'counters': {}, 'histograms': {}}
+    with _locked(exclusive=False):
+        for path in Path(settings.METRICS_DIR).glob('*.json'):
+            _merge(total, _read(path))
+    return total
+
+
+def merge_dead_process(pid):
+    """Fold a finished worker's numbers into dead.json (gunicorn child_exit)"""
+    directory = Path(settings.METRICS_DIR)
+    path = directory / f'{pid}.json'
+    if not path.exists():
+        return
+    with _locked(exclusive=True):
+        total = {'counters': {}, 'histograms': {}}
+        _merge(total, _read(directory / DEAD_FILE))
+        _merge(total, _read(path))
+        _write(directory / DEAD_FILE, {
+            'counters': [[name, dict(labels), value] for (name, labels), value in total['counters'].items()],
+            'histograms': [[name, dict(labels), values] for (name, labels), values in total['histograms'].items()],
+        })
+        path.unlink()
+
+
+def clear():
+    """Start from zero - gunicorn on_starting, and tests"""
+    directory = Path(settings.METRICS_DIR)
+    if directory.is_dir():
+        for path in directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+    registry.reset()
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in pairs]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total, gauges):
+    """Prometheus text format, gauges: {name: value} read at scrape time"""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'gauge':
+            if name in gauges:
+                lines.append(f'{name} {_number(gauges[name])}')
+            continue
+        if kind == 'counter':
+            for (metric, labels), value in sorted(total['counters'].items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (metric, labels), values in sorted(total['histograms'].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(values[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,232 @@
+import time
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from django.utils.regex_helper import _lazy_re_compile
+
+from . import metrics, profiling
+
+try:
+    import brotli
+except ImportError:  # optional - without it we only do gzip
+    brotli = None
+
+# Custom middleware for the API
+
+
+def api_path(request):
+    return request.path_info.startswith('/api/')
+
+
+# Accept-Encoding parsing: "gzip;q=0.8, br" -> {'gzip': 0.8, 'br': 1.0}
+_encoding_re = _lazy_re_compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def accepted_encodings(header):
+    encodings = {}
+    for part in header.split(','):
+        match = _encoding_re.match(part)
+        if match:
+            try:
+                encodings[match[1].lower()] = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+    return encodings
+
+
+def choose_encoding(header):
+    """Best encoding we can produce for this Accept-Encoding, or None"""
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0)
+    options = []
+    if brotli is not None:
+        options.append(('br', accepted.get('br', wildcard)))
+    options.append(('gzip', accepted.get('gzip', wildcard)))
+    # brotli wins ties, it's smaller for JSON
+    best, quality = max(options, key=lambda option: option[1])
+    return best if quality > 0 else None
+
+
+class _Gzip:
+    def __init__(self, level):
+        # wbits 31 = gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def chunk(self, data):
+        # sync flush so every streamed chunk reaches the client right away
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def chunk(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def compressor(encoding):
+    if encoding == 'br':
+        return _Brotli(settings.API_COMPRESSION_BROTLI_QUALITY)
+    return _Gzip(settings.API_COMPRESSION_GZIP_LEVEL)
+
+
+def compress_body(encoding, data):
+    codec = compressor(encoding)
+    return codec.compress(data) + codec.finish()
+
+
+def compress_stream(encoding, chunks):
+    codec = compressor(encoding)
+    for data in chunks:
+        if data:
+            yield codec.chunk(data)
+    yield codec.finish()
+
+
+class ApiCompressionMiddleware:
+    """
+    Compress /api/ responses with brotli or gzip, whichever the client prefers
+    Bodies under API_COMPRESSION_MIN_SIZE bytes are sent as they are,
+    streaming responses are compressed chunk by chunk as they are produced
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not api_path(request) or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(encoding, response.streaming_content)
+            # length isn't known up front any more
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.API_COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compress_body(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # same body under another encoding isn't byte-identical any more
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile one request when staff ask for it (X-Profile header or ?_profile=1)
+    Only views in tasks.profiling.PROFILED_MODULES, the profile's name comes
+    back in the X-Profile-Id header. Must be the last middleware, it runs
+    the view itself
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not profiling.requested(request):
+            return None  # the normal case - nothing else is looked at
+        if view_func.__module__ not in profiling.PROFILED_MODULES or not profiling.is_staff(request):
+            return None
+        response, name = profiling.profile_call(request, view_func, view_args, view_kwargs)
+        response.headers['X-Profile-Id'] = name
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Count requests, their latency and database queries per URL name
+    (tasks.metrics, served on /metrics). First in MIDDLEWARE so the
+    time spent in the other middleware counts too
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        metrics.record_request(view, request.method, response.status_code, elapsed, queries)
+        return response
+
+
+class BrowserMiddleware:
+    """
+    Run settings.BROWSER_MIDDLEWARE (sessions, CSRF, auth, messages,
+    clickjacking) for the HTML pages and the admin only
+    /api/ requests authenticate with tokens and go straight past them.
+    The inner middleware is chained like Django chains MIDDLEWARE, their
+    process_view hooks (CSRF) are run from ours
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.view_hooks = []
+        handler = get_response
+        for path in reversed(settings.BROWSER_MIDDLEWARE):
+            middleware = import_string(path)(handler)
+            if hasattr(middleware, 'process_view'):
+                self.view_hooks.insert(0, middleware.process_view)
+            handler = convert_exception_to_response(middleware)
+        self.browser_chain = handler
+
+    def __call__(self, request):
+        if api_path(request):
+            return self.get_response(request)
+        return self.browser_chain(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if api_path(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
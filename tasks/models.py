@@ -1,12 +1,126 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import sql
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date
+from .sharding import shard_for_user
 
 # Task model for our task management system
 # Simple task tracker with basic CRUD operations
 # Django models with user relationships
 
+def _owner_id(values):
+    """user id from create() style keyword arguments"""
+    if 'user_id' in values:
+        return values['user_id']
+    user = values.get('user')
+    return user.pk if user is not None else None
+
+def _can_update_returning(connection):
+    # UPDATE ... RETURNING: postgres, and sqlite from 3.35 (same check django uses for INSERT)
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+    )
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet for rows that live on their owner's shard
+    Use for_user() to read, creating finds the shard from the user field
+    """
+    def for_user(self, user):
+        user_id = getattr(user, 'pk', user)
+        return self.using(shard_for_user(user_id)).filter(user_id=user_id)
+    
+    def _owner_shard(self, values):
+        if self._db is None:
+            user_id = _owner_id(values)
+            if user_id is not None:
+                return shard_for_user(user_id)
+        return None
+    
+    def create(self, **kwargs):
+        shard = self._owner_shard(kwargs)
+        if shard:
+            return self.using(shard).create(**kwargs)
+        return super().create(**kwargs)
+    
+    def get_or_create(self, defaults=None, **kwargs):
+        shard = self._owner_shard(kwargs)
+        if shard:
+            return self.using(shard).get_or_create(defaults=defaults, **kwargs)
+        return super().get_or_create(defaults=defaults, **kwargs)
+    
+    def update_or_create(self, defaults=None, **kwargs):
+        shard = self._owner_shard(kwargs)
+        if shard:
+            return self.using(shard).update_or_create(defaults=defaults, **kwargs)
+        return super().update_or_create(defaults=defaults, **kwargs)
+    
+    def update_and_fetch(self, **kwargs):
+        """
+        update() that also hands back the updated rows as model objects
+        A single UPDATE ... RETURNING where the database supports it,
+        otherwise UPDATE then SELECT of the locked rows in one transaction
+        """
+        self._for_write = True
+        db = self.db
+        connection = connections[db]
+        if not _can_update_returning(connection):
+            with transaction.atomic(using=db, savepoint=False):
+                ids = list(self.select_for_update().values_list('pk', flat=True))
+                rows = self.model._base_manager.using(db).filter(pk__in=ids)
+                rows.update(**kwargs)
+                return list(rows)
+        
+        query = self.query.chain(sql.UpdateQuery)
+        query.add_update_values(kwargs)
+        query.annotations = {}
+        update_sql, params = query.get_compiler(db).as_sql()
+        
+        meta = self.model._meta
+        fields = meta.concrete_fields
+        columns = [field.get_col(meta.db_table) for field in fields]
+        converters = [
+            connection.ops.get_db_converters(col) + field.get_db_converters(connection)
+            for field, col in zip(fields, columns)
+        ]
+        returning = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with transaction.mark_for_rollback_on_error(using=db), connection.cursor() as cursor:
+            cursor.execute(f'{update_sql} RETURNING {returning}', params)
+            rows = cursor.fetchall()
+        
+        objs = []
+        for row in rows:
+            values = list(row)
+            for index, (col, field_converters) in enumerate(zip(columns, converters)):
+                for converter in field_converters:
+                    values[index] = converter(values[index], col, connection)
+            objs.append(self.model.from_db(db, [field.attname for field in fields], values))
+        return objs
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        by_shard = {}
+        for obj in objs:
+            by_shard.setdefault(shard_for_user(obj.user_id), []).append(obj)
+        created = []
+        for shard, shard_objs in by_shard.items():
+            created += self.using(shard).bulk_create(shard_objs, *args, **kwargs)
+        return created
+
+class ShardedManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """Marks a model as sharded by user - see tasks.routers.ShardRouter"""
+    pass
+
+class UserShard(models.Model):
+    """Which database alias holds a user's rows (only used when sharding is on)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=100)
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
+
 class Category(models.Model):
     """Task categories like Work, Personal, etc."""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
@@ -14,6 +128,8 @@ class Category(models.Model):
     color = models.CharField(max_length=7, default='#007bff', help_text="Hex color code")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ShardedManager()
+    
     class Meta:
         unique_together = ['user', 'name']
         verbose_name_plural = 'Categories'
@@ -21,6 +137,45 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+class Project(models.Model):
+    """
+    A team project - the owner's tasks in it are shared with its members
+    Lives on the owner's shard together with its tasks and memberships
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects')  # the owner
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ['user', 'name']
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.user.username})"
+
+class ProjectMembership(models.Model):
+    """Someone other than the owner who can read (or also edit) a project's tasks"""
+    ROLE_CHOICES = [
+        ('read', 'Read'),
+        ('edit', 'Edit'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')  # the project owner (shard key)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='memberships')
+    member = models.ForeignKey(User, on_delete=models.CASCADE, related_name='project_memberships')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='read')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        constraints = [
+            # (member, project) order so "projects I'm in" subqueries only read this index
+            models.UniqueConstraint(fields=['member', 'project'], name='project_membership_unique'),
+        ]
+
 class Task(models.Model):
     # Priority choices - keeping it simple
     PRIORITY_CHOICES = [
@@ -35,6 +190,16 @@ class Task(models.Model):
         ('completed', 'Completed'),
     ]
     
+    # Recurrence - occurrences are worked out on the fly (see tasks/recurrence.py),
+    # a row is only stored once an occurrence is edited or completed
+    RECURRENCE_CHOICES = [
+        ('', 'Does not repeat'),
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('custom', 'Custom weekdays'),
+    ]
+    
     # User association - each task belongs to a user
     # CASCADE means: if user gets deleted, delete all their tasks too
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tasks')
@@ -54,9 +219,81 @@ class Task(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True, help_text="When was this completed?")
     
+    # Recurring series - due_date is the first occurrence
+    recurrence = models.CharField(max_length=10, choices=RECURRENCE_CHOICES, default='', blank=True)
+    recurrence_interval = models.PositiveSmallIntegerField(default=1, help_text="Every N days/weeks/months")
+    recurrence_weekdays = models.CharField(
+        max_length=13, blank=True, help_text="Custom rule weekdays, 0=Monday e.g. 0,2,4"
+    )
+    recurrence_end = models.DateField(null=True, blank=True, help_text="Last possible occurrence")
+    # Stored occurrence of a series (only once it was edited or completed)
+    recurrence_parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='occurrences'
+    )
+    occurrence_date = models.DateField(null=True, blank=True)
+    
+    tags = models.ManyToManyField('Tag', through='TaskTag', related_name='tasks', blank=True)
+    
+    # Subtasks - the full ancestry is in TaskClosure, see tasks.hierarchy
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='subtasks'
+    )
+    # all descendants / completed descendants, kept current by tasks.hierarchy
+    subtask_count = models.PositiveIntegerField(default=0)
+    subtask_completed_count = models.PositiveIntegerField(default=0)
+    
+    # Dependencies - the "blocked by" edges are TaskDependency rows, see tasks.dependencies
+    # 0 when blocked by nothing, otherwise above every task it's blocked by
+    dependency_level = models.PositiveIntegerField(default=0)
+    
+    # due date the last reminder went out for (tasks.reminders)
+    reminder_sent_for = models.DateField(null=True, blank=True)
+    
+    # Shared team project - only the owner's own projects (see tasks.projects)
+    project = models.ForeignKey(
+        'Project', on_delete=models.SET_NULL, null=True, blank=True, related_name='tasks'
+    )
+    
+    # Manual order within the board column (status + category), see tasks.ranking
+    rank = models.CharField(max_length=64, blank=True, default='')
+    
+    objects = ShardedManager()
+    
     class Meta:
         ordering = ['-created_at']  # newest tasks first
-        unique_together = ['user', 'title']  # prevent duplicate task names per user
+        constraints = [
+            # prevent duplicate task names per user - stored occurrences share their series' title
+            models.UniqueConstraint(
+                fields=['user', 'title'],
+                condition=models.Q(recurrence_parent__isnull=True),
+                name='task_unique_title_per_user',
+            ),
+            models.UniqueConstraint(
+                fields=['recurrence_parent', 'occurrence_date'],
+                name='task_unique_occurrence',
+            ),
+        ]
+        indexes = [
+            # calendar/agenda range scans per user
+            models.Index(fields=['user', 'due_date'], name='task_user_due_date_idx'),
+            # finding a user's recurring series
+            models.Index(
+                fields=['user', 'recurrence'],
+                condition=~models.Q(recurrence=''),
+                name='task_user_recurring_idx',
+            ),
+            # archive_tasks looking for old completed tasks
+            models.Index(fields=['status', 'completed_at'], name='task_status_completed_idx'),
+            # sort_by=topological pages
+            models.Index(fields=['user', 'dependency_level', 'due_date'], name='task_user_dependency_idx'),
+            # the reminder scheduler: upcoming deadlines, and what changed since its last look
+            models.Index(fields=['status', 'due_date'], name='task_status_due_date_idx'),
+            models.Index(fields=['updated_at'], name='task_updated_at_idx'),
+            # members listing a shared project's tasks
+            models.Index(fields=['project', 'due_date'], name='task_project_due_date_idx'),
+            # sort_by=manual - a board column in order, and a move finding its neighbours
+            models.Index(fields=['user', 'status', 'category', 'rank'], name='task_user_column_rank_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.user.username})"
@@ -73,6 +310,13 @@ class Task(models.Model):
             return False
         return self.due_date < date.today()
     
+    # Percent of all subtasks (at any depth) that are done, None without subtasks
+    @property
+    def progress(self):
+        if not self.subtask_count:
+            return None
+        return round(self.subtask_completed_count / self.subtask_count * 100, 1)
+    
     # Method for Bootstrap CSS classes
     def get_priority_class(self):
         if self.priority == 'high':
@@ -81,3 +325,176 @@ class Task(models.Model):
             return 'warning'
         else:
             return 'info'
+
+class TaskDailyRollup(models.Model):
+    """
+    Per user, per day task counters for the analytics endpoint
+    Kept up to date as tasks are created/completed so analytics never scans tasks
+    Counts are events: a task completed, reopened and completed again counts twice
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    created_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    reopened_count = models.PositiveIntegerField(default=0)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ['user', 'day']
+        ordering = ['day']
+    
+    def __str__(self):
+        return f"{self.day} ({self.user.username})"
+
+class CompletionTimeRollup(models.Model):
+    """
+    Histogram of created -> completed times, per user and completion day
+    bucket is an index into rollups.DURATION_BUCKETS
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='completion_time_rollups')
+    day = models.DateField()
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ['user', 'day', 'bucket']
+        ordering = ['day', 'bucket']
+    
+    def __str__(self):
+        return f"{self.day} bucket {self.bucket} ({self.user.username})"
+
+class TaskImport(models.Model):
+    """One CSV/NDJSON task import and how far it got - see tasks.imports"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_imports')
+    file_name = models.CharField(max_length=255, blank=True)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    processed_rows = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # first few hundred bad rows: [{"row": 12, "errors": {...}}, ...]
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.file_name or 'import'} ({self.status})"
+
+class ArchivedTask(models.Model):
+    """
+    Cold storage for tasks completed long ago - see the archive_tasks command
+    Same columns as Task (and the same id) so a task can be moved back as it was
+    """
+    # Columns copied between Task and ArchivedTask
+    COLUMNS = [
+        'id', 'user_id', 'title', 'description', 'due_date', 'priority', 'status',
+        'category_id', 'created_at', 'updated_at', 'completed_at'
+    ]
+    
+    id = models.BigIntegerField(primary_key=True)  # the Task id, not a new one
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_tasks')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    due_date = models.DateField()
+    priority = models.CharField(max_length=10, choices=Task.PRIORITY_CHOICES)
+    status = models.CharField(max_length=10, choices=Task.STATUS_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.title} (archived)"
+
+class Tag(models.Model):
+    """Free-form labels, a task can have any number of them (unlike Category)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+    # how many of the user's tasks carry it - kept up to date by tasks.tags
+    task_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        unique_together = ['user', 'name']
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.task_count})"
+
+class TaskTag(models.Model):
+    """Task <-> Tag link rows (the through table of Task.tags)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='task_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='task_tags')
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        constraints = [
+            # (tag, task) order so the tag filters only ever read this index
+            models.UniqueConstraint(fields=['tag', 'task'], name='task_tag_unique'),
+        ]
+
+class TaskClosure(models.Model):
+    """
+    One row per (ancestor, descendant) pair of the subtask tree, depth >= 1
+    (a task isn't stored as its own ancestor). Makes whole subtrees and
+    ancestor chains single indexed lookups - maintained by tasks.hierarchy
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    ancestor = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='task_closure_unique'),
+        ]
+
+class TaskDependency(models.Model):
+    """
+    "task is blocked by depends_on" - the edges of the user's dependency graph
+    Kept acyclic by tasks.dependencies
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='dependency_links')
+    depends_on = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='dependent_links')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedManager()
+    
+    class Meta:
+        constraints = [
+            # (task, depends_on) order so walking "blocked by" edges reads this index
+            models.UniqueConstraint(fields=['task', 'depends_on'], name='task_dependency_unique'),
+        ]
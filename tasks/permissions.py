@@ -7,7 +7,8 @@ class IsTaskOwner(permissions.BasePermission):
     
     def has_object_permission(self, request, view, obj):
         # Read and write permissions are only allowed to the owner of the task
-        return obj.user == request.user
+        # (compare ids so the user row doesn't have to be loaded)
+        return obj.user_id == request.user.id
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
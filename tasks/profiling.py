@@ -0,0 +1,113 @@
+import cProfile
+import io
+import pstats
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+# On-demand request profiling for staff (tasks.middleware.ProfilingMiddleware)
+# Profiles are cProfile dumps in PROFILE_DIR, the oldest are deleted once
+# there are more than PROFILE_MAX_FILES. Open them with pstats or snakeviz.
+
+# views in these modules can be profiled
+PROFILED_MODULES = {'tasks.api_views', 'tasks.views'}
+
+# 20261019-101500-123456_GET_api_task_list_35ms.prof
+_name_re = re.compile(r'^(?P<time>\d{8}-\d{6}-\d{6})_(?P<method>[A-Z]+)_(?P<view>[\w-]+)_(?P<ms>\d+)ms\.prof$')
+
+
+def requested(request):
+    """Did the request ask to be profiled? (the only check made for every request)"""
+    return 'HTTP_X_PROFILE' in request.META or (
+        '_profile' in request.META.get('QUERY_STRING', '') and '_profile' in request.GET
+    )
+
+
+def is_staff(request):
+    """Staff through the session (HTML views) or an API token"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        found = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return found is not None and found[0].is_staff
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def profile_call(request, view_func, args, kwargs):
+    """Run the view (and render its response) under cProfile, returns (response, profile name)"""
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            # DRF/template responses do most of their work when rendered
+            response = response.render()
+    finally:
+        profiler.disable()
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+    view = request.resolver_match.url_name if request.resolver_match else None
+    name = save(profiler, request.method, view or view_func.__name__, elapsed_ms)
+    return response, name
+
+
+def save(profiler, method, view, elapsed_ms):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    view = re.sub(r'[^\w-]', '_', view)
+    name = f'{timezone.now():%Y%m%d-%H%M%S-%f}_{method}_{view}_{elapsed_ms}ms.prof'
+    profiler.dump_stats(directory / name)
+    prune()
+    return name
+
+
+def prune():
+    """Delete the oldest profiles above PROFILE_MAX_FILES"""
+    names = sorted(path.name for path in profile_dir().glob('*.prof') if _name_re.match(path.name))
+    for name in names[:max(0, len(names) - settings.PROFILE_MAX_FILES)]:
+        (profile_dir() / name).unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Newest first"""
+    profiles = []
+    directory = profile_dir()
+    if not directory.is_dir():
+        return profiles
+    for path in directory.glob('*.prof'):
+        match = _name_re.match(path.name)
+        if match:
+            profiles.append({
+                'name': path.name,
+                'method': match['method'],
+                'view': match['view'],
+                'duration_ms': int(match['ms']),
+                'size': path.stat().st_size,
+            })
+    return sorted(profiles, key=lambda profile: profile['name'], reverse=True)
+
+
+def profile_path(name):
+    """Path of a stored profile, None for unknown (or made up) names"""
+    if not _name_re.match(name):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+def as_text(path, limit=50):
+    """pstats report of the slowest calls by cumulative time"""
+    out = io.StringIO()
+    pstats.Stats(str(path), stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
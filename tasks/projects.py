@@ -0,0 +1,109 @@
+import time
+
+from django.db.models import Q
+
+from . import metrics
+from .models import Project, ProjectMembership, Task
+from .sharding import shard_for_user, sharding_enabled
+
+# Team projects - an owner shares the tasks they put in a project with its members
+#
+# Access is part of the SQL: visible_tasks() is "my tasks OR tasks of the
+# projects I'm a member of", a semi-join through the (member, project)
+# index and Task.project, so a page of shared tasks costs the same as a
+# page of your own. Nothing is loaded first to be checked in Python.
+#
+# Projects, their memberships and their tasks live on the owner's shard.
+# With sharding on, members must be on the owner's shard as well, so
+# every access stays a single query on one database. rebalance_shards
+# moves everyone sharing projects together (sharding.project_groups).
+
+# How long a process trusts its cached "which projects is this user in".
+# The cache only decides whether the membership join is needed at all -
+# the join itself always reads the current memberships, so a removed
+# member loses access at once. Someone added in another worker may wait
+# this long before the project's tasks show up in their lists there.
+MEMBERSHIP_CACHE_SECONDS = 30
+_MAX_CACHED_MEMBERS = 100000
+
+_membership_cache = {}
+
+
+class ProjectError(Exception):
+    pass
+
+
+def clear_membership_cache(member_id=None):
+    if member_id is None:
+        _membership_cache.clear()
+    else:
+        _membership_cache.pop(member_id, None)
+
+
+def memberships(user_id):
+    """{project id: role} of the projects this user is a member of (not the ones they own)"""
+    now = time.monotonic()
+    cached = _membership_cache.get(user_id)
+    if cached and cached[1] > now:
+        metrics.record_cache('membership', True)
+        return cached[0]
+    metrics.record_cache('membership', False)
+
+    rows = ProjectMembership.objects.using(shard_for_user(user_id)).filter(member_id=user_id)
+    found = dict(rows.values_list('project_id', 'role'))
+    if len(_membership_cache) >= _MAX_CACHED_MEMBERS:
+        _membership_cache.clear()
+    _membership_cache[user_id] = (found, now + MEMBERSHIP_CACHE_SECONDS)
+    return found
+
+
+def visible_tasks(user, edit=False):
+    """
+    Tasks the user may read (edit=True: change) - their own, and those in
+    projects they're a member of (with the edit role for edit=True)
+    """
+    user_id = getattr(user, 'pk', user)
+    roles = list(memberships(user_id).values())
+    if edit:
+        roles = [role for role in roles if role == 'edit']
+    if not roles:
+        # most users aren't in anyone's project - no join for them
+        return Task.objects.for_user(user_id)
+
+    alias = shard_for_user(user_id)
+    shared = ProjectMembership.objects.using(alias).filter(member_id=user_id)
+    if edit:
+        shared = shared.filter(role='edit')
+    return Task.objects.using(alias).filter(Q(user_id=user_id) | Q(project_id__in=shared.values('project_id')))
+
+
+def visible_projects(user):
+    """Projects the user owns or is a member of"""
+    user_id = getattr(user, 'pk', user)
+    alias = shard_for_user(user_id)
+    shared = ProjectMembership.objects.using(alias).filter(member_id=user_id).values('project_id')
+    return Project.objects.using(alias).filter(Q(user_id=user_id) | Q(id__in=shared))
+
+
+def add_member(project, member, role):
+    """Add someone to the owner's project, or change their role. Returns (membership, created)"""
+    if member.pk == project.user_id:
+        raise ProjectError('The owner is always in the project')
+    if sharding_enabled() and shard_for_user(member.pk) != project._state.db:
+        # their lists are read from their own shard, which doesn't have the project
+        # an admin can bring them over first: rebalance_shards --user <id> --to <owner's shard>
+        raise ProjectError(f'{member.username} is stored on another shard and cannot join this project')
+    membership, created = ProjectMembership.objects.using(project._state.db).update_or_create(
+        project=project, member=member, defaults={'user_id': project.user_id, 'role': role}
+    )
+    clear_membership_cache(member.pk)
+    return membership, created
+
+
+def remove_member(project, member_id):
+    """Returns whether they were a member"""
+    deleted, _ = ProjectMembership.objects.using(project._state.db).filter(
+        project=project, member_id=member_id
+    ).delete()
+    clear_membership_cache(member_id)
+    return bool(deleted)
@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from .models import Task
+
+# Manual order of a board column (sort_by=manual)
+#
+# A column is one user's tasks with the same status and category. Each
+# task has a rank, a string of base 36 digits read as a fraction (0.xyz),
+# and the column is ordered by rank. Moving a task gives it a rank between
+# its new neighbours, so a move writes that one row and nothing else.
+#
+# Ranks only ever use 0-9 and a-z and never end in 0. They compare the
+# same byte-wise and under the usual database collations, and there's
+# always room for another rank between any two.
+#
+# Squeezing into the same spot again and again makes ranks longer (about a
+# digit every five moves). rebalance_ranks (cron) gives long columns evenly
+# spaced short ranks again. A move or new task that would go past
+# MAX_RANK_LENGTH does that for its own column first.
+#
+# A task whose status or category changes lands at the top of its new
+# column (column_changed), like a new task.
+#
+# Tasks that came in through bulk_create (imports) have
+# no rank ('') and sort first. Their column is ranked the first time
+# someone moves a task in it, or by rebalance_ranks.
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+MAX_RANK_LENGTH = 48  # Task.rank is 64 long
+
+
+class RankError(Exception):
+    pass
+
+
+def rank_between(low, high):
+    """
+    A rank sorting after `low` and before `high` - '' for low means the
+    start of the column, None for high the end
+    """
+    if high is not None and low >= high:
+        raise ValueError(f'{low!r} does not sort before {high!r}')
+    if high is not None:
+        # skip the digits they share (a missing digit of low counts as 0)
+        shared = 0
+        while shared < len(high) and (low[shared] if shared < len(low) else '0') == high[shared]:
+            shared += 1
+        if shared:
+            return high[:shared] + rank_between(low[shared:], high[shared:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        # e.g. between '4' and '5k' - '5' itself
+        return high[0]
+    # next digits, e.g. between '4x' and '5': '4' + something above 'x'
+    return DIGITS[low_digit] + rank_between(low[1:], None)
+
+
+def spaced_ranks(count, below=None):
+    """`count` increasing ranks spread evenly below `below` (None: over the whole range)"""
+    width = len(below or '') + 1
+    while True:
+        top = int(below.ljust(width, '0'), BASE) if below else BASE ** width
+        if top >= (count + 1) * BASE:  # room for a few moves into every gap
+            break
+        width += 1
+    step = top // (count + 1)
+    ranks = []
+    for i in range(1, count + 1):
+        value, digits = i * step, []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
+
+
+def column(db, user_id, status, category_id):
+    """The tasks of one board column"""
+    return Task.objects.using(db).filter(user_id=user_id, status=status, category_id=category_id)
+
+
+def column_of(task):
+    return column(task._state.db, task.user_id, task.status, task.category_id)
+
+
+def rebalance_column(db, user_id, status, category_id):
+    """Evenly spaced ranks for a column, keeping its order. Returns how many tasks got one"""
+    with transaction.atomic(using=db):
+        tasks = list(
+            column(db, user_id, status, category_id).select_for_update()
+            .order_by('rank', 'id').only('id', 'rank')
+        )
+        for task, rank in zip(tasks, spaced_ranks(len(tasks))):
+            task.rank = rank
+        Task.objects.using(db).bulk_update(tasks, ['rank'], batch_size=500)
+    return len(tasks)
+
+
+def long_columns(db, length=None):
+    """(user_id, status, category_id) of the columns with unranked tasks or ranks longer than `length`"""
+    length = settings.TASK_RANK_REBALANCE_LENGTH if length is None else length
+    return (
+        Task.objects.using(db).alias(rank_length=Length('rank'))
+        .filter(Q(rank='') | Q(rank_length__gt=length))
+        .order_by().values_list('user_id', 'status', 'category_id').distinct()
+    )
+
+
+def ranks_at_top(db, user_id, status, category_id, count=1, exclude_ids=()):
+    """`count` increasing ranks above the ranked tasks of a column (other than exclude_ids)"""
+    def first_rank():
+        ranked = column(db, user_id, status, category_id).exclude(rank='').exclude(id__in=exclude_ids)
+        return ranked.order_by('rank').values_list('rank', flat=True).first()
+
+    ranks = spaced_ranks(count, below=first_rank())
+    if max(map(len, ranks), default=0) > MAX_RANK_LENGTH:
+        # lots of tasks went in at the top since the last rebalance
+        rebalance_column(db, user_id, status, category_id)
+        ranks = spaced_ranks(count, below=first_rank())
+    return ranks
+
+
+def rank_for_new(db, task):
+    """A rank at the top of the task's column, above the tasks already ranked"""
+    return ranks_at_top(db, task.user_id, task.status, task.category_id)[0]
+
+
+def column_changed(db, tasks):
+    """
+    Move tasks whose status or category just changed to the top of their
+    new column - their old rank means nothing there and may be taken
+    """
+    columns = {}
+    for task in sorted(tasks, key=lambda task: (task.rank, task.id)):
+        columns.setdefault((task.user_id, task.status, task.category_id), []).append(task)
+    for (user_id, status, category_id), moved in columns.items():
+        ids = [task.id for task in moved]
+        for task, rank in zip(moved, ranks_at_top(db, user_id, status, category_id, len(moved), ids)):
+            task.rank = rank
+        Task.objects.using(db).bulk_update(moved, ['rank'], batch_size=500)
+
+
+def neighbours(tasks, after_id, before_id):
+    """(low, high) ranks the moved task goes between"""
+    if after_id is None and before_id is None:
+        # the top of the column
+        high = tasks.order_by('rank').values_list('rank', flat=True).first()
+        return '', high
+    neighbour = tasks.filter(id=after_id or before_id).values_list('rank', flat=True).first()
+    if neighbour is None:
+        raise RankError('after/before must be another task in the same column (same status and category)')
+    if after_id is not None:
+        high = tasks.filter(rank__gt=neighbour).order_by('rank').values_list('rank', flat=True).first()
+        return neighbour, high
+    low = tasks.filter(rank__lt=neighbour).order_by('-rank').values_list('rank', flat=True).first()
+    return low or '', neighbour
+
+
+def move(task, after_id=None, before_id=None):
+    """
+    Put the task right below `after_id`, right above `before_id` or (neither)
+    at the top of its column. Only the task's own row is written, unless
+    the column has to be (re)ranked first. Returns the new rank.
+    """
+    if after_id is not None and before_id is not None:
+        raise RankError('Give after or before, not both')
+
+    db = task._state.db
+    others = column_of(task).exclude(id=task.id)
+    with transaction.atomic(using=db):
+        if others.filter(rank='').exists():
+            # bulk created tasks - give the whole column ranks once
+            rebalance_column(db, task.user_id, task.status, task.category_id)
+        rank = rank_between(*neighbours(others, after_id, before_id))
+        if len(rank) > MAX_RANK_LENGTH:
+            rebalance_column(db, task.user_id, task.status, task.category_id)
+            rank = rank_between(*neighbours(others, after_id, before_id))
+        Task.objects.using(db).filter(id=task.id).update(rank=rank)
+    task.rank = rank
+    return rank
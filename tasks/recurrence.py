@@ -0,0 +1,113 @@
+import calendar
+from datetime import date, timedelta
+
+from django.conf import settings
+
+from .models import Task
+
+# Recurring tasks - occurrences are generated lazily for whatever date window
+# a query asks for. The series row itself is the first occurrence (its due_date),
+# later ones only get a row once they're edited or completed.
+
+
+def _add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    # the 31st becomes the last day of shorter months
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_dates(series, start, end):
+    """Dates in [start, end] the series falls on, not counting its own due_date"""
+    first = series.due_date
+    if series.recurrence_end:
+        end = min(end, series.recurrence_end)
+    start = max(start, first + timedelta(days=1))
+    if start > end or not series.recurrence:
+        return []
+
+    interval = max(series.recurrence_interval, 1)
+    dates = []
+    if series.recurrence in ('daily', 'weekly'):
+        step = interval * (7 if series.recurrence == 'weekly' else 1)
+        # jump straight to the first occurrence in the window
+        skipped = -(-(start - first).days // step)
+        day = first + timedelta(days=skipped * step)
+        while day <= end:
+            dates.append(day)
+            day += timedelta(days=step)
+    elif series.recurrence == 'monthly':
+        months = (start.year - first.year) * 12 + start.month - first.month
+        months = max(months - months % interval, 0)
+        while True:
+            day = _add_months(first, months)
+            if day > end:
+                break
+            if day >= start:
+                dates.append(day)
+            months += interval
+    elif series.recurrence == 'custom':
+        weekdays = sorted(int(d) for d in series.recurrence_weekdays.split(',') if d.strip())
+        first_week = first - timedelta(days=first.weekday())
+        week = start - timedelta(days=start.weekday())
+        # move to a week the rule is active in
+        week += timedelta(weeks=-((week - first_week).days // 7) % interval)
+        while week <= end:
+            for weekday in weekdays:
+                day = week + timedelta(days=weekday)
+                if start <= day <= end:
+                    dates.append(day)
+            week += timedelta(weeks=interval)
+    return dates
+
+
+def virtual_occurrence(series, day):
+    """Unsaved Task standing in for one occurrence of a series"""
+    return Task(
+        user=series.user,
+        title=series.title,
+        description=series.description,
+        due_date=day,
+        priority=series.priority,
+        status='pending',
+        category_id=series.category_id,
+        created_at=series.created_at,
+        updated_at=series.updated_at,
+        recurrence_parent=series,
+        occurrence_date=day,
+        dependency_level=series.dependency_level,
+    )
+
+
+def virtual_occurrences(series_list, start, end):
+    """
+    Occurrences in [start, end] of these series that don't have a row yet
+    Two queries at most: the series (already given) and their stored occurrences
+    """
+    series_list = [series for series in series_list if series.recurrence]
+    if not series_list or start > end:
+        return []
+
+    by_id = {series.id: series for series in series_list}
+    stored = set(
+        Task.objects.using(series_list[0]._state.db)
+        .filter(recurrence_parent_id__in=by_id, occurrence_date__range=(start, end))
+        .values_list('recurrence_parent_id', 'occurrence_date')
+    )
+    occurrences = []
+    for series in series_list:
+        for day in occurrence_dates(series, start, end):
+            if (series.id, day) not in stored:
+                occurrences.append(virtual_occurrence(series, day))
+    return occurrences
+
+
+def series_for_user(user):
+    """The user's recurring series (the template rows)"""
+    return Task.objects.for_user(user).filter(recurrence_parent__isnull=True).exclude(recurrence='')
+
+
+def overdue_window(today=None):
+    """Past occurrences older than this aren't reported as overdue any more"""
+    today = today or date.today()
+    return today - timedelta(days=settings.RECURRENCE_OVERDUE_DAYS), today - timedelta(days=1)
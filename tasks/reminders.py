@@ -0,0 +1,158 @@
+import heapq
+import json
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+# Due date reminders - run by `python manage.py run_reminders`
+#
+# The scheduler keeps the next TASK_REMINDER_HORIZON_DAYS of reminders in a
+# min-heap, loaded through the (status, due_date) index. Tasks changed since
+# the last look are found through the updated_at index, so the task table is
+# never scanned. Task.reminder_sent_for records what was delivered, a
+# restarted scheduler reloads the heap and carries on from there.
+
+# how far back each change poll looks past the previous one, for
+# transactions that committed a little after their updated_at
+CHANGE_OVERLAP = timedelta(seconds=60)
+
+REMINDER_COLUMNS = ['id', 'user_id', 'title', 'due_date']
+
+
+class FileSink:
+    """Appends each reminder as a JSON line to TASK_REMINDER_FILE"""
+
+    def __init__(self, path=None):
+        self.path = path or settings.TASK_REMINDER_FILE
+
+    def deliver(self, reminder):
+        with open(self.path, 'a', encoding='utf-8') as reminder_file:
+            reminder_file.write(json.dumps(reminder, default=str) + '\n')
+
+
+class LogSink:
+    """Logs each reminder on the tasks.reminders logger"""
+
+    def deliver(self, reminder):
+        logging.getLogger('tasks.reminders').info(
+            'Task %(task_id)s "%(title)s" is due %(due_date)s', reminder
+        )
+
+
+def get_sink():
+    return import_string(settings.TASK_REMINDER_SINK)()
+
+
+def remind_at(due_date):
+    """When the reminder for a due date goes out"""
+    start_of_day = datetime.combine(due_date, time.min, tzinfo=timezone.get_current_timezone())
+    return start_of_day - timedelta(hours=settings.TASK_REMINDER_LEAD_HOURS)
+
+
+def waiting(alias):
+    """Pending tasks on this database whose reminder hasn't gone out yet"""
+    # exclude() keeps the NULLs (never reminded)
+    return Task.objects.using(alias).filter(status='pending').exclude(reminder_sent_for=F('due_date'))
+
+
+class ReminderScheduler:
+    """
+    Heap of (remind at, alias, task id, due date) for the coming days
+    Entries aren't removed when tasks change - each one is checked against
+    the task row right before it's delivered, and skipped if it's stale
+    """
+
+    def __init__(self, sink, aliases=None):
+        self.sink = sink
+        self.aliases = aliases or settings.TASK_SHARDS
+        self.heap = []
+        self.scheduled = {}  # (alias, task id) -> due date of its newest entry
+        self.loaded_until = None
+        self.last_poll = None
+
+    def push(self, alias, task_id, due_date):
+        if self.scheduled.get((alias, task_id)) == due_date:
+            return
+        self.scheduled[alias, task_id] = due_date
+        heapq.heappush(self.heap, (remind_at(due_date), alias, task_id, due_date))
+
+    def load(self, now):
+        """Fill the heap with every waiting reminder up to the horizon"""
+        today = timezone.localdate(now)
+        until = today + timedelta(days=settings.TASK_REMINDER_HORIZON_DAYS)
+        self.heap, self.scheduled = [], {}
+        for alias in self.aliases:
+            rows = waiting(alias).filter(due_date__range=(today, until)).values_list('id', 'due_date')
+            for task_id, due_date in rows.iterator():
+                self.push(alias, task_id, due_date)
+        self.loaded_until = until
+        self.last_poll = now
+
+    def poll_changes(self, now):
+        """Add reminders for tasks created or changed since the last poll"""
+        today = timezone.localdate(now)
+        since = self.last_poll - CHANGE_OVERLAP
+        for alias in self.aliases:
+            rows = (
+                waiting(alias).filter(updated_at__gte=since, due_date__range=(today, self.loaded_until))
+                .values_list('id', 'due_date')
+            )
+            for task_id, due_date in rows:
+                self.push(alias, task_id, due_date)
+        self.last_poll = now
+
+    def pop_due(self, now):
+        """{alias: {task id: due date}} of the entries whose time has come"""
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, alias, task_id, due_date = heapq.heappop(self.heap)
+            if self.scheduled.get((alias, task_id)) == due_date:
+                del self.scheduled[alias, task_id]
+                due.setdefault(alias, {})[task_id] = due_date
+        return due
+
+    def deliver(self, due):
+        """Send the ones still current, returns how many went out"""
+        sent = 0
+        for alias, entries in due.items():
+            # one query per database to drop completed, deleted or rescheduled tasks
+            current = waiting(alias).filter(id__in=entries).values(*REMINDER_COLUMNS)
+            for row in current:
+                if row['due_date'] != entries[row['id']]:
+                    continue  # rescheduled, its new entry is already in the heap
+                self.sink.deliver({
+                    'task_id': row['id'],
+                    'user_id': row['user_id'],
+                    'title': row['title'],
+                    'due_date': row['due_date'].isoformat(),
+                    'remind_at': remind_at(row['due_date']).isoformat(),
+                })
+                # only if nothing changed the task in the meantime
+                Task.objects.using(alias).filter(id=row['id'], status='pending', due_date=row['due_date']).update(
+                    reminder_sent_for=row['due_date']
+                )
+                sent += 1
+        return sent
+
+    def run_once(self, now=None):
+        """One scheduler step, returns how many reminders were sent"""
+        now = now or timezone.now()
+        horizon = timezone.localdate(now) + timedelta(days=settings.TASK_REMINDER_HORIZON_DAYS)
+        if self.loaded_until is None or horizon > self.loaded_until:
+            # first run or a new day - move the horizon along
+            self.load(now)
+        else:
+            self.poll_changes(now)
+        return self.deliver(self.pop_due(now))
+
+    def seconds_until_next(self, now=None):
+        if not self.heap:
+            return None
+        now = now or timezone.now()
+        return max(0.0, (self.heap[0][0] - now).total_seconds())
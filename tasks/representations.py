@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import metrics
+
+# Cache of serialized tasks - TaskSerializer output without the nested user
+#
+# Keyed by (id, updated_at, today). Every write that changes how a task
+# looks bumps updated_at, so an entry is never served stale - outdated
+# ones just aren't asked for any more and fall off the end of the LRU.
+# Today is part of the key because is_overdue flips at midnight. The user
+# is put back in when the response is assembled, so profile changes
+# (which don't touch the tasks) show up right away.
+#
+# One cache per process, at most TASK_REPRESENTATION_CACHE_SIZE entries
+# (0 turns it off). A full task is around 1-2 KB of Python objects.
+
+
+class RepresentationCache:
+    """Least recently used entries are evicted first"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            fragment = self.entries.get(key)
+            if fragment is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        metrics.record_cache('representation', fragment is not None)
+        return fragment
+
+    def put(self, key, fragment):
+        limit = settings.TASK_REPRESENTATION_CACHE_SIZE
+        evicted = 0
+        with self.lock:
+            self.entries[key] = fragment
+            self.entries.move_to_end(key)
+            while len(self.entries) > limit:
+                self.entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            metrics.record_eviction('representation', evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': settings.TASK_REPRESENTATION_CACHE_SIZE,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+cache = RepresentationCache()
+
+
+def enabled():
+    return settings.TASK_REPRESENTATION_CACHE_SIZE > 0
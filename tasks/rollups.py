@@ -0,0 +1,115 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TaskDailyRollup, CompletionTimeRollup
+from .sharding import shard_for_user
+
+# Incremental daily rollups for the analytics endpoint
+# Every status change bumps a few counters instead of analytics scanning tasks
+
+# Upper edges (in hours) of the completion time histogram buckets,
+# the last bucket catches everything slower
+DURATION_BUCKETS = [1, 2, 4, 8, 12, 24, 48, 72, 168, 336, 720, 2160]
+
+
+def duration_bucket(created_at, completed_at):
+    """Histogram bucket index for how long a task took"""
+    hours = max((completed_at - created_at).total_seconds(), 0) / 3600
+    for index, upper in enumerate(DURATION_BUCKETS):
+        if hours < upper:
+            return index
+    return len(DURATION_BUCKETS)
+
+
+def bucket_range(index):
+    """(lower, upper) hours of a bucket, upper is None for the last one"""
+    lower = DURATION_BUCKETS[index - 1] if index > 0 else 0
+    upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else None
+    return lower, upper
+
+
+def rollup_day(moment):
+    """Which day a timestamp is counted on"""
+    return timezone.localtime(moment).date()
+
+
+def _bump(model, keys, **deltas):
+    """Add to counters of one rollup row, creating the row the first time"""
+    shard = shard_for_user(keys['user_id'])
+    rows = model.objects.using(shard)
+    increments = {field: F(field) + amount for field, amount in deltas.items()}
+    if rows.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic(using=shard):
+            rows.create(**keys, **deltas)
+    except IntegrityError:
+        # someone else created it in between - just add to theirs
+        rows.filter(**keys).update(**increments)
+
+
+def record_created(user_id, created_at, count=1):
+    _bump(TaskDailyRollup, {'user_id': user_id, 'day': rollup_day(created_at)}, created_count=count)
+
+
+def record_completions(user_id, completions):
+    """
+    Count completion events
+    completions: iterable of (created_at, completed_at) pairs
+    """
+    per_day = Counter()
+    per_bucket = Counter()
+    for created_at, completed_at in completions:
+        day = rollup_day(completed_at)
+        per_day[day] += 1
+        per_bucket[day, duration_bucket(created_at, completed_at)] += 1
+
+    for day, count in per_day.items():
+        _bump(TaskDailyRollup, {'user_id': user_id, 'day': day}, completed_count=count)
+    for (day, bucket), count in per_bucket.items():
+        _bump(CompletionTimeRollup, {'user_id': user_id, 'day': day, 'bucket': bucket}, count=count)
+
+
+def record_reopened(user_id, reopened_at, count=1):
+    _bump(TaskDailyRollup, {'user_id': user_id, 'day': rollup_day(reopened_at)}, reopened_count=count)
+
+
+def record_status_change(task, previous_status):
+    """Bump the rollups for a single task whose status may have changed"""
+    if task.status == previous_status:
+        return
+    if task.status == 'completed':
+        record_completions(task.user_id, [(task.created_at, task.completed_at or timezone.now())])
+    else:
+        record_reopened(task.user_id, timezone.now())
+
+
+def median_hours(bucket_counts):
+    """
+    Median completion time from merged histogram buckets
+    bucket_counts: {bucket index: count}, interpolates inside the median bucket
+    """
+    total = sum(bucket_counts.values())
+    if not total:
+        return None
+    middle = total / 2
+    seen = 0
+    for index in sorted(bucket_counts):
+        count = bucket_counts[index]
+        if seen + count >= middle:
+            lower, upper = bucket_range(index)
+            if upper is None:
+                return float(lower)
+            return round(lower + (upper - lower) * (middle - seen) / count, 2)
+        seen += count
+    return None
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())  # monday
+    return day
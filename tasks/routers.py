@@ -0,0 +1,47 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import shard_for_user
+
+# Database router for the optional user sharding (see tasks/sharding.py)
+
+
+def is_sharded(model):
+    from .models import ShardedManager
+    return isinstance(model._default_manager, ShardedManager)
+
+
+class ShardRouter:
+    """
+    Sends sharded models to their owner's shard, everything else to default
+    Queries without an instance need Model.objects.for_user(user) to pick the shard
+    """
+
+    def _db_for(self, model, instance=None):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        if instance is None:
+            return None
+        if isinstance(instance, model) and instance._state.db:
+            return instance._state.db
+        if isinstance(instance, User):
+            # e.g. Task(user=user) - goes to that user's shard
+            return shard_for_user(instance.pk)
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is not None:
+            return shard_for_user(user_id)
+        return instance._state.db
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # tasks point at users on the default database, which are mirrored to the shards
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # every shard gets the full schema
+        return True
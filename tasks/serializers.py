@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Task, Category
+from .models import Task, Category, TaskImport, Tag, Project, ProjectMembership
+from . import representations
+from . import tags as task_tags
 from datetime import date
 
 # Django REST Framework serializers
@@ -66,22 +68,215 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'color', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class TaskSerializer(serializers.ModelSerializer):
+class ProjectSerializer(serializers.ModelSerializer):
+    """Team project, role is the requesting user's: owner, edit or read"""
+    owner = serializers.CharField(source='user.username', read_only=True)
+    role = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'owner', 'role', 'created_at']
+        read_only_fields = ['id', 'created_at']
+    
+    def get_role(self, project):
+        # annotated on lists, a new project is always the requester's
+        return getattr(project, 'role', 'owner')
+
+class ProjectMemberSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='member.username', read_only=True)
+    
+    class Meta:
+        model = ProjectMembership
+        fields = ['member', 'username', 'role', 'created_at']
+        read_only_fields = fields
+
+def validate_recurrence(data, instance=None):
+    """Check the recurrence rule fields make sense together"""
+    def current(name):
+        return data.get(name, getattr(instance, name, None))
+    
+    recurrence = current('recurrence')
+    if recurrence == 'custom':
+        weekdays = (current('recurrence_weekdays') or '').split(',')
+        try:
+            days = [int(day) for day in weekdays if day.strip()]
+        except ValueError:
+            days = None
+        if not days or any(day < 0 or day > 6 for day in days):
+            raise serializers.ValidationError({
+                'recurrence_weekdays': "Custom rules need weekdays like 0,2,4 (0=Monday, 6=Sunday)"
+            })
+    if data.get('recurrence_interval') == 0:
+        raise serializers.ValidationError({'recurrence_interval': "Must be at least 1"})
+    end, due = current('recurrence_end'), current('due_date')
+    if recurrence and end and due and end < due:
+        raise serializers.ValidationError({'recurrence_end': "Can't end before the first due date"})
+    return data
+
+class TagSerializer(serializers.ModelSerializer):
+    """Tags with how many tasks carry them"""
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'task_count']
+        read_only_fields = ['id', 'task_count']
+
+class TagNamesField(serializers.ListField):
+    """Task tags as a list of names, e.g. ["home", "urgent"]"""
+    child = serializers.CharField(max_length=50)
+    
+    def get_attribute(self, task):
+        if task.pk is None or getattr(task, 'archived', False):
+            return []  # unsaved occurrences and archived tasks have no tag rows
+        return task.tags.all()  # prefetched on lists
+    
+    def to_representation(self, tags):
+        return sorted(tag.name for tag in tags)
+
+class TagsMixin:
+    """Saves the tags field through tasks.tags (Task.tags has a custom through table)"""
+    
+    def create(self, validated_data):
+        names = validated_data.pop('tags', None)
+        task = super().create(validated_data)
+        if names is not None:
+            task_tags.set_task_tags(task, names)
+        return task
+    
+    def update(self, instance, validated_data):
+        names = validated_data.pop('tags', None)
+        task = super().update(instance, validated_data)
+        if names is not None:
+            task_tags.set_task_tags(task, names)
+        return task
+
+class UserCategoryMixin:
+    """Only let tasks point at the requesting user's own categories (and parent tasks, projects)"""
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None and 'category' in fields and not fields['category'].read_only:
+            # also reads them from the user's shard
+            fields['category'].queryset = Category.objects.for_user(request.user)
+        if request is not None and 'parent' in fields and not fields['parent'].read_only:
+            fields['parent'].queryset = Task.objects.for_user(request.user)
+        if request is not None and 'project' in fields and not fields['project'].read_only:
+            fields['project'].queryset = Project.objects.for_user(request.user)
+        return fields
+
+class TaskSerializer(TagsMixin, UserCategoryMixin, serializers.ModelSerializer):
     """
     Main Task serializer for CRUD operations
     Automatically associates tasks with the logged-in user
     """
     user = UserSerializer(read_only=True)  # show user info but don't allow editing
     is_overdue = serializers.ReadOnlyField()  # include custom method
+    progress = serializers.ReadOnlyField()  # % of subtasks done
+    tags = TagNamesField(required=False)
+    
+    # Model columns each field reads - used to only load what ?fields= asks for
+    # Fields that don't need a model instance can be served from values() rows
+    FIELD_COLUMNS = {
+        'id': ['id'],
+        'title': ['title'],
+        'description': ['description'],
+        'due_date': ['due_date'],
+        'priority': ['priority'],
+        'status': ['status'],
+        'user': ['user'],
+        'is_overdue': ['status', 'due_date'],
+        'created_at': ['created_at'],
+        'updated_at': ['updated_at'],
+        'completed_at': ['completed_at'],
+        'category': ['category'],
+        'recurrence': ['recurrence'],
+        'recurrence_interval': ['recurrence_interval'],
+        'recurrence_weekdays': ['recurrence_weekdays'],
+        'recurrence_end': ['recurrence_end'],
+        'recurrence_parent': ['recurrence_parent'],
+        'occurrence_date': ['occurrence_date'],
+        'tags': [],
+        'parent': ['parent'],
+        'subtask_count': ['subtask_count'],
+        'subtask_completed_count': ['subtask_completed_count'],
+        'progress': ['subtask_count', 'subtask_completed_count'],
+        'dependency_level': ['dependency_level'],
+        'project': ['project'],
+    }
+    NEEDS_INSTANCE = {'user', 'is_overdue', 'tags', 'progress'}
     
     class Meta:
         model = Task
         fields = [
             'id', 'title', 'description', 'due_date', 
             'priority', 'status', 'user', 'is_overdue',
-            'created_at', 'updated_at', 'completed_at', 'category'
+            'created_at', 'updated_at', 'completed_at', 'category',
+            'recurrence', 'recurrence_interval', 'recurrence_weekdays', 'recurrence_end',
+            'recurrence_parent', 'occurrence_date', 'tags',
+            'parent', 'subtask_count', 'subtask_completed_count', 'progress', 'dependency_level',
+            'project'
+        ]
+        read_only_fields = [
+            'id', 'user', 'created_at', 'updated_at', 'completed_at',
+            'recurrence_parent', 'occurrence_date', 'subtask_count', 'subtask_completed_count',
+            'dependency_level'
         ]
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'completed_at']
+    
+    def __init__(self, *args, **kwargs):
+        # fields=[...] keeps only those fields (sparse fieldsets)
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        self.sparse = fields is not None
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        self._users = {}  # user id -> nested user data, for cached tasks
+    
+    @classmethod
+    def columns_for(cls, fields):
+        """Model columns needed to serialize these fields"""
+        columns = ['id']
+        for name in fields:
+            columns += [c for c in cls.FIELD_COLUMNS[name] if c not in columns]
+        return columns
+    
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            # a values() row - no model object, the columns are plain values already
+            # (foreign keys come out of values() as the id, which is what we show)
+            return {
+                name: instance[name]
+                if instance[name] is None or isinstance(field, serializers.RelatedField)
+                else field.to_representation(instance[name])
+                for name, field in self.fields.items()
+            }
+        
+        key = self.cache_key(instance)
+        if key is None:
+            return super().to_representation(instance)
+        fragment = representations.cache.get(key)
+        if fragment is None:
+            data = super().to_representation(instance)
+            representations.cache.put(key, {name: value for name, value in data.items() if name != 'user'})
+            return data
+        # always a new dict - callers may add to it (e.g. archived)
+        return {name: self.user_data(instance) if name == 'user' else fragment[name] for name in self.fields}
+    
+    def cache_key(self, instance):
+        """(id, updated_at, today) for stored tasks serialized in full, otherwise None"""
+        if self.sparse or not representations.enabled() or getattr(instance, 'archived', False):
+            return None
+        # never load a deferred updated_at just to build the key
+        updated_at = instance.__dict__.get('updated_at')
+        if instance.pk is None or updated_at is None:
+            return None
+        return instance.pk, updated_at, date.today()
+    
+    def user_data(self, instance):
+        data = self._users.get(instance.user_id)
+        if data is None:
+            data = self._users[instance.user_id] = self.fields['user'].to_representation(instance.user)
+        return data
     
     def validate_due_date(self, value):
         """Ensure due_date is not in the past."""
@@ -90,14 +285,23 @@ class TaskSerializer(serializers.ModelSerializer):
         if value and value < date.today():
             raise serializers.ValidationError("Due date cannot be in the past!")
         return value
-class TaskCreateSerializer(serializers.ModelSerializer):
+    
+    def validate(self, data):
+        return validate_recurrence(data, self.instance)
+class TaskCreateSerializer(TagsMixin, UserCategoryMixin, serializers.ModelSerializer):
     """
     Simplified serializer for creating tasks
     Doesn't include user info to keep it clean
     """
+    tags = TagNamesField(required=False)
+    
     class Meta:
         model = Task
-        fields = ['title', 'description', 'due_date', 'priority', 'category']
+        fields = [
+            'title', 'description', 'due_date', 'priority', 'category',
+            'recurrence', 'recurrence_interval', 'recurrence_weekdays', 'recurrence_end', 'tags',
+            'parent', 'project'
+        ]
     
     def validate_due_date(self, value):
         """Same validation as main serializer"""
@@ -105,3 +309,16 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         if value < date.today():
             raise serializers.ValidationError("Due date cannot be in the past!")
         return value
+    
+    def validate(self, data):
+        return validate_recurrence(data)
+
+class TaskImportSerializer(serializers.ModelSerializer):
+    """Progress of a task import (everything is read-only)"""
+    class Meta:
+        model = TaskImport
+        fields = [
+            'id', 'file_name', 'format', 'status', 'processed_rows', 'imported_count',
+            'error_count', 'errors', 'message', 'created_at', 'finished_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,189 @@
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import metrics
+
+# Optional user sharding
+# Every user's tasks, categories etc. live together on one database alias
+# (their shard). settings.TASK_SHARDS lists the aliases in use - a single
+# alias means sharding is off and everything below is a no-op.
+
+# How long a process trusts its cached user -> shard lookup,
+# rebalance_shards moves are picked up by every worker within this time
+SHARD_CACHE_SECONDS = 30
+_MAX_CACHED_USERS = 100000
+
+# Ids of each shard start at shard number * this, so rows keep their
+# primary key when a user is moved to another shard
+SHARD_ID_SPACING = 10 ** 12
+
+_shard_cache = {}
+
+
+def sharding_enabled():
+    return len(settings.TASK_SHARDS) > 1
+
+
+def clear_shard_cache():
+    _shard_cache.clear()
+
+
+def shard_for_user(user_id):
+    """Database alias holding this user's rows"""
+    shards = settings.TASK_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+
+    now = time.monotonic()
+    cached = _shard_cache.get(user_id)
+    if cached and cached[1] > now:
+        metrics.record_cache('shard', True)
+        return cached[0]
+    metrics.record_cache('shard', False)
+
+    UserShard = apps.get_model('tasks', 'UserShard')
+    alias = UserShard.objects.filter(user_id=user_id).values_list('alias', flat=True).first()
+    if alias is None:
+        # first time we see this user - spread new users round robin by id
+        alias = shards[user_id % len(shards)]
+        alias = UserShard.objects.get_or_create(user_id=user_id, defaults={'alias': alias})[0].alias
+
+    if len(_shard_cache) >= _MAX_CACHED_USERS:
+        _shard_cache.clear()
+    _shard_cache[user_id] = (alias, now + SHARD_CACHE_SECONDS)
+    return alias
+
+
+def sharded_models():
+    """Models stored per user on the shards, in dependency order (definition order)"""
+    from .models import ShardedManager
+    return [
+        model for model in apps.get_app_config('tasks').get_models()
+        if isinstance(model._default_manager, ShardedManager)
+    ]
+
+
+def shard_number(alias):
+    return connections.settings[alias].get('SHARD_NUMBER', 0)
+
+
+def mirror_user(user, aliases=None):
+    """
+    Copy a user row onto the shards
+    Shards keep their own auth_user so foreign keys and joins to it work there
+    """
+    User = user.__class__
+    values = {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields if not field.primary_key
+    }
+    for alias in aliases or settings.TASK_SHARDS:
+        if alias != DEFAULT_DB_ALIAS:
+            User._base_manager.using(alias).update_or_create(pk=user.pk, defaults=values)
+
+
+def delete_user_rows(user):
+    """Remove a user (and through CASCADE all their rows) from the non-default shards"""
+    for alias in settings.TASK_SHARDS:
+        if alias != DEFAULT_DB_ALIAS:
+            user.__class__._base_manager.using(alias).filter(pk=user.pk).delete()
+
+
+def seed_id_ranges(using):
+    """Start the id sequences of a shard at its own range (run after migrate)"""
+    offset = shard_number(using) * SHARD_ID_SPACING
+    if not offset:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s',
+                               [offset, table, offset])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, offset, table]
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, offset]
+                )
+
+
+def project_groups(alias):
+    """
+    {user id: frozenset of user ids} for the users on this shard that share
+    team projects - owners with their members, and through them everyone
+    they share other projects with. tasks.projects needs each group on one shard.
+    """
+    from .models import ProjectMembership
+
+    parent = {}
+
+    def root(user_id):
+        parent.setdefault(user_id, user_id)
+        while parent[user_id] != user_id:
+            parent[user_id] = parent[parent[user_id]]
+            user_id = parent[user_id]
+        return user_id
+
+    for owner_id, member_id in ProjectMembership.objects.using(alias).values_list('user_id', 'member_id'):
+        parent[root(owner_id)] = root(member_id)
+    groups = {}
+    for user_id in list(parent):
+        groups.setdefault(root(user_id), set()).add(user_id)
+    return {user_id: frozenset(group) for group in groups.values() for user_id in group}
+
+
+def project_group(user_id):
+    """The user and everyone sharing projects with them (see project_groups)"""
+    return project_groups(shard_for_user(user_id)).get(user_id, frozenset([user_id]))
+
+
+def move_user(user, target):
+    """
+    Move all of a user's rows to another shard, keeping their ids - along
+    with everyone who shares a project with them, so no project is split
+    Returns how many rows were moved
+    """
+    source = shard_for_user(user.pk)
+    if source == target:
+        return 0
+    group = project_group(user.pk)
+    users = user.__class__._base_manager.filter(pk__in=group).order_by('pk')
+    return sum(_move_rows(member, source, target) for member in users)
+
+
+def _move_rows(user, source, target):
+    """
+    One user's rows from source to target
+    Copies first, then switches the mapping, then deletes the old rows
+    """
+    from .models import UserShard
+
+    mirror_user(user, [target])
+    moved = 0
+    models = sharded_models()
+    with transaction.atomic(using=target):
+        for model in models:
+            rows = model._base_manager.using(source).filter(user_id=user.pk).order_by('pk')
+            for row in rows.iterator(chunk_size=1000):
+                # raw save like loaddata - keeps created_at/updated_at as they are
+                row.save_base(raw=True, force_insert=True, using=target)
+                moved += 1
+
+    UserShard.objects.update_or_create(user_id=user.pk, defaults={'alias': target})
+    _shard_cache.pop(user.pk, None)
+
+    with transaction.atomic(using=source):
+        for model in reversed(models):
+            # plain DELETE, no cascades or signals - every related row goes anyway
+            model._base_manager.using(source).filter(user_id=user.pk)._raw_delete(source)
+    return moved
@@ -0,0 +1,101 @@
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, hierarchy, ranking, sharding
+from .models import Task, Category, Project, Tag, TaskTag
+
+# Signal handlers - connected in TasksConfig.ready()
+
+
+@receiver(post_save, sender=User)
+def mirror_user_to_shards(sender, instance, using, raw=False, **kwargs):
+    # shards need the user row for their foreign keys and joins
+    if using == DEFAULT_DB_ALIAS and sharding.sharding_enabled():
+        sharding.mirror_user(instance)
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_from_shards(sender, instance, using, **kwargs):
+    # CASCADE only reaches rows on the default database, clear the shards too
+    if using == DEFAULT_DB_ALIAS and sharding.sharding_enabled():
+        sharding.delete_user_rows(instance)
+
+
+@receiver(post_migrate)
+def seed_shard_id_ranges(sender, using, **kwargs):
+    if sender.name == 'tasks':
+        sharding.seed_id_ranges(using)
+
+
+@receiver(setting_changed)
+def reset_shard_cache(setting, **kwargs):
+    if setting in ('TASK_SHARDS', 'DATABASES'):
+        sharding.clear_shard_cache()
+
+
+@receiver(post_delete, sender=TaskTag)
+def decrement_tag_count(sender, instance, using, **kwargs):
+    # also runs for links deleted along with their task
+    Tag.objects.using(using).filter(id=instance.tag_id).update(task_count=F('task_count') - 1)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Project)
+def touch_unlinked_tasks(sender, instance, using, **kwargs):
+    # SET_NULL changes the tasks without going through save(), give them a
+    # new updated_at so cached representations (tasks.representations) drop them
+    field = 'category' if sender is Category else 'project'
+    Task.objects.using(using).filter(**{field: instance}).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Task)
+def rank_new_task(sender, instance, using, raw=False, **kwargs):
+    # new tasks start at the top of their board column (sort_by=manual)
+    if instance._state.adding and not raw and not instance.rank:
+        instance.rank = ranking.rank_for_new(using, instance)
+
+
+@receiver(post_save, sender=Task)
+def link_new_subtask(sender, instance, created, raw=False, **kwargs):
+    # raw saves (loaddata, shard moves) bring their closure rows along
+    if created and not raw:
+        hierarchy.attach(instance)
+
+
+@receiver(pre_delete, sender=Task)
+def unlink_deleted_subtask(sender, instance, **kwargs):
+    hierarchy.detach_deleted(instance)
+
+
+# Keep loaded autocomplete indexes current
+# (API edits go through a plain UPDATE and call autocomplete.item_saved themselves)
+
+@receiver(post_save, sender=Task)
+def index_saved_task(sender, instance, **kwargs):
+    if instance.recurrence_parent_id is None:
+        autocomplete.item_saved('task', instance.id, instance.user_id, instance.title)
+
+
+@receiver(post_delete, sender=Task)
+def unindex_deleted_task(sender, instance, **kwargs):
+    autocomplete.item_deleted('task', instance.id, instance.user_id)
+
+
+@receiver(post_save, sender=Category)
+def index_saved_category(sender, instance, **kwargs):
+    autocomplete.item_saved('category', instance.id, instance.user_id, instance.name)
+
+
+@receiver(post_delete, sender=Category)
+def unindex_deleted_category(sender, instance, **kwargs):
+    autocomplete.item_deleted('category', instance.id, instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def forget_user_index(sender, instance, **kwargs):
+    autocomplete.forget_user(instance.id)
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tag, Task, TaskTag
+from .sharding import shard_for_user
+
+# Task tags - helpers for setting them and filtering by them
+# Tag.task_count is kept current here (and by the TaskTag delete signal)
+# so tag lists never have to count link rows
+
+
+def clean_names(names):
+    """Stripped, lowercased, de-duplicated tag names in their original order"""
+    cleaned = []
+    for name in names:
+        name = ' '.join(str(name).lower().split())
+        if name and name not in cleaned:
+            cleaned.append(name)
+    return cleaned
+
+
+def set_task_tags(task, names):
+    """Make the task's tags exactly these names, creating new tags as needed"""
+    names = clean_names(names)
+    shard = shard_for_user(task.user_id)
+    with transaction.atomic(using=shard):
+        tags = {tag.name: tag.id for tag in Tag.objects.for_user(task.user_id).filter(name__in=names)}
+        for name in names:
+            if name not in tags:
+                tags[name] = Tag.objects.get_or_create(user_id=task.user_id, name=name)[0].id
+
+        wanted = set(tags.values())
+        current = set(TaskTag.objects.using(shard).filter(task_id=task.id).values_list('tag_id', flat=True))
+        # the delete signal takes the removed ones off their counts
+        TaskTag.objects.using(shard).filter(task_id=task.id, tag_id__in=current - wanted).delete()
+        added = wanted - current
+        TaskTag.objects.using(shard).bulk_create([
+            TaskTag(user_id=task.user_id, task_id=task.id, tag_id=tag_id) for tag_id in added
+        ])
+        Tag.objects.using(shard).filter(id__in=added).update(task_count=F('task_count') + 1)
+        if added or current - wanted:
+            # the task's representation changed (tasks.representations)
+            task.updated_at = timezone.now()
+            Task.objects.using(shard).filter(id=task.id).update(updated_at=task.updated_at)
+
+
+def filter_by_tags(queryset, user, names, mode='all'):
+    """
+    Tasks carrying all (or any) of these tag names
+    Uses IN (subquery) semi-joins on the (tag, task) index - task rows are
+    never joined to the links, so there's no DISTINCT over a big intermediate
+    (see benchmarks/tags.py)
+    """
+    names = clean_names(names)
+    found = list(Tag.objects.for_user(user).filter(name__in=names).values_list('id', 'task_count'))
+    links = TaskTag.objects.using(queryset.db)
+    if mode == 'any':
+        if not found:
+            return queryset.none()
+        return queryset.filter(id__in=links.filter(tag_id__in=[tag_id for tag_id, _ in found]).values('task_id'))
+
+    if len(found) < len(names):
+        return queryset.none()  # a tag the user doesn't have - nothing has them all
+    # one semi-join per tag, rarest first so the candidates shrink fastest
+    # (beats GROUP BY task HAVING COUNT(*) = n, which reads every link of every tag)
+    for tag_id, _ in sorted(found, key=lambda tag: tag[1]):
+        queryset = queryset.filter(id__in=links.filter(tag_id=tag_id).values('task_id'))
+    return queryset
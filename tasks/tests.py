@@ -1,10 +1,17 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from .models import Task
+from . import imports
+from .models import Task, Category, TaskDailyRollup, CompletionTimeRollup
 from datetime import date, timedelta
 
 # Basic tests for Task Management API
@@ -164,6 +171,15 @@ class TaskAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Task.objects.count(), 0)
     
+    def test_bulk_update_counts_each_task_once(self):
+        due = date.today() + timedelta(days=1)
+        ids = [Task.objects.create(user=self.user, title=f'Bulk {i}', due_date=due).id for i in range(3)]
+        Task.objects.filter(id=ids[0]).update(status='completed')
+        response = self.client.patch(reverse('api_bulk_update'), {'task_ids': ids, 'status': 'completed'},
+                                     format='json')
+        self.assertEqual(response.data['updated_count'], 3)
+        self.assertEqual(Task.objects.filter(id__in=ids, status='completed').count(), 3)
+    
     def test_toggle_task_status(self):
         """Test toggling task completion status"""
         task = Task.objects.create(
@@ -273,3 +289,1561 @@ class TaskStatisticsTest(APITestCase):
         self.assertEqual(data['priority_breakdown']['high'], 1)
         self.assertEqual(data['priority_breakdown']['medium'], 1)
         self.assertEqual(data['completion_rate'], 50.0)
+
+class WorkerBootTest(SimpleTestCase):
+    """Fresh gunicorn workers must load and warm up within the budget"""
+
+    BOOT_SCRIPT = (
+        "import os\n"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'task_management.settings')\n"
+        "from django.conf import settings\n"
+        "for db in settings.DATABASES.values():\n"
+        "    db['NAME'] = ':memory:'\n"
+        "from task_management import warmup\n"
+        "print(warmup.boot_worker())\n"
+    )
+
+    def test_worker_boot_time_within_budget(self):
+        """Boot in a new interpreter so nothing is already imported"""
+        result = subprocess.run(
+            [sys.executable, '-c', self.BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        boot_seconds = float(result.stdout.strip().splitlines()[-1])
+        self.assertLess(boot_seconds, settings.WORKER_BOOT_BUDGET)
+
+    def test_gunicorn_config_preloads_and_sizes_workers(self):
+        """Config should preload the app and size workers from the cores"""
+        import runpy
+        config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        self.assertTrue(config['preload_app'])
+        self.assertGreaterEqual(config['workers'], config['cores'])
+        self.assertGreaterEqual(config['threads'], 1)
+
+
+class TaskListPageTest(TestCase):
+    """Test the server-rendered task list"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        other_user = User.objects.create_user(username='otheruser', password='otherpass123')
+        Task.objects.create(
+            user=other_user,
+            title='Not Mine',
+            due_date=date.today() + timedelta(days=1)
+        )
+        self.client.force_login(self.user)
+    
+    def test_list_is_scoped_and_paginated(self):
+        """Only my tasks, one page at a time"""
+        for i in range(30):
+            Task.objects.create(
+                user=self.user,
+                title=f'Task {i}',
+                due_date=date.today() + timedelta(days=1)
+            )
+        response = self.client.get(reverse('task_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['tasks']), 25)
+        self.assertEqual(response.context['page_obj'].paginator.count, 30)
+        self.assertNotContains(response, 'Not Mine')
+        
+        response = self.client.get(reverse('task_list') + '?page=2')
+        self.assertEqual(len(response.context['tasks']), 5)
+    
+    def test_list_query_count_does_not_grow_with_rows(self):
+        """Related fields come from the join, not one query per row"""
+        for i in range(10):
+            Task.objects.create(
+                user=self.user,
+                title=f'Task {i}',
+                due_date=date.today() + timedelta(days=1)
+            )
+        # session + user + count + page
+        with self.assertNumQueries(4):
+            self.client.get(reverse('task_list'))
+    
+    def test_editing_status_updates_parent_progress(self):
+        due = date.today() + timedelta(days=1)
+        parent = Task.objects.create(user=self.user, title='Parent', due_date=due)
+        child = Task.objects.create(user=self.user, title='Child', due_date=due, parent=parent)
+        self.client.post(reverse('task_update', kwargs={'task_id': child.id}), {
+            'title': 'Child', 'due_date': str(due), 'priority': 'medium', 'status': 'completed',
+        })
+        parent.refresh_from_db()
+        self.assertEqual((parent.subtask_count, parent.subtask_completed_count), (1, 1))
+    
+    def test_editing_status_records_completion(self):
+        due = date.today() + timedelta(days=1)
+        task = Task.objects.create(user=self.user, title='Report', due_date=due)
+        url = reverse('task_update', kwargs={'task_id': task.id})
+        form = {'title': 'Report', 'due_date': str(due), 'priority': 'medium', 'status': 'completed'}
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+        task.refresh_from_db()
+        self.assertIsNotNone(task.completed_at)
+        self.assertEqual(TaskDailyRollup.objects.get().completed_count, 1)
+        
+        self.client.post(url, dict(form, status='pending'))
+        task.refresh_from_db()
+        self.assertIsNone(task.completed_at)
+        self.assertEqual(TaskDailyRollup.objects.get().reopened_count, 1)
+    
+    def test_other_users_task_is_404(self):
+        """Detail pages are scoped to the owner too"""
+        other_task = Task.objects.get(title='Not Mine')
+        response = self.client.get(reverse('task_detail', args=[other_task.id]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('task_list'))
+        self.assertEqual(response.status_code, 302)
+
+class TaskAdminTest(TestCase):
+    """Test the admin bulk actions and counting"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@test.com', password='adminpass123'
+        )
+        self.client.force_login(self.admin_user)
+        self.pending = Task.objects.create(
+            user=self.admin_user,
+            title='Pending Task',
+            due_date=date.today() + timedelta(days=1)
+        )
+        self.completed = Task.objects.create(
+            user=self.admin_user,
+            title='Completed Task',
+            due_date=date.today() + timedelta(days=1),
+            status='completed'
+        )
+        self.url = reverse('admin:tasks_task_changelist')
+    
+    def run_action(self, action, tasks):
+        return self.client.post(self.url, {
+            'action': action,
+            '_selected_action': [task.id for task in tasks],
+        })
+    
+    def test_mark_completed_is_one_update(self):
+        """Completing sets completed_at with a single UPDATE"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            self.run_action('mark_completed', [self.pending, self.completed])
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "tasks_task"')
+                   and '"status"' in q['sql'].split(' WHERE ')[0]]
+        self.assertEqual(len(updates), 1)  # the new board rank is written on its own
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'completed')
+        self.assertIsNotNone(self.pending.completed_at)
+    
+    def test_mark_pending_clears_completed_at(self):
+        self.run_action('mark_pending', [self.completed])
+        self.completed.refresh_from_db()
+        self.assertEqual(self.completed.status, 'pending')
+        self.assertIsNone(self.completed.completed_at)
+    
+    def test_set_priority(self):
+        self.run_action('set_priority_low', [self.pending, self.completed])
+        self.assertEqual(Task.objects.filter(priority='low').count(), 2)
+    
+    def test_changelist_loads(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_estimated_row_count(self):
+        """Statistics estimate is used once the database has analyzed the table"""
+        from django.db import connection
+        from .admin import estimated_row_count
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(Task), 2)
+
+class TaskAgendaTest(APITestCase):
+    """Test the calendar agenda endpoint"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.day1 = date.today() + timedelta(days=1)
+        self.day2 = date.today() + timedelta(days=2)
+        Task.objects.create(user=self.user, title='Low One', due_date=self.day1, priority='low')
+        Task.objects.create(user=self.user, title='High One', due_date=self.day1, priority='high')
+        Task.objects.create(user=self.user, title='Done', due_date=self.day2, status='completed')
+        Task.objects.create(user=self.user, title='Far Away', due_date=date.today() + timedelta(days=60))
+        self.url = reverse('api_task_agenda')
+    
+    def test_counts_per_day(self):
+        response = self.client.get(self.url, {'start': self.day1, 'end': self.day2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        days = response.data['days']
+        self.assertEqual(set(days), {str(self.day1), str(self.day2)})
+        self.assertEqual(days[str(self.day1)]['total'], 2)
+        self.assertEqual(days[str(self.day1)]['priority']['high'], 1)
+        self.assertEqual(days[str(self.day2)]['status']['completed'], 1)
+        self.assertNotIn('tasks', days[str(self.day1)])
+    
+    def test_first_tasks_per_day(self):
+        """per_day returns the top tasks of each day, high priority first"""
+        response = self.client.get(self.url, {'start': self.day1, 'end': self.day2, 'per_day': 1})
+        tasks = response.data['days'][str(self.day1)]['tasks']
+        self.assertEqual([task['title'] for task in tasks], ['High One'])
+    
+    def test_counts_use_one_query(self):
+        with self.assertNumQueries(2):  # token lookup + grouped counts
+            self.client.get(self.url, {'start': self.day1, 'end': self.day2})
+    
+    def test_bad_range(self):
+        response = self.client.get(self.url, {'start': self.day2, 'end': self.day1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'start': 'nope', 'end': self.day1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class TaskAnalyticsTest(APITestCase):
+    """Test the rollup based analytics"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('api_task_analytics')
+    
+    def create_task(self, title):
+        response = self.client.post(reverse('api_task_list'), {
+            'title': title,
+            'due_date': str(date.today() + timedelta(days=1)),
+        })
+        return response.data
+    
+    def test_rollups_follow_status_changes(self):
+        """Create, toggle and bulk update all land in the rollups"""
+        self.create_task('One')
+        self.create_task('Two')
+        self.create_task('Three')
+        ids = list(Task.objects.values_list('id', flat=True))
+        
+        self.client.patch(reverse('api_task_toggle', kwargs={'task_id': ids[0]}))
+        self.client.patch(reverse('api_bulk_update'), {'task_ids': ids, 'status': 'completed'}, format='json')
+        self.client.patch(reverse('api_task_detail', kwargs={'pk': ids[1]}), {'status': 'pending'})
+        
+        rollup = TaskDailyRollup.objects.get(user=self.user)
+        self.assertEqual(rollup.created_count, 3)
+        self.assertEqual(rollup.completed_count, 3)  # toggle + the two the bulk update flipped
+        self.assertEqual(rollup.reopened_count, 1)
+    
+    def test_analytics_reads_rollups(self):
+        self.create_task('One')
+        self.create_task('Two')
+        task_id = Task.objects.first().id
+        self.client.patch(reverse('api_task_toggle', kwargs={'task_id': task_id}))
+        
+        with self.assertNumQueries(3):  # token + daily rollups + histogram
+            response = self.client.get(self.url, {'period': 'week'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totals']['created'], 2)
+        self.assertEqual(response.data['totals']['completed'], 1)
+        self.assertEqual(response.data['trend'][0]['completion_rate'], 50.0)
+        self.assertLess(response.data['median_completion_hours'], 1)
+    
+    def test_backfill_matches_task_table(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+        Task.objects.create(user=self.user, title='A', due_date=date.today())
+        Task.objects.create(
+            user=self.user, title='B', due_date=date.today(),
+            status='completed', completed_at=timezone.now()
+        )
+        call_command('backfill_rollups', stdout=open(os.devnull, 'w'))
+        rollup = TaskDailyRollup.objects.get(user=self.user)
+        self.assertEqual((rollup.created_count, rollup.completed_count), (2, 1))
+        self.assertEqual(CompletionTimeRollup.objects.get(user=self.user).count, 1)
+    
+    def test_median_from_buckets(self):
+        from .rollups import median_hours
+        self.assertIsNone(median_hours({}))
+        # all in the 1-2h bucket -> middle of it
+        self.assertEqual(median_hours({1: 4}), 1.5)
+
+@override_settings(TASK_SHARDS=['default', 'shard_1', 'shard_2'])
+class ShardingTest(APITestCase):
+    """Test spreading users over several sqlite databases"""
+    databases = {'default', 'shard_1', 'shard_2'}
+    
+    def setUp(self):
+        from .sharding import clear_shard_cache
+        clear_shard_cache()  # mappings from earlier tests were rolled back
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}', password='testpass123')
+            self.users.append(user)
+    
+    def login(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    
+    def test_users_land_on_different_shards(self):
+        from .sharding import shard_for_user
+        aliases = {shard_for_user(user.id) for user in self.users}
+        self.assertEqual(aliases, {'default', 'shard_1', 'shard_2'})
+    
+    def test_api_reads_and_writes_the_users_shard(self):
+        from .sharding import shard_for_user
+        for user in self.users:
+            self.login(user)
+            response = self.client.post(reverse('api_task_list'), {
+                'title': f'Task of {user.username}',
+                'due_date': str(date.today() + timedelta(days=1)),
+            })
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            shard = shard_for_user(user.id)
+            self.assertTrue(Task.objects.using(shard).filter(user=user).exists())
+            
+            response = self.client.get(reverse('api_task_list'))
+            self.assertEqual([t['title'] for t in response.data['results']], [f'Task of {user.username}'])
+            task_id = response.data['results'][0]['id']
+            response = self.client.patch(reverse('api_task_toggle', kwargs={'task_id': task_id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # each shard holds exactly one user's task, with its own id range
+        for alias in ('default', 'shard_1', 'shard_2'):
+            self.assertEqual(Task.objects.using(alias).count(), 1)
+        self.assertGreater(Task.objects.using('shard_2').get().id, 10 ** 12)
+    
+    def test_rebalance_moves_rows_keeping_ids(self):
+        from django.core.management import call_command
+        from .sharding import shard_for_user
+        user = self.users[1]
+        category = Category.objects.create(user=user, name='Work')
+        task = Task.objects.create(
+            user=user, title='Move me', category=category,
+            due_date=date.today() + timedelta(days=1)
+        )
+        source = shard_for_user(user.id)
+        target = 'shard_2' if source != 'shard_2' else 'shard_1'
+        
+        call_command('rebalance_shards', user=user.id, to=target, stdout=open(os.devnull, 'w'))
+        
+        self.assertEqual(shard_for_user(user.id), target)
+        self.assertFalse(Task.objects.using(source).filter(user=user).exists())
+        moved = Task.objects.for_user(user).get()
+        self.assertEqual((moved.id, moved.category_id, moved.created_at), (task.id, category.id, task.created_at))
+    
+    def test_deleting_account_clears_shard(self):
+        from .sharding import shard_for_user
+        user = self.users[1]
+        Task.objects.create(user=user, title='Gone', due_date=date.today() + timedelta(days=1))
+        shard = shard_for_user(user.id)
+        self.login(user)
+        self.client.delete(reverse('api_delete_account'))
+        self.assertFalse(Task.objects.using(shard).filter(user_id=user.id).exists())
+    
+    def test_projects_stay_on_the_owners_shard(self):
+        owner, other_shard = self.users[0], self.users[1]
+        self.login(owner)
+        project = self.client.post(reverse('api_project_list'), {'name': 'Team'}).data['id']
+        response = self.client.post(reverse('api_project_members', kwargs={'project_id': project}),
+                                    {'username': other_shard.username})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('another shard', response.data['error'])
+
+    def test_rebalance_keeps_project_members_together(self):
+        from django.core.management import call_command
+        from .models import Project, ProjectMembership
+        from .projects import clear_membership_cache
+        from .sharding import shard_for_user
+        clear_membership_cache()
+        owner, member, other = self.users
+        home = shard_for_user(owner.id)
+        # bring the member over first, as the add_member error suggests
+        call_command('rebalance_shards', user=member.id, to=home, stdout=open(os.devnull, 'w'))
+        call_command('rebalance_shards', user=other.id, to=home, stdout=open(os.devnull, 'w'))
+        self.login(owner)
+        project = self.client.post(reverse('api_project_list'), {'name': 'Team'}).data['id']
+        response = self.client.post(reverse('api_project_members', kwargs={'project_id': project}),
+                                    {'username': member.username})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        due = date.today() + timedelta(days=1)
+        for i in range(3):
+            Task.objects.create(user=owner, title=f'Shared {i}', due_date=due, project_id=project)
+            Task.objects.create(user=member, title=f'Member {i}', due_date=due)
+        Task.objects.create(user=other, title='Other', due_date=due)
+
+        # moving the owner alone (3 of 7 tasks) would even things out best, but splits the project
+        call_command('rebalance_shards', stdout=open(os.devnull, 'w'))
+
+        shard = shard_for_user(owner.id)
+        self.assertNotEqual(shard, home)
+        self.assertEqual(shard_for_user(member.id), shard)
+        self.assertTrue(Project.objects.using(shard).filter(id=project).exists())
+        self.assertTrue(ProjectMembership.objects.using(shard).filter(member=member).exists())
+        self.assertFalse(Task.objects.using(home).filter(user__in=[owner, member]).exists())
+        self.login(member)
+        titles = [task['title'] for task in self.client.get(reverse('api_task_list') + f'?project={project}').data['results']]
+        self.assertEqual(sorted(titles), ['Shared 0', 'Shared 1', 'Shared 2'])
+
+class ApiCompressionTest(APITestCase):
+    """Test negotiated compression of API responses"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        for i in range(20):
+            Task.objects.create(
+                user=self.user,
+                title=f'Task number {i}',
+                description='Some description text ' * 5,
+                due_date=date.today() + timedelta(days=1)
+            )
+    
+    def test_large_response_is_gzipped(self):
+        import gzip
+        import json
+        response = self.client.get(reverse('api_task_list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['count'], 20)
+    
+    def test_brotli_preferred_when_available(self):
+        from . import middleware
+        if middleware.brotli is None:
+            self.skipTest('brotli not installed')
+        response = self.client.get(reverse('api_task_list'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        response = self.client.get(reverse('api_task_list'), HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+    
+    def test_small_or_unaccepted_is_left_alone(self):
+        response = self.client.get(reverse('api_task_stats'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('api_task_list'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+    
+    def test_streaming_is_compressed_incrementally(self):
+        import gzip
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory
+        from .middleware import ApiCompressionMiddleware
+        chunks = [b'{"chunk": %d}\n' % i for i in range(100)]
+        middleware = ApiCompressionMiddleware(lambda request: StreamingHttpResponse(iter(chunks)))
+        request = RequestFactory().get('/api/export/', HTTP_ACCEPT_ENCODING='gzip')
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        parts = list(response.streaming_content)
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+class SparseFieldsTest(APITestCase):
+    """Test ?fields= on task reads"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.task = Task.objects.create(
+            user=self.user,
+            title='Sparse Task',
+            description='Long text nobody asked for',
+            due_date=date.today() + timedelta(days=1)
+        )
+    
+    def test_list_only_returns_requested_fields(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('api_task_list') + '?fields=id,title,status,due_date'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{
+            'id': self.task.id,
+            'title': 'Sparse Task',
+            'status': 'pending',
+            'due_date': str(self.task.due_date),
+        }])
+        select = [q['sql'] for q in ctx.captured_queries if 'FROM "tasks_task"' in q['sql']][-1]
+        self.assertNotIn('"description"', select)
+    
+    def test_instance_fields_still_work(self):
+        response = self.client.get(reverse('api_task_list') + '?fields=title,is_overdue,user')
+        result = response.data['results'][0]
+        self.assertEqual(set(result), {'title', 'is_overdue', 'user'})
+        self.assertFalse(result['is_overdue'])
+        self.assertEqual(result['user']['username'], 'testuser')
+    
+    def test_detail_fields(self):
+        url = reverse('api_task_detail', kwargs={'pk': self.task.id}) + '?fields=id,category'
+        response = self.client.get(url)
+        self.assertEqual(response.data, {'id': self.task.id, 'category': None})
+    
+    def test_unknown_field_is_400(self):
+        response = self.client.get(reverse('api_task_list') + '?fields=title,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class RecurringTaskTest(APITestCase):
+    """Test recurring tasks and their lazily expanded occurrences"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.today = date.today()
+        self.series = Task.objects.create(
+            user=self.user,
+            title='Water plants',
+            due_date=self.today - timedelta(days=3),
+            recurrence='daily'
+        )
+    
+    def test_occurrence_dates_rules(self):
+        from .recurrence import occurrence_dates
+        start = date(2025, 1, 31)  # a friday
+        monthly = Task(due_date=start, recurrence='monthly')
+        self.assertEqual(
+            occurrence_dates(monthly, start, date(2025, 4, 30)),
+            [date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30)]
+        )
+        weekly = Task(due_date=start, recurrence='weekly', recurrence_interval=2,
+                      recurrence_end=date(2025, 3, 1))
+        self.assertEqual(
+            occurrence_dates(weekly, date(2025, 2, 1), date(2025, 12, 31)),
+            [date(2025, 2, 14), date(2025, 2, 28)]
+        )
+        custom = Task(due_date=start, recurrence='custom', recurrence_weekdays='0,2')
+        self.assertEqual(
+            occurrence_dates(custom, date(2025, 2, 3), date(2025, 2, 9)),
+            [date(2025, 2, 3), date(2025, 2, 5)]
+        )
+    
+    def test_due_today_lists_virtual_occurrence(self):
+        response = self.client.get(reverse('api_task_list') + '?due_today=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        result = response.data['results'][0]
+        self.assertIsNone(result['id'])
+        self.assertEqual(result['recurrence_parent'], self.series.id)
+        self.assertEqual(result['occurrence_date'], str(self.today))
+        # nothing was written for it
+        self.assertEqual(Task.objects.count(), 1)
+    
+    def test_completing_an_occurrence_stores_it_once(self):
+        url = reverse('api_task_occurrence', kwargs={'task_id': self.series.id, 'day': str(self.today)})
+        response = self.client.patch(url, {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.patch(url, {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.filter(recurrence_parent=self.series).count(), 1)
+        
+        # the stored row replaces the virtual one in lists
+        response = self.client.get(reverse('api_task_list') + '?due_today=true')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['results'][0]['id'])
+    
+    def test_not_an_occurrence_is_400(self):
+        url = reverse('api_task_occurrence', kwargs={
+            'task_id': self.series.id, 'day': str(self.series.due_date - timedelta(days=1))
+        })
+        response = self.client.patch(url, {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_stats_count_occurrences(self):
+        response = self.client.get(reverse('api_task_stats'))
+        # the series row itself plus two missed days are overdue, today is due
+        self.assertEqual(response.data['overdue_tasks'], 3)
+        self.assertEqual(response.data['due_today'], 1)
+
+class BatchRequestTest(APITestCase):
+    """Test the /api/batch/ endpoint"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.task_data = {'title': 'Batched', 'due_date': str(date.today() + timedelta(days=1))}
+    
+    def test_runs_each_request(self):
+        response = self.client.post(reverse('api_batch'), {'requests': [
+            {'id': 'me', 'method': 'GET', 'path': '/api/profile/'},
+            {'method': 'POST', 'path': '/api/tasks/', 'body': self.task_data},
+            {'method': 'GET', 'path': '/api/tasks/?status=pending&fields=title'},
+            {'method': 'GET', 'path': '/api/nope/'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['responses']
+        self.assertEqual([r['status'] for r in results], [200, 201, 200, 404])
+        self.assertEqual(results[0]['id'], 'me')
+        self.assertEqual(results[0]['body']['username'], 'testuser')
+        self.assertEqual(results[2]['body']['results'], [{'title': 'Batched'}])
+    
+    def test_atomic_batch_rolls_back(self):
+        response = self.client.post(reverse('api_batch'), {'atomic': True, 'requests': [
+            {'method': 'POST', 'path': '/api/tasks/', 'body': self.task_data},
+            {'method': 'POST', 'path': '/api/tasks/', 'body': {'title': ''}},
+            {'method': 'GET', 'path': '/api/tasks/stats/'},
+        ]}, format='json')
+        self.assertTrue(response.data['rolled_back'])
+        self.assertEqual([r['status'] for r in response.data['responses']], [201, 400, 424])
+        self.assertFalse(Task.objects.exists())
+    
+    def test_atomic_must_be_a_boolean(self):
+        for value in ('false', 0, 'yes'):
+            response = self.client.post(reverse('api_batch'), {'atomic': value, 'requests': [
+                {'method': 'POST', 'path': '/api/tasks/', 'body': self.task_data},
+            ]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Task.objects.exists())
+    
+    def test_needs_auth_and_no_nesting(self):
+        response = self.client.post(reverse('api_batch'), {'requests': [
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': []}},
+        ]}, format='json')
+        self.assertEqual(response.data['responses'][0]['status'], 400)
+        self.client.credentials()
+        response = self.client.post(reverse('api_batch'), {'requests': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class ConditionalUpdateTest(APITestCase):
+    """Test the single UPDATE write path of toggle and detail updates"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.task = Task.objects.create(
+            user=self.user,
+            title='Atomic Task',
+            description='Untouched',
+            due_date=date.today() + timedelta(days=1)
+        )
+    
+    def task_queries(self, method, url, data=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, [q['sql'] for q in ctx.captured_queries if '"tasks_task"' in q['sql']]
+    
+    def test_toggle_is_one_update(self):
+        url = reverse('api_task_toggle', kwargs={'task_id': self.task.id})
+        response, queries = self.task_queries('patch', url)
+        self.assertEqual(response.data['data']['task']['status'], 'completed')
+        # the status flips in one UPDATE, then the task gets a rank in its new board column
+        self.assertTrue(queries[0].startswith('UPDATE'))
+        status_updates = [q for q in queries if q.startswith('UPDATE') and '"status"' in q.split(' WHERE ')[0]]
+        self.assertEqual(status_updates, queries[:1])
+        self.task.refresh_from_db()
+        self.assertIsNotNone(self.task.completed_at)
+        
+        self.client.patch(url)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'pending')
+        self.assertIsNone(self.task.completed_at)
+    
+    def test_patch_writes_only_changed_columns(self):
+        url = reverse('api_task_detail', kwargs={'pk': self.task.id})
+        response, queries = self.task_queries('patch', url, {'priority': 'high'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['priority'], 'high')
+        self.assertEqual(len(queries), 1)
+        set_clause = queries[0].split(' WHERE ')[0]
+        self.assertIn('"priority"', set_clause)
+        self.assertNotIn('"description"', set_clause)
+    
+    def test_completed_and_foreign_tasks_are_refused(self):
+        url = reverse('api_task_detail', kwargs={'pk': self.task.id})
+        self.client.patch(url, {'status': 'completed'}, format='json')
+        response = self.client.patch(url, {'title': 'Changed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {'status': 'pending', 'title': 'Changed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['completed_at'])
+        self.assertEqual(TaskDailyRollup.objects.get().reopened_count, 1)
+        
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        response = self.client.patch(url, {'title': 'Mine now'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_fallback_without_returning(self):
+        from unittest import mock
+        with mock.patch('tasks.models._can_update_returning', return_value=False):
+            tasks = Task.objects.filter(id=self.task.id).update_and_fetch(status='completed')
+        self.assertEqual([t.status for t in tasks], ['completed'])
+
+@override_settings(TASK_IMPORT_ASYNC=False)
+class TaskImportTest(APITestCase):
+    """Test CSV/NDJSON task imports"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.due = str(date.today() + timedelta(days=5))
+        Category.objects.create(user=self.user, name='Work')
+    
+    def upload(self, name, content, **extra):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('api_task_imports'), {'file': upload, **extra}, format='multipart')
+    
+    def test_csv_import_with_row_errors(self):
+        content = (
+            'title,due_date,priority,category\n'
+            f'First,{self.due},high,Work\n'
+            f'Second,{self.due},,Home\n'
+            f'First,{self.due},low,\n'
+            'Old,2000-01-01,low,\n'
+        )
+        response = self.upload('tasks.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['processed_rows'], 4)
+        self.assertEqual(response.data['imported_count'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [3, 4])
+        self.assertEqual(Task.objects.get(title='First').category.name, 'Work')
+        self.assertEqual(Task.objects.get(title='Second').category.name, 'Home')
+        self.assertEqual(TaskDailyRollup.objects.get().created_count, 2)
+        
+        detail = self.client.get(reverse('api_task_import_detail', kwargs={'import_id': response.data['id']}))
+        self.assertEqual(detail.data['error_count'], 2)
+    
+    def test_ndjson_is_written_in_chunks(self):
+        from unittest import mock
+        lines = [json.dumps({'title': f'Task {i}', 'due_date': self.due}) for i in range(7)]
+        with mock.patch('tasks.imports.IMPORT_CHUNK_SIZE', 3), \
+                mock.patch('tasks.imports._flush', wraps=imports._flush) as flush:
+            response = self.upload('tasks.ndjson', '\n'.join(lines + ['not json']))
+        self.assertEqual(response.data['imported_count'], 7)
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(flush.call_count, 3)
+    
+    def test_rows_can_only_use_own_projects(self):
+        from .models import Project
+        own = Project.objects.create(user=self.user, name='Mine')
+        other_user = User.objects.create_user(username='victim', password='testpass123')
+        theirs = Project.objects.create(user=other_user, name='Theirs')
+        lines = [json.dumps({'title': 'Sneaky', 'due_date': self.due, 'project': theirs.id}),
+                 json.dumps({'title': 'Fine', 'due_date': self.due, 'project': own.id})]
+        response = self.upload('tasks.ndjson', '\n'.join(lines))
+        self.assertEqual(response.data['imported_count'], 1)
+        self.assertEqual(list(response.data['errors'][0]['errors']), ['project'])
+        self.assertFalse(Task.objects.filter(project=theirs).exists())
+        self.assertEqual(Task.objects.get(title='Fine').project_id, own.id)
+    
+    def test_abandoned_imports_are_failed(self):
+        from django.utils import timezone
+        from .models import TaskImport
+        stale = TaskImport.objects.create(user=self.user, format='csv', status='running')
+        fresh = TaskImport.objects.create(user=self.user, format='csv', status='running')
+        TaskImport.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(hours=2))
+        detail = self.client.get(reverse('api_task_import_detail', kwargs={'import_id': stale.id}))
+        self.assertEqual(detail.data['status'], 'failed')
+        self.assertIsNotNone(detail.data['finished_at'])
+        listed = {item['id']: item['status'] for item in self.client.get(reverse('api_task_imports')).data}
+        self.assertEqual(listed, {stale.id: 'failed', fresh.id: 'running'})
+
+    def test_failed_import_stays_failed(self):
+        from unittest import mock
+        from .models import TaskImport
+        flush = imports._flush
+
+        def expire_after_first_chunk(task_import, *args):
+            flush(task_import, *args)
+            TaskImport.objects.filter(id=task_import.id).update(status='failed', message='Expired')
+
+        lines = [json.dumps({'title': f'Task {i}', 'due_date': self.due}) for i in range(7)]
+        with mock.patch('tasks.imports.IMPORT_CHUNK_SIZE', 3), \
+                mock.patch('tasks.imports._flush', side_effect=expire_after_first_chunk):
+            response = self.upload('tasks.ndjson', '\n'.join(lines))
+        self.assertEqual((response.data['status'], response.data['message']), ('failed', 'Expired'))
+        self.assertEqual(response.data['imported_count'], 3)
+        self.assertEqual(Task.objects.filter(user=self.user).count(), 3)
+
+    def test_uploads_are_run_by_the_worker(self):
+        import tempfile
+        from django.core.management import call_command
+        with tempfile.TemporaryDirectory() as queue, \
+                override_settings(TASK_IMPORT_ASYNC=True, TASK_IMPORT_DIR=queue):
+            response = self.upload('tasks.csv', f'title,due_date\nQueued,{self.due}\n')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['status'], 'pending')
+            self.assertFalse(Task.objects.filter(title='Queued').exists())
+
+            call_command('run_imports', once=True, stdout=open(os.devnull, 'w'))
+            self.assertEqual(os.listdir(queue), [])
+        detail = self.client.get(reverse('api_task_import_detail', kwargs={'import_id': response.data['id']}))
+        self.assertEqual((detail.data['status'], detail.data['imported_count']), ('done', 1))
+        self.assertTrue(Task.objects.filter(title='Queued').exists())
+
+    def test_unknown_format_is_400(self):
+        response = self.upload('tasks.xlsx', 'whatever')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_management_command(self):
+        import tempfile
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(f'title,due_date\nFrom CLI,{self.due}\n')
+        try:
+            call_command('import_tasks', f.name, user='testuser', stdout=open(os.devnull, 'w'))
+        finally:
+            os.remove(f.name)
+        self.assertTrue(Task.objects.filter(user=self.user, title='From CLI').exists())
+
+class TaskArchiveTest(APITestCase):
+    """Test archiving old completed tasks"""
+    
+    def setUp(self):
+        from django.utils import timezone
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        due = date.today() + timedelta(days=1)
+        self.old = Task.objects.create(
+            user=self.user, title='Old Done', due_date=due, status='completed',
+            completed_at=timezone.now() - timedelta(days=200)
+        )
+        self.recent = Task.objects.create(
+            user=self.user, title='Recent Done', due_date=due, status='completed',
+            completed_at=timezone.now() - timedelta(days=2)
+        )
+        self.pending = Task.objects.create(user=self.user, title='Pending', due_date=due)
+    
+    def archive(self):
+        from django.core.management import call_command
+        call_command('archive_tasks', days=90, batch_size=1, stdout=open(os.devnull, 'w'))
+    
+    def test_command_moves_only_old_completed_tasks(self):
+        from .models import ArchivedTask
+        created_at = self.old.created_at
+        self.archive()
+        self.assertFalse(Task.objects.filter(id=self.old.id).exists())
+        archived = ArchivedTask.objects.get(id=self.old.id)
+        self.assertEqual(archived.created_at, created_at)
+        self.assertEqual(Task.objects.count(), 2)
+    
+    def test_lists_read_hot_table_unless_asked(self):
+        self.archive()
+        response = self.client.get(reverse('api_task_list'))
+        self.assertEqual(response.data['count'], 2)
+        
+        response = self.client.get(reverse('api_task_list') + '?archived=true&status=completed')
+        self.assertEqual(response.data['count'], 2)
+        flags = {item['title']: item['archived'] for item in response.data['results']}
+        self.assertEqual(flags, {'Old Done': True, 'Recent Done': False})
+        
+        response = self.client.get(reverse('api_task_list') + '?archived=true&sort_by=priority')
+        self.assertEqual(response.data['count'], 3)
+    
+    def test_restore_by_id(self):
+        self.archive()
+        url = reverse('api_task_restore', kwargs={'task_id': self.old.id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.get(id=self.old.id).status, 'completed')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_tagged_and_project_tasks_stay(self):
+        from django.utils import timezone
+        from .models import Project
+        from .tags import set_task_tags
+        done = timezone.now() - timedelta(days=200)
+        tagged = Task.objects.create(user=self.user, title='Tagged', due_date=date.today(),
+                                     status='completed', completed_at=done)
+        set_task_tags(tagged, ['work'])
+        project = Project.objects.create(user=self.user, name='Website')
+        Task.objects.create(user=self.user, title='In project', due_date=date.today(),
+                            status='completed', completed_at=done, project=project)
+        self.archive()
+        self.assertEqual(set(Task.objects.filter(status='completed').values_list('title', flat=True)),
+                         {'Recent Done', 'Tagged', 'In project'})
+    
+    def test_restored_task_is_a_new_version(self):
+        self.archive()
+        self.client.post(reverse('api_task_restore', kwargs={'task_id': self.old.id}))
+        restored = Task.objects.get(id=self.old.id)
+        self.assertGreater(restored.updated_at, self.old.updated_at)
+        self.assertNotEqual(restored.rank, '')
+    
+    def test_restore_title_clash_is_400(self):
+        self.archive()
+        Task.objects.create(user=self.user, title='Old Done', due_date=date.today())
+        response = self.client.post(reverse('api_task_restore', kwargs={'task_id': self.old.id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class AutocompleteTest(APITestCase):
+    """Test the title autocomplete endpoint and its prefix index"""
+    
+    def setUp(self):
+        from . import autocomplete
+        autocomplete.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        due = date.today() + timedelta(days=1)
+        self.milk = Task.objects.create(user=self.user, title='Buy milk', due_date=due)
+        Task.objects.create(user=self.user, title='Milk the cow', due_date=due)
+        Category.objects.create(user=self.user, name='Business')
+    
+    def suggest(self, q, **params):
+        response = self.client.get(reverse('api_autocomplete'), {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['results']]
+    
+    def test_prefix_matches_titles_then_words(self):
+        self.assertEqual(self.suggest('bu'), ['Business', 'Buy milk'])
+        self.assertEqual(self.suggest('MILK'), ['Milk the cow', 'Buy milk'])
+        self.assertEqual(self.suggest('mi', limit=1), ['Milk the cow'])
+    
+    def test_index_follows_changes_without_rebuilding(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.suggest('b')  # builds it
+        self.client.patch(reverse('api_task_detail', kwargs={'pk': self.milk.id}),
+                          {'title': 'Sell milk'}, format='json')
+        Task.objects.create(user=self.user, title='Bake bread', due_date=date.today())
+        Category.objects.get(name='Business').delete()
+        with CaptureQueriesContext(connection) as ctx:
+            titles = self.suggest('b')
+        self.assertEqual(titles, ['Bake bread'])
+        self.assertFalse([q for q in ctx.captured_queries if '"tasks_task"' in q['sql']])
+        self.assertEqual(self.suggest('sel'), ['Sell milk'])
+    
+    def test_least_recently_used_index_is_evicted(self):
+        from . import autocomplete
+        other = User.objects.create_user(username='other', password='testpass123')
+        with override_settings(AUTOCOMPLETE_MAX_USERS=1):
+            autocomplete.index_for_user(self.user.id)
+            autocomplete.index_for_user(other.id)
+            self.assertEqual(list(autocomplete._indexes), [other.id])
+    
+    def test_needs_query(self):
+        response = self.client.get(reverse('api_autocomplete'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class TaskTagTest(APITestCase):
+    """Test task tags, their counts and the tag filters"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.due = str(date.today() + timedelta(days=1))
+        for title, tags in [('Both', ['home', 'Urgent']), ('Home only', ['home']), ('None', [])]:
+            response = self.client.post(reverse('api_task_list'),
+                                        {'title': title, 'due_date': self.due, 'tags': tags}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def titles(self, query):
+        response = self.client.get(reverse('api_task_list') + query)
+        return sorted(item['title'] for item in response.data['results'])
+    
+    def counts(self):
+        response = self.client.get(reverse('api_tag_list'))
+        return {tag['name']: tag['task_count'] for tag in response.data['results']}
+    
+    def test_all_and_any_filters(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.assertEqual(self.titles('?tags=home,urgent'), ['Both'])
+        self.assertEqual(self.titles('?tags=home,urgent&tag_mode=any'), ['Both', 'Home only'])
+        self.assertEqual(self.titles('?tags=home,nope'), [])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('api_task_list') + '?tags=home,urgent')
+        self.assertFalse([q for q in ctx.captured_queries if 'DISTINCT' in q['sql']])
+    
+    def test_counts_follow_edits_and_deletes(self):
+        self.assertEqual(self.counts(), {'home': 2, 'urgent': 1})
+        task = Task.objects.get(title='Both')
+        response = self.client.patch(reverse('api_task_detail', kwargs={'pk': task.id}),
+                                     {'tags': ['urgent', 'work']}, format='json')
+        self.assertEqual(response.data['tags'], ['urgent', 'work'])
+        self.assertEqual(self.counts(), {'home': 1, 'urgent': 1, 'work': 1})
+        self.client.delete(reverse('api_task_detail', kwargs={'pk': task.id}))
+        self.assertEqual(self.counts(), {'home': 1, 'urgent': 0, 'work': 0})
+    
+    def test_list_loads_tags_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('api_task_list'))
+        tag_queries = [q for q in ctx.captured_queries if '"tasks_tasktag"' in q['sql']]
+        self.assertEqual(len(tag_queries), 1)
+        tags = {item['title']: item['tags'] for item in response.data['results']}
+        self.assertEqual(tags['Both'], ['home', 'urgent'])
+
+
+class SubtaskTest(APITestCase):
+    """Test subtask trees, their counters and moves"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.due = str(date.today() + timedelta(days=1))
+        # root -> a -> a1, root -> b
+        self.root = self.create('Root')
+        self.a = self.create('A', self.root)
+        self.a1 = self.create('A1', self.a)
+        self.b = self.create('B', self.root)
+    
+    def create(self, title, parent=None):
+        response = self.client.post(reverse('api_task_list'),
+                                    {'title': title, 'due_date': self.due, 'parent': parent}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Task.objects.get(title=title).id
+    
+    def counts(self, task_id):
+        task = Task.objects.get(id=task_id)
+        return task.subtask_count, task.subtask_completed_count
+    
+    def test_counters_and_progress(self):
+        self.assertEqual(self.counts(self.root), (3, 0))
+        self.assertEqual(self.counts(self.a), (1, 0))
+        self.client.patch(reverse('api_task_toggle', kwargs={'task_id': self.a1}))
+        self.client.patch(reverse('api_bulk_update'), {'task_ids': [self.b], 'status': 'completed'}, format='json')
+        self.assertEqual(self.counts(self.root), (3, 2))
+        self.assertEqual(self.counts(self.a), (1, 1))
+        response = self.client.get(reverse('api_task_detail', kwargs={'pk': self.root}))
+        self.assertEqual(response.data['progress'], 66.7)
+        self.client.patch(reverse('api_task_toggle', kwargs={'task_id': self.a1}))
+        self.assertEqual(self.counts(self.root), (3, 1))
+    
+    def test_subtree_in_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('api_task_subtree', kwargs={'task_id': self.root}))
+        self.assertEqual(len([q for q in ctx.captured_queries if '"tasks_task"' in q['sql']]), 1)
+        self.assertEqual([child['title'] for child in response.data['subtasks']], ['A', 'B'])
+        self.assertEqual(response.data['subtasks'][0]['subtasks'][0]['title'], 'A1')
+    
+    def test_move_and_cycles(self):
+        url = reverse('api_task_detail', kwargs={'pk': self.a})
+        response = self.client.patch(url, {'parent': self.b}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counts(self.b), (2, 0))
+        self.assertEqual(self.counts(self.root), (3, 0))
+        response = self.client.patch(reverse('api_task_detail', kwargs={'pk': self.root}),
+                                     {'parent': self.a1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.patch(url, {'parent': None}, format='json')
+        self.assertEqual(self.counts(self.b), (0, 0))
+        self.assertEqual(self.counts(self.root), (1, 0))
+    
+    def test_delete_updates_counters(self):
+        self.client.delete(reverse('api_task_detail', kwargs={'pk': self.a}))
+        self.assertFalse(Task.objects.filter(id=self.a1).exists())
+        self.assertEqual(self.counts(self.root), (1, 0))
+
+
+class TaskDependencyTest(APITestCase):
+    """Test blocked-by edges, loop checks, ready filter and topological sort"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        due = date.today() + timedelta(days=1)
+        # design <- build <- ship, and an unrelated task due first
+        self.ids = {}
+        for offset, title in enumerate(['Other', 'Ship', 'Build', 'Design']):
+            task = Task.objects.create(user=self.user, title=title, due_date=due + timedelta(days=offset))
+            self.ids[title] = task.id
+        self.block('Ship', 'Build')
+        self.block('Build', 'Design')
+    
+    def block(self, title, by):
+        return self.client.post(reverse('api_task_dependencies', kwargs={'task_id': self.ids[title]}),
+                                {'depends_on': self.ids[by]}, format='json')
+    
+    def titles(self, query):
+        response = self.client.get(reverse('api_task_list') + query)
+        return [item['title'] for item in response.data['results']]
+    
+    def test_loops_are_rejected(self):
+        response = self.block('Design', 'Ship')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.block('Design', 'Design').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.block('Ship', 'Design')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([task['title'] for task in response.data['blocked_by']], ['Build', 'Design'])
+    
+    def test_ready_filter(self):
+        self.assertEqual(sorted(self.titles('?ready=true')), ['Design', 'Other'])
+        self.client.patch(reverse('api_task_toggle', kwargs={'task_id': self.ids['Design']}))
+        self.assertEqual(sorted(self.titles('?ready=true')), ['Build', 'Other'])
+        url = reverse('api_task_dependency_remove',
+                      kwargs={'task_id': self.ids['Ship'], 'depends_on_id': self.ids['Build']})
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(self.titles('?ready=true')), ['Build', 'Other', 'Ship'])
+    
+    def test_topological_sort(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            titles = self.titles('?sort_by=topological')
+        self.assertEqual(titles, ['Other', 'Design', 'Build', 'Ship'])
+        # the stored levels are the sort key - just the count and the page
+        graph_queries = [q for q in ctx.captured_queries
+                         if '"tasks_task"' in q['sql'] or '"tasks_taskdependency"' in q['sql']]
+        self.assertEqual(len(graph_queries), 2)
+    
+    def test_levels_follow_edge_changes(self):
+        def levels():
+            return dict(Task.objects.values_list('title', 'dependency_level'))
+        self.assertEqual(levels(), {'Other': 0, 'Design': 0, 'Build': 1, 'Ship': 2})
+        self.block('Design', 'Other')
+        self.assertEqual(levels(), {'Other': 0, 'Design': 1, 'Build': 2, 'Ship': 3})
+        self.client.delete(reverse('api_task_dependency_remove',
+                                   kwargs={'task_id': self.ids['Build'], 'depends_on_id': self.ids['Design']}))
+        self.assertEqual(levels(), {'Other': 0, 'Design': 1, 'Build': 0, 'Ship': 1})
+
+
+class ReminderTest(TestCase):
+    """Test the due date reminder scheduler"""
+    
+    class ListSink:
+        def __init__(self):
+            self.sent = []
+        
+        def deliver(self, reminder):
+            self.sent.append(reminder)
+    
+    def setUp(self):
+        from django.utils import timezone
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.now = timezone.now()
+        today = date.today()
+        self.soon = Task.objects.create(user=self.user, title='Soon', due_date=today + timedelta(days=1))
+        self.later = Task.objects.create(user=self.user, title='Later', due_date=today + timedelta(days=3))
+        Task.objects.create(user=self.user, title='Far', due_date=today + timedelta(days=30))
+    
+    def scheduler(self):
+        from .reminders import ReminderScheduler
+        return ReminderScheduler(self.ListSink())
+    
+    def test_sends_when_due_and_survives_restart(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.run_once(self.now), 1)
+        self.assertEqual([r['title'] for r in scheduler.sink.sent], ['Soon'])
+        self.assertEqual(len(scheduler.heap), 1)  # Far is past the horizon
+        self.assertEqual(self.scheduler().run_once(self.now), 0)  # restarted - already sent
+        self.assertEqual(scheduler.run_once(self.now + timedelta(days=2, hours=1)), 1)
+        self.assertEqual(scheduler.sink.sent[-1]['title'], 'Later')
+    
+    def test_picks_up_changes(self):
+        scheduler = self.scheduler()
+        scheduler.run_once(self.now)
+        # moved forward, completed, and a new task - all through plain UPDATE/INSERT paths
+        Task.objects.filter(id=self.later.id).update(due_date=date.today() + timedelta(days=5),
+                                                     updated_at=self.now)
+        Task.objects.create(user=self.user, title='New', due_date=date.today() + timedelta(days=2))
+        done = Task.objects.create(user=self.user, title='Done', due_date=date.today() + timedelta(days=2))
+        later = self.now + timedelta(days=1, hours=1)
+        scheduler.run_once(self.now + timedelta(minutes=1))
+        Task.objects.filter(id=done.id).update(status='completed')
+        self.assertEqual(scheduler.run_once(later), 1)
+        self.assertEqual(scheduler.sink.sent[-1]['title'], 'New')
+        scheduler.run_once(self.now + timedelta(days=4, hours=1))
+        self.assertEqual(scheduler.sink.sent[-1]['title'], 'Later')
+        self.assertEqual(len(scheduler.sink.sent), 3)
+
+
+class RequestProfilingTest(APITestCase):
+    """Test on-demand profiling of single requests"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(PROFILE_DIR=self.tmp.name, PROFILE_MAX_FILES=2)
+        self.settings_override.enable()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.staff_token = Token.objects.create(user=self.staff)
+        self.user_token = Token.objects.create(user=self.user)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+    
+    def get(self, url, token, **extra):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        return self.client.get(url, **extra)
+    
+    def test_staff_requests_are_profiled(self):
+        response = self.get(reverse('api_task_list'), self.staff_token, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        name = response['X-Profile-Id']
+        self.assertIn('api_task_list', name)
+        
+        listed = self.get(reverse('api_profile_list'), self.staff_token)
+        self.assertEqual([p['name'] for p in listed.data['profiles']], [name])
+        text = self.get(reverse('api_profile_download', kwargs={'name': name}) + '?as=text', self.staff_token)
+        self.assertIn(b'function calls', text.content)
+    
+    def test_downloads_are_refused_in_batches(self):
+        name = self.get(reverse('api_task_list'), self.staff_token, HTTP_X_PROFILE='1')['X-Profile-Id']
+        response = self.client.post(reverse('api_batch'), {'requests': [
+            {'method': 'GET', 'path': reverse('api_profile_download', kwargs={'name': name})},
+            {'method': 'GET', 'path': reverse('api_profile_list')},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['responses']], [400, 200])
+    
+    def test_others_are_not_profiled(self):
+        response = self.get(reverse('api_task_list'), self.user_token, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        response = self.get(reverse('api_profile_list'), self.user_token)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_store_is_bounded(self):
+        names = [self.get(reverse('api_task_stats') + '?_profile=1', self.staff_token)['X-Profile-Id']
+                 for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), names[1:])
+        response = self.get(reverse('api_profile_download', kwargs={'name': '..secret.prof'}), self.staff_token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MetricsTest(APITestCase):
+    """Test the multi-process /metrics endpoint"""
+    
+    def setUp(self):
+        import tempfile
+        from . import metrics
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS_DIR=self.tmp.name)
+        self.settings_override.enable()
+        metrics.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+    
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+    
+    def test_requests_latency_and_queries(self):
+        self.client.get(reverse('api_task_list'))
+        self.client.get(reverse('api_task_list'))
+        text = self.scrape()
+        self.assertIn('http_requests_total{method="GET",status="200",view="api_task_list"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="api_task_list",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{view="api_task_list"} 2', text)
+        self.assertIn('db_queries_total{view="api_task_list"}', text)
+        self.assertIn('auth_tokens_active 1', text)
+    
+    def test_other_processes_are_added_up(self):
+        from . import metrics
+        self.client.get(reverse('api_task_list'))
+        # what another worker wrote, then the same worker after gunicorn reaped it
+        other = {'counters': [['http_requests_total', {'method': 'GET', 'status': '200', 'view': 'api_task_list'}, 5]],
+                 'histograms': []}
+        with open(os.path.join(self.tmp.name, '999999.json'), 'w') as f:
+            json.dump(other, f)
+        self.assertIn('view="api_task_list"} 6', self.scrape())
+        metrics.merge_dead_process(999999)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), sorted(['.lock', 'dead.json', f'{os.getpid()}.json']))
+        self.assertIn('view="api_task_list"} 6', self.scrape())
+    
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_protected(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BrowserMiddlewareTest(APITestCase):
+    """Test that only pages get the session/CSRF/messages middleware"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+    
+    def test_api_skips_browser_middleware(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.client.cookies['sessionid'] = 'whatever'
+        response = self.client.get(reverse('api_task_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertNotIn('sessionid', response.cookies)
+    
+    def test_pages_keep_it(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('task_create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertIn('Cookie', response['Vary'])
+    
+    def test_pages_still_check_csrf(self):
+        from django.test import Client
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('task_create'), {'title': 'No token'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProjectTest(APITestCase):
+    """Test team projects shared with other users"""
+    
+    def setUp(self):
+        from .projects import clear_membership_cache
+        clear_membership_cache()  # memberships from earlier tests were rolled back
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.editor = User.objects.create_user(username='editor', password='testpass123')
+        self.reader = User.objects.create_user(username='reader', password='testpass123')
+        self.outsider = User.objects.create_user(username='outsider', password='testpass123')
+        self.login(self.owner)
+        self.project = self.client.post(reverse('api_project_list'), {'name': 'Website'}).data['id']
+        url = reverse('api_project_members', kwargs={'project_id': self.project})
+        self.assertEqual(self.client.post(url, {'username': 'editor', 'role': 'edit'}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'username': 'reader'}).status_code, 201)
+        due = date.today() + timedelta(days=1)
+        self.shared = Task.objects.create(user=self.owner, title='Shared', due_date=due, project_id=self.project)
+        self.private = Task.objects.create(user=self.owner, title='Private', due_date=due)
+        Task.objects.create(user=self.editor, title='Editor own', due_date=due)
+    
+    def login(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    
+    def titles(self, query=''):
+        response = self.client.get(reverse('api_task_list') + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(task['title'] for task in response.data['results'])
+    
+    def test_members_see_shared_tasks(self):
+        self.login(self.editor)
+        self.assertEqual(self.titles(), ['Editor own', 'Shared'])
+        self.assertEqual(self.titles(f'?project={self.project}'), ['Shared'])
+        self.login(self.outsider)
+        self.assertEqual(self.titles(), [])
+        response = self.client.get(reverse('api_task_detail', kwargs={'pk': self.shared.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_roles(self):
+        url = reverse('api_task_detail', kwargs={'pk': self.shared.id})
+        self.login(self.reader)
+        self.assertEqual(self.client.get(url).data['title'], 'Shared')
+        self.assertEqual(self.client.patch(url, {'status': 'completed'}).status_code, status.HTTP_404_NOT_FOUND)
+        
+        self.login(self.editor)
+        response = self.client.patch(url, {'status': 'completed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user']['username'], 'owner')
+        self.assertEqual(self.client.patch(url, {'project': None}, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+        private = reverse('api_task_detail', kwargs={'pk': self.private.id})
+        self.assertEqual(self.client.patch(private, {'title': 'Mine now'}).status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_membership_management(self):
+        members = reverse('api_project_members', kwargs={'project_id': self.project})
+        self.login(self.editor)
+        self.assertEqual([m['username'] for m in self.client.get(members).data['members']], ['editor', 'reader'])
+        self.assertEqual(self.client.post(members, {'username': 'outsider'}).status_code, status.HTTP_403_FORBIDDEN)
+        roles = {p['name']: p['role'] for p in self.client.get(reverse('api_project_list')).data}
+        self.assertEqual(roles, {'Website': 'edit'})
+        
+        # removed members lose access right away, their cached membership or not
+        self.assertEqual(self.titles(), ['Editor own', 'Shared'])
+        self.login(self.owner)
+        remove = reverse('api_project_member_remove', kwargs={'project_id': self.project, 'member_id': self.editor.id})
+        self.assertEqual(self.client.delete(remove).status_code, status.HTTP_200_OK)
+        self.login(self.editor)
+        self.assertEqual(self.titles(), ['Editor own'])
+        self.assertEqual(self.client.get(members).status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_shared_list_is_one_query(self):
+        due = date.today() + timedelta(days=1)
+        Task.objects.bulk_create([
+            Task(user=self.owner, title=f'Shared {i}', due_date=due, project_id=self.project) for i in range(30)
+        ])
+        self.login(self.reader)
+        self.titles()  # fills the membership cache
+        with self.assertNumQueries(3):  # token, count, page
+            response = self.client.get(reverse('api_task_list') + '?fields=id,title')
+        self.assertEqual(response.data['count'], 31)
+
+
+class RepresentationCacheTest(APITestCase):
+    """Test the cache of serialized tasks"""
+    
+    def setUp(self):
+        from .representations import cache
+        self.cache = cache
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.due = date.today() + timedelta(days=1)
+        self.category = Category.objects.create(user=self.user, name='Work')
+        self.task = Task.objects.create(user=self.user, title='Report', due_date=self.due, category=self.category)
+        self.url = reverse('api_task_detail', kwargs={'pk': self.task.id})
+    
+    def test_repeat_reads_are_served_from_the_cache(self):
+        Task.objects.create(user=self.user, title='Slides', due_date=self.due)
+        first = self.client.get(reverse('api_task_list')).data['results']
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        second = self.client.get(reverse('api_task_list')).data['results']
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(json.dumps(first), json.dumps(second))  # same fields in the same order
+        self.assertEqual(self.client.get(self.url).data, second[1])
+        # sparse reads don't use it
+        self.client.get(reverse('api_task_list') + '?fields=id,title,updated_at')
+        self.assertEqual(self.cache.stats()['hits'] + self.cache.stats()['misses'], 5)
+    
+    def test_cold_cache_list_loads_users_in_the_join(self):
+        for i in range(5):
+            Task.objects.create(user=self.user, title=f'Task {i}', due_date=self.due)
+        with self.assertNumQueries(4):  # token, count, page, tags
+            response = self.client.get(reverse('api_task_list'))
+        self.assertEqual(response.data['results'][0]['user']['username'], 'testuser')
+    
+    def test_changes_are_never_served_stale(self):
+        self.client.get(self.url)
+        self.client.patch(self.url, {'title': 'Final report', 'tags': ['work']}, format='json')
+        data = self.client.get(self.url).data
+        self.assertEqual((data['title'], data['tags']), ('Final report', ['work']))
+        
+        self.client.post(reverse('api_task_list'),
+                         {'title': 'Numbers', 'due_date': str(self.due), 'parent': self.task.id}, format='json')
+        self.assertEqual(self.client.get(self.url).data['subtask_count'], 1)
+        self.client.put(reverse('api_profile'), {'first_name': 'Sam'})
+        self.assertEqual(self.client.get(self.url).data['user']['first_name'], 'Sam')
+        self.client.delete(reverse('api_category_detail', kwargs={'pk': self.category.id}))
+        self.assertIsNone(self.client.get(self.url).data['category'])
+    
+    @override_settings(TASK_REPRESENTATION_CACHE_SIZE=2)
+    def test_least_recently_used_are_evicted(self):
+        from .serializers import TaskSerializer
+        tasks = [self.task] + [Task.objects.create(user=self.user, title=f'T{i}', due_date=self.due) for i in range(2)]
+        TaskSerializer(tasks[:2], many=True).data
+        TaskSerializer(tasks[0]).data  # tasks[1] is now the oldest
+        TaskSerializer(tasks[2]).data
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions'], stats['hits']), (2, 1, 1))
+        TaskSerializer(tasks[0]).data
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+
+class ManualOrderTest(APITestCase):
+    """Test dragging tasks into a manual order (sort_by=manual)"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        due = date.today() + timedelta(days=1)
+        self.category = Category.objects.create(user=self.user, name='Work')
+        # new tasks start at the top: C, B, A
+        self.tasks = {
+            title: Task.objects.create(user=self.user, title=title, due_date=due, category=self.category)
+            for title in 'ABC'
+        }
+        Task.objects.create(user=self.user, title='Elsewhere', due_date=due)
+    
+    def column(self):
+        response = self.client.get(reverse('api_task_list') + f'?sort_by=manual&category={self.category.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return ''.join(task['title'] for task in response.data['results'])
+    
+    def move(self, title, **body):
+        return self.client.patch(reverse('api_task_move', kwargs={'task_id': self.tasks[title].id}), body, format='json')
+    
+    def test_moves_write_only_the_moved_task(self):
+        from . import ranking
+        self.assertEqual(self.column(), 'CBA')
+        before = dict(Task.objects.values_list('title', 'rank'))
+        self.assertEqual(self.move('C', after=self.tasks['A'].id).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.column(), 'BAC')
+        self.move('A', before=self.tasks['B'].id)
+        self.assertEqual(self.column(), 'ABC')
+        self.move('C')
+        self.assertEqual(self.column(), 'CAB')
+        after = dict(Task.objects.values_list('title', 'rank'))
+        self.assertEqual(sorted(title for title in before if before[title] != after[title]), ['A', 'C'])
+        # dragging into the same gap over and over makes that rank longer,
+        # until the column gets respaced
+        for _ in range(150):
+            self.move('B', after=self.tasks['C'].id)
+            self.move('A', after=self.tasks['C'].id)
+        self.assertEqual(self.column(), 'CAB')
+        self.assertLessEqual(len(Task.objects.get(title='A').rank), ranking.MAX_RANK_LENGTH)
+    
+    def test_many_new_tasks_in_one_column(self):
+        from . import ranking
+        due = date.today() + timedelta(days=1)
+        for i in range(400):
+            Task.objects.create(user=self.user, title=f'New {i}', due_date=due, category=self.category)
+        ranks = list(Task.objects.filter(category=self.category).values_list('rank', flat=True))
+        self.assertLessEqual(max(map(len, ranks)), ranking.MAX_RANK_LENGTH)
+        self.assertEqual(len(set(ranks)), len(ranks))
+        self.assertEqual(self.column()[:7], 'New 399')  # still newest on top
+    
+    def test_changing_column_gives_a_fresh_rank(self):
+        for title in 'BC':
+            self.client.patch(reverse('api_task_toggle', kwargs={'task_id': self.tasks[title].id}))
+        self.client.patch(reverse('api_task_detail', kwargs={'pk': self.tasks['A'].id}),
+                          {'category': None}, format='json')
+        done = Task.objects.filter(status='completed').order_by('rank')
+        self.assertEqual([task.title for task in done], ['C', 'B'])  # the latest on top
+        self.assertEqual(len({task.rank for task in done}), 2)
+        self.assertEqual(Task.objects.filter(category__isnull=True).order_by('rank')[0].title, 'A')
+        
+        self.client.patch(reverse('api_bulk_update'), {'task_ids': [self.tasks['B'].id, self.tasks['C'].id],
+                                                       'status': 'pending'}, format='json')
+        self.assertEqual(self.column(), 'CB')
+        pending = Task.objects.filter(category=self.category).values_list('rank', flat=True)
+        self.assertEqual(len(set(pending)), 2)
+    
+    def test_rank_between(self):
+        from .ranking import rank_between, spaced_ranks
+        for low, high in [('', None), ('', '1'), ('4', '5'), ('4x', '5'), ('4z', '5'), ('i', 'i1'), ('y', None)]:
+            rank = rank_between(low, high)
+            self.assertTrue(low < rank and (high is None or rank < high), (low, high, rank))
+            self.assertFalse(rank.endswith('0'))
+        ranks = spaced_ranks(2000)
+        self.assertEqual(ranks, sorted(set(ranks)))
+    
+    def test_moves_stay_within_the_column(self):
+        other = Task.objects.get(title='Elsewhere')
+        self.assertEqual(self.move('A', after=other.id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.move('A', after=1, before=2).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.move('A', after='top').status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(
+            user=User.objects.create_user(username='other', password='testpass123')).key)
+        self.assertEqual(self.move('A').status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_unranked_tasks_get_ranks(self):
+        from django.core.management import call_command
+        due = date.today() + timedelta(days=1)
+        Task.objects.bulk_create([Task(user=self.user, title=f'Imported {i}', due_date=due, category=self.category)
+                                  for i in range(3)])
+        self.assertEqual(self.column()[:10], 'Imported 0')  # unranked first
+        self.move('A', before=Task.objects.get(title='Imported 1').id)
+        self.assertFalse(Task.objects.filter(rank='').exclude(title='Elsewhere').exists())
+        titles = self.column()
+        self.assertLess(titles.index('Imported 0'), titles.index('A'))
+        self.assertLess(titles.index('A'), titles.index('Imported 1'))
+        
+        Task.objects.filter(title='Elsewhere').update(rank='')
+        last = Task.objects.get(title='B')
+        Task.objects.filter(id=last.id).update(rank=last.rank + 'i' * 19)  # still last
+        call_command('rebalance_ranks', stdout=open(os.devnull, 'w'))
+        self.assertFalse(Task.objects.filter(rank='').exists())
+        self.assertLessEqual(len(Task.objects.get(title='B').rank), 2)
+        self.assertEqual(self.column(), titles)
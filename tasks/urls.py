@@ -11,4 +11,7 @@ urlpatterns = [
     path('tasks/create/', views.task_create, name='task_create'),
     path('tasks/<int:task_id>/edit/', views.task_update, name='task_update'),
     path('tasks/<int:task_id>/delete/', views.task_delete, name='task_delete'),
+    
+    # Prometheus scrape target (no trailing slash, that's what scrapers ask for)
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
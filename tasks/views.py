@@ -1,37 +1,62 @@
+from datetime import date
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
 from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from rest_framework.authtoken.models import Token
+from . import hierarchy, metrics as app_metrics, ranking, rollups
 from .models import Task
 from .forms import TaskForm
 
 # Basic CRUD views for Task Management
 # Using function-based views because they're easier to understand
 
+def user_tasks(request):
+    """Tasks of the logged in user, with the related rows the templates use"""
+    return Task.objects.for_user(request.user).select_related('user', 'category')
+
+@login_required
 def task_list(request):
-    """Display all tasks - READ operation"""
-    tasks = Task.objects.all()
+    """Display the user's tasks one page at a time - READ operation"""
+    tasks = user_tasks(request)
     # Simple filtering by status if requested
     status_filter = request.GET.get('status')
     if status_filter:
         tasks = tasks.filter(status=status_filter)
     
+    paginator = Paginator(tasks, settings.TASKS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    
     context = {
-        'tasks': tasks,
+        'tasks': page.object_list,
+        'page_obj': page,
         'current_filter': status_filter,
+        # rows are cached per task version, and overdue depends on the day
+        'today': date.today(),
     }
     return render(request, 'tasks/task_list.html', context)
 
+@login_required
 def task_detail(request, task_id):
     """Show single task details"""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_object_or_404(user_tasks(request), id=task_id)
     return render(request, 'tasks/task_detail.html', {'task': task})
 
+@login_required
 def task_create(request):
     """Create new task - CREATE operation"""
     if request.method == 'POST':
         form = TaskForm(request.POST)
         if form.is_valid():
-            task = form.save()
+            task = form.save(commit=False)
+            task.user = request.user
+            task.save()
+            rollups.record_created(task.user_id, task.created_at)
             messages.success(request, f'Task "{task.title}" created successfully!')
             return redirect('task_list')
         else:
@@ -44,14 +69,27 @@ def task_create(request):
         'title': 'Create New Task'
     })
 
+@login_required
 def task_update(request, task_id):
     """Update existing task - UPDATE operation"""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_object_or_404(user_tasks(request), id=task_id)
     
     if request.method == 'POST':
+        # validating the form already changes the instance
+        previous_status, previous_category = task.status, task.category_id
         form = TaskForm(request.POST, instance=task)
         if form.is_valid():
-            task = form.save()
+            task = form.save(commit=False)
+            # same bookkeeping as a status change through the API
+            if task.status != previous_status:
+                task.completed_at = timezone.now() if task.status == 'completed' else None
+            task.save()
+            rollups.record_status_change(task, previous_status)
+            if task.status != previous_status and task.parent_id:
+                # keep the parents' subtask progress right
+                hierarchy.status_changed(task._state.db, [task.id], task.status == 'completed')
+            if (task.status, task.category_id) != (previous_status, previous_category):
+                ranking.column_changed(task._state.db, [task])
             messages.success(request, f'Task "{task.title}" updated successfully!')
             return redirect('task_detail', task_id=task.id)
         else:
@@ -65,9 +103,10 @@ def task_update(request, task_id):
         'title': f'Edit Task: {task.title}'
     })
 
+@login_required
 def task_delete(request, task_id):
     """Delete task - DELETE operation"""
-    task = get_object_or_404(Task, id=task_id)
+    task = get_object_or_404(user_tasks(request), id=task_id)
     
     if request.method == 'POST':
         task_title = task.title
@@ -113,3 +152,13 @@ def home(request):
             'Completion Timestamps'
         ]
     })
+
+def metrics(request):
+    """Prometheus metrics of all worker processes - GET /metrics"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), expected):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    gauges = {'auth_tokens_active': Token.objects.count()}
+    body = app_metrics.render(app_metrics.collect(), gauges)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')